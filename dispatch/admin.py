@@ -1,16 +1,22 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Drone, DroneBatteryAudit, Medication
+from django.template.response import TemplateResponse
+from .models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from .profiling import recorded_profiles
 
 # Register your models here.
 
 @admin.register(Drone)
 class DroneAdmin(admin.ModelAdmin):
-    list_display = ('serial_number', 'model', 'weight_limit', 'battery_capacity', 'state')
+    list_display = ('serial_number', 'model', 'weight_limit', 'loaded_weight', 'battery_capacity', 'state')
+    # Kept in step with the drone's medications by the Medication signals
+    readonly_fields = ('loaded_weight',)
     
     
 @admin.register(Medication)
 class MedicationAdmin(admin.ModelAdmin):
     list_display = ('name', 'weight', 'code', 'image', 'drone')
+    list_select_related = ('drone',)
     list_filter = ('drone',)
     search_fields = ('name', 'code')
     
@@ -18,5 +24,25 @@ class MedicationAdmin(admin.ModelAdmin):
 @admin.register(DroneBatteryAudit)
 class DroneBatteryAuditAdmin(admin.ModelAdmin):
     list_display = ('drone', 'battery_level', 'timestamp')
+    list_select_related = ('drone',)
     list_filter = ('drone',)
-    search_fields = ('drone__serial_number',)
\ No newline at end of file
+    search_fields = ('drone__serial_number',)
+
+
+@admin.register(DroneBatteryRollup)
+class DroneBatteryRollupAdmin(admin.ModelAdmin):
+    list_display = ('drone', 'period', 'bucket_start', 'sample_count', 'min_level', 'max_level', 'last_level')
+    list_select_related = ('drone',)
+    list_filter = ('period', 'drone')
+    search_fields = ('drone__serial_number',)
+
+
+def query_profiles(request):
+    """The slowest requests captured by QueryProfilingMiddleware, served under /admin/ to staff."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Query profiles',
+        'enabled': 'dispatch.profiling.QueryProfilingMiddleware' in settings.MIDDLEWARE,
+        'profiles': recorded_profiles(),
+    }
+    return TemplateResponse(request, 'admin/query_profiles.html', context)
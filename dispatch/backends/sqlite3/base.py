@@ -0,0 +1,22 @@
+"""
+The SQLite backend tuned for concurrent writers, selected with DB_ENGINE=sqlite.
+
+Each connection switches the database to the WAL journal, so readers no longer block
+the writer or each other, and relaxes fsyncs to once per checkpoint. Writers still take
+turns: transactions begin IMMEDIATE, taking the write lock up front, so a second writer
+waits out the busy timeout (the ``timeout`` option) in the queue instead of failing with
+"database is locked" when its read turns into a write halfway through.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,926 @@
+"""
+Benchmark scenarios run by ``python manage.py benchmark <scenario>``.
+
+Each scenario seeds the data it needs, measures one code path and returns a dict of
+results. The management command runs scenarios inside a transaction that is rolled
+back, so nothing they seed is left behind in the database.
+"""
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from dispatch.caching import invalidate_drone_caches
+from dispatch.choices import MODEL_CHOICES, STATE_CHOICES
+from dispatch.fleet import clear_fleet_snapshot, get_fleet
+from dispatch.models import Drone
+
+SCENARIOS = {}
+
+
+def scenario(name, rollback=True):
+    """
+    Register ``func`` as the benchmark scenario called ``name``. Pass ``rollback=False``
+    for scenarios that need their seeded data committed, such as ones that query from
+    several threads; they must delete only what they seed themselves, and the benchmark
+    command runs them only with DEBUG on or ``--allow-writes``.
+    """
+    def register(func):
+        func.rollback = rollback
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def seed_drones(count, batch_size=5000, **fields):
+    """
+    Bulk create ``count`` benchmark drones and return them. Half are IDLE and the rest
+    cycle through the other states; batteries spread evenly over 5-100% and positions
+    over the Nairobi area. Pass field values to override these for every drone.
+    """
+    models = [choice for choice, _ in MODEL_CHOICES]
+    busy_states = [choice for choice, _ in STATE_CHOICES if choice != 'IDLE']
+    drones = []
+    for index in range(count):
+        values = {
+            'serial_number': f'BENCH-{index:07d}',
+            'model': models[index % len(models)],
+            'weight_limit': 100 + index * 13 % 401,
+            'battery_capacity': float(5 + index * 7 % 96),
+            'state': 'IDLE' if index % 2 == 0 else busy_states[index // 2 % len(busy_states)],
+            # Scattered over a 0.6 degree square around Nairobi
+            'latitude': -1.6 + index * 7919 % 10007 / 10007 * 0.6,
+            'longitude': 36.5 + index * 104729 % 10009 / 10009 * 0.6,
+        }
+        values.update(fields)
+        drones.append(Drone(**values))
+    drones = Drone.objects.bulk_create(drones, batch_size=batch_size)
+    invalidate_drone_caches()
+    return drones
+
+
+def check_unseeded(*prefixes):
+    """
+    Refuse to seed over drones left by an earlier committed run. Their serial numbers would
+    collide, and committed scenarios only delete the rows they created themselves.
+    """
+    for prefix in prefixes:
+        if Drone.objects.filter(serial_number__startswith=prefix).exists():
+            raise RuntimeError(f'Drones with {prefix} serial numbers are already in the database; remove them before this run')
+
+
+def delete_drones(drone_ids, batch_size=5000):
+    """Delete the drones a committed scenario created, and with them their medications, audits and rollups."""
+    drone_ids = list(drone_ids)
+    for start in range(0, len(drone_ids), batch_size):
+        Drone.objects.filter(pk__in=drone_ids[start:start + batch_size]).delete()
+    invalidate_drone_caches()
+
+
+def latency_summary(samples):
+    """Summarise per-request latencies in seconds as millisecond percentiles."""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))] * 1000
+
+    return {
+        'requests': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+def time_requests(client, url, requests, before=None):
+    """
+    GET ``url`` ``requests`` times and return the latency of each request in seconds.
+    ``before`` is called untimed ahead of every request.
+    """
+    samples = []
+    for index in range(requests):
+        if before is not None:
+            before(index)
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+    return samples
+
+
+@contextmanager
+def measure():
+    """Collect wall time and query count for the enclosed block into the yielded dict."""
+    result = {'queries': 0}
+
+    # Counted with an execute wrapper because the debug query log is capped at 9000 entries
+    def count_query(execute, sql, params, many, context):
+        result['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        started = time.perf_counter()
+        yield result
+        result['seconds'] = time.perf_counter() - started
+
+
+@contextmanager
+def quiet(logger_name):
+    """Silence ``logger_name`` so log output does not dominate the timing."""
+    logger = logging.getLogger(logger_name)
+    previous = logger.disabled
+    logger.disabled = True
+    try:
+        yield
+    finally:
+        logger.disabled = previous
+
+
+@scenario('battery-snapshot')
+def battery_snapshot(drones=10000, batch_size=None, **options):
+    """Time one perform_check_drone_battery run over a fleet of ``drones``."""
+    from dispatch.tasks import perform_check_drone_battery
+
+    seed_drones(drones)
+    with quiet('dispatch.tasks'), measure() as result:
+        created = perform_check_drone_battery(batch_size=batch_size)
+
+    result.update({
+        'drones': drones,
+        'audits_created': created,
+        'seconds_per_10k_drones': result['seconds'] / drones * 10000,
+    })
+    return result
+
+
+@scenario('battery-forecast')
+def battery_forecast(drones=10000, batch_size=5000, **options):
+    """
+    Time refresh_forecasts over ``drones`` drones, each with an hourly rollup for every
+    hour of history and two raw audits: once storing every rate, then again with none
+    changed. The NumPy fit is also timed on its own.
+    """
+    from django.conf import settings
+    from django.utils import timezone
+    from dispatch.forecast import battery_history, fit_discharge_rates, refresh_forecasts
+    from dispatch.models import DroneBatteryAudit, DroneBatteryRollup
+
+    now = timezone.now()
+    hours = settings.BATTERY_FORECAST_HISTORY_HOURS
+    fleet = seed_drones(drones, battery_capacity=100.0)
+    rollups, audits = [], []
+    for index, drone in enumerate(fleet):
+        rate = 2 + index % 19
+        for hour in range(hours, 0, -1):
+            level = max(100 - rate * (hours - hour), 0)
+            rollups.append(DroneBatteryRollup(
+                drone=drone, period='HOUR', bucket_start=now - timezone.timedelta(hours=hour), sample_count=1,
+                min_level=level, max_level=level, sum_level=level, last_level=level,
+                last_timestamp=now - timezone.timedelta(hours=hour),
+            ))
+        for minutes in (5, 0):
+            audits.append(DroneBatteryAudit(
+                drone=drone, battery_level=max(100 - rate * (hours - minutes / 60), 0), task_name='benchmark',
+                timestamp=now - timezone.timedelta(minutes=minutes), expires_at=now,
+            ))
+    DroneBatteryRollup.objects.bulk_create(rollups, batch_size=batch_size)
+    DroneBatteryAudit.objects.bulk_create(audits, batch_size=batch_size)
+
+    history_started = time.perf_counter()
+    history = battery_history(now - timezone.timedelta(hours=hours))
+    history_seconds = time.perf_counter() - history_started
+    fit_started = time.perf_counter()
+    fit_discharge_rates(*history)
+    fit_seconds = time.perf_counter() - fit_started
+
+    with measure() as first:
+        fitted, updated = refresh_forecasts(now)
+    with measure() as steady:
+        _, unchanged = refresh_forecasts(now)
+
+    return {
+        'drones': drones,
+        'samples': len(history[0]),
+        'history_seconds': history_seconds,
+        'fit_seconds': fit_seconds,
+        'fitted': fitted,
+        'refresh_seconds': first['seconds'],
+        'refresh_queries': first['queries'],
+        'rates_written': updated,
+        'steady_refresh_seconds': steady['seconds'],
+        'steady_rates_written': unchanged,
+    }
+
+
+@scenario('import-json')
+def import_json(drones=10000, batch_size=None, **options):
+    """Time importdatajson loading ``drones`` drones with one medication each from NDJSON exports."""
+    with tempfile.TemporaryDirectory() as input_dir:
+        with open(os.path.join(input_dir, 'drones.jsonl'), 'w') as file:
+            for index in range(drones):
+                file.write(json.dumps({'model': 'dispatch.drone', 'pk': index, 'fields': {
+                    'serial_number': f'BENCH-{index:07d}', 'model': 'LIGHTWEIGHT',
+                    'weight_limit': 500, 'battery_capacity': 80.0, 'state': 'LOADING',
+                }}) + '\n')
+        with open(os.path.join(input_dir, 'medications.jsonl'), 'w') as file:
+            for index in range(drones):
+                file.write(json.dumps({'model': 'dispatch.medication', 'pk': index, 'fields': {
+                    'name': f'Bench-{index}', 'weight': 10.0, 'code': f'BENCH{index:07d}',
+                    'image': 'photos/panadol.jpeg', 'drone': index,
+                }}) + '\n')
+
+        args = ['--input-dir', input_dir]
+        if batch_size:
+            args += ['--batch-size', str(batch_size)]
+        with measure() as result:
+            call_command('importdatajson', *args, stdout=io.StringIO())
+
+    result.update({
+        'rows': drones * 2,
+        'rows_per_second': drones * 2 / result['seconds'],
+    })
+    return result
+
+
+@scenario('available-drones')
+def available_drones(drones=100000, requests=20, **options):
+    """
+    Latency of the available-drones endpoint over ``drones`` drones: with the fleet
+    snapshot reloaded for every request, kept warm, and brought up to date after one
+    drone changed between requests.
+    """
+    seeded = seed_drones(drones)
+    client = Client()
+    url = reverse('available_drones_for_loading')
+    result = {'drones': drones}
+
+    cases = (
+        ('cold', lambda index: clear_fleet_snapshot()),
+        ('warm', None),
+        ('one_changed', lambda index: invalidate_drone_caches([seeded[index % len(seeded)].id])),
+    )
+    for label, before in cases:
+        client.get(url)
+        with measure() as run:
+            samples = time_requests(client, url, requests, before)
+        summary = latency_summary(samples)
+        summary['queries_per_request'] = run['queries'] / requests
+        result.update({f'{label}_{key}': value for key, value in summary.items()})
+    return result
+
+
+def naive_plan(medications, drones):
+    """Baseline for dispatch-plan: next-fit in arrival order over drones in id order."""
+    drones = sorted(drones)
+    loads = {}
+    unassigned = []
+    index = 0
+    free = drones[0][2] - drones[0][3] if drones else 0
+    for medication in medications:
+        while index < len(drones) and medication['weight'] > free:
+            index += 1
+            if index < len(drones):
+                free = drones[index][2] - drones[index][3]
+        if index == len(drones):
+            unassigned.append(medication)
+            continue
+        free -= medication['weight']
+        loads.setdefault(index, []).append(medication)
+    return loads, unassigned
+
+
+@scenario('dispatch-plan')
+def dispatch_plan(drones=10000, items=5000, **options):
+    """Compare first-fit-decreasing planning with naive next-fit for ``items`` medications."""
+    from dispatch.planner import loadable_drones, plan_dispatch
+
+    seed_drones(drones)
+    rng = random.Random(7)
+    medications = [{'code': f'BENCH{index}', 'weight': float(rng.randint(5, 200))} for index in range(items)]
+    fleet = loadable_drones()
+    result = {'drones': len(fleet), 'medications': items}
+
+    started = time.perf_counter()
+    assignments, unassigned = plan_dispatch(medications, fleet)
+    result['ffd_seconds'] = time.perf_counter() - started
+    used_capacity = sum(plan['planned_weight'] + plan['remaining_weight'] for plan in assignments)
+    result.update({
+        'ffd_drones_used': len(assignments),
+        'ffd_unassigned': len(unassigned),
+        'ffd_utilization': sum(plan['planned_weight'] for plan in assignments) / used_capacity if used_capacity else 0.0,
+    })
+
+    started = time.perf_counter()
+    loads, unassigned = naive_plan(medications, fleet)
+    result['naive_seconds'] = time.perf_counter() - started
+    sorted_fleet = sorted(fleet)
+    used_capacity = sum(sorted_fleet[index][2] - sorted_fleet[index][3] for index in loads)
+    result.update({
+        'naive_drones_used': len(loads),
+        'naive_unassigned': len(unassigned),
+        'naive_utilization': sum(m['weight'] for load in loads.values() for m in load) / used_capacity if used_capacity else 0.0,
+    })
+    return result
+
+
+@scenario('bulk-transition')
+def bulk_transition(drones=10000, **options):
+    """
+    Move ``drones`` DELIVERED drones to RETURNING one save() at a time, then return them
+    to IDLE carrying two medications each: half one transition_to() at a time and half
+    with one bulk transition.
+    """
+    from django.db.models import Sum
+    from dispatch.models import Medication
+
+    seeded = seed_drones(drones, state='DELIVERED', loaded_weight=10.0)
+    Medication.objects.bulk_create(
+        (Medication(name=f'Bench-{index}', weight=5.0, code=f'BENCH{index:07d}', image='photos/panadol.jpeg',
+                    drone=seeded[index // 2]) for index in range(drones * 2)),
+        batch_size=5000,
+    )
+    result = {'drones': drones}
+
+    with measure() as run:
+        for drone in Drone.objects.filter(state='DELIVERED'):
+            drone.state = 'RETURNING'
+            drone.save()
+    result.update({'per_drone_save_seconds': run['seconds'], 'per_drone_save_queries': run['queries']})
+
+    half = drones // 2
+    with measure() as run:
+        for drone in Drone.objects.filter(pk__in=[drone.pk for drone in seeded[:half]]):
+            drone.transition_to('IDLE')
+    result.update({'per_drone_idle_seconds': run['seconds'], 'per_drone_idle_queries': run['queries']})
+
+    with measure() as run:
+        moved = Drone.objects.filter(pk__in=[drone.pk for drone in seeded[half:]]).transition('RETURNING', 'IDLE')
+    result.update({
+        'bulk_seconds': run['seconds'], 'bulk_queries': run['queries'], 'bulk_transitioned': moved,
+        'medications_delivered': Medication.objects.filter(code__startswith='BENCH', delivered_at__isnull=False).count(),
+        'idle_loaded_weight': Drone.objects.filter(pk__in=[drone.pk for drone in seeded]).aggregate(total=Sum('loaded_weight'))['total'],
+    })
+    return result
+
+
+@scenario('telemetry')
+def telemetry(drones=10000, items=5000, requests=20, **options):
+    """Throughput of the telemetry endpoint: ``requests`` POSTs of ``items`` readings spread over ``drones`` drones."""
+    from dispatch.telemetry import serial_ids
+
+    seed_drones(drones)
+    serial_ids.clear()
+    rng = random.Random(7)
+    client = Client()
+    url = reverse('drone_telemetry')
+    now = time.time()
+
+    bodies = []
+    for request in range(requests):
+        bodies.append(json.dumps([{
+            'serial_number': f'BENCH-{rng.randrange(drones):07d}',
+            'battery': round(rng.uniform(0, 100), 1),
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now - rng.randrange(60))) + 'Z',
+        } for _ in range(items)]))
+
+    samples = []
+    with quiet('django.request'), measure() as result:
+        for body in bodies:
+            started = time.perf_counter()
+            response = client.post(url, body, content_type='application/json')
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+
+    result.update({f'request_{key}': value for key, value in latency_summary(samples).items()})
+    result.update({
+        'readings': items * requests,
+        'readings_per_second': items * requests / result['seconds'],
+        'queries_per_request': result['queries'] / requests,
+    })
+    return result
+
+
+@scenario('async-reads')
+def async_reads(drones=1000, requests=2000, concurrency=50, **options):
+    """
+    Requests/sec and latency of the battery and medication reads: the DRF views on the
+    WSGI handler, one request at a time as a sync worker thread serves them, against the
+    async views on the ASGI handler with ``concurrency`` requests in flight.
+    """
+    import asyncio
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+    from dispatch.models import Medication
+
+    seeded = seed_drones(drones, state='LOADING')
+    Medication.objects.bulk_create(
+        Medication(name=f'Bench-{index}', weight=5.0, code=f'BENCH{index:07d}', image='photos/panadol.jpeg', drone=drone)
+        for index, drone in enumerate(seeded * 3)
+    )
+    rng = random.Random(7)
+    paths = []
+    for index in range(requests):
+        drone_id = rng.choice(seeded).id
+        paths.append((('check_drone_battery', 'async_check_drone_battery'), ('loaded_medications', 'async_loaded_medications'))[index % 2] + (drone_id,))
+    result = {'drones': drones, 'concurrency': concurrency}
+
+    client = Client()
+    samples = []
+    started = time.perf_counter()
+    for sync_name, _, drone_id in paths:
+        request_started = time.perf_counter()
+        client.get(reverse(sync_name, kwargs={'id': drone_id}))
+        samples.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    summary = latency_summary(samples)
+    result.update({'wsgi_requests_per_second': requests / elapsed, 'wsgi_p50_ms': summary['p50_ms'], 'wsgi_p99_ms': summary['p99_ms']})
+
+    async def run_async():
+        async_client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def fetch(name, drone_id):
+            async with semaphore:
+                request_started = time.perf_counter()
+                await async_client.get(reverse(name, kwargs={'id': drone_id}))
+                samples.append(time.perf_counter() - request_started)
+
+        await asyncio.gather(*(fetch(async_name, drone_id) for _, async_name, drone_id in paths))
+        return samples
+
+    started = time.perf_counter()
+    samples = async_to_sync(run_async)()
+    elapsed = time.perf_counter() - started
+    summary = latency_summary(samples)
+    result.update({'asgi_requests_per_second': requests / elapsed, 'asgi_p50_ms': summary['p50_ms'], 'asgi_p99_ms': summary['p99_ms']})
+    return result
+
+
+@scenario('medication-images')
+def medication_images(drones=10000, items=5000, **options):
+    """
+    Time process_medication_images over ``items`` uploaded images drawn from 20 distinct
+    pictures, half of them larger than MEDICATION_IMAGE_MAX_DIMENSION, and compare the
+    bytes stored before and after deduplication.
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.test import override_settings
+    from PIL import Image, ImageDraw
+    from dispatch.images import process_medication_images
+    from dispatch.models import Medication
+
+    pictures = []
+    for index in range(20):
+        size = (3000, 2000) if index % 2 else (1200, 800)
+        image = Image.new('RGB', size, (index * 12, 80, 160))
+        ImageDraw.Draw(image).ellipse((size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2), fill=(255, index * 12, 0))
+        file = io.BytesIO()
+        image.save(file, 'JPEG', quality=90)
+        pictures.append(file.getvalue())
+
+    drone = seed_drones(1)[0]
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        medications = []
+        for index in range(items):
+            name = default_storage.save(f'photos/upload_{index}.jpg', ContentFile(pictures[index % len(pictures)]))
+            medications.append(Medication(name=f'Bench-{index}', weight=0.01, code=f'BENCH{index:07d}', image=name, drone=drone))
+        Medication.objects.bulk_create(medications)
+        bytes_before = directory_size(media_root)
+
+        with quiet('dispatch.images'), measure() as result:
+            processed = process_medication_images(remove_replaced=True)
+        bytes_after = directory_size(media_root)
+
+    result.update({
+        'medications': processed,
+        'medications_per_second': processed / result['seconds'],
+        'stored_mb_before': bytes_before / 2 ** 20,
+        'stored_mb_after': bytes_after / 2 ** 20,
+    })
+    return result
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+@scenario('medication-validation')
+def medication_validation(items=5000, **options):
+    """
+    Items/sec validating the name and code of ``items`` medications: the old per-call
+    re.match with string patterns, validate_medications() over the batch, and DRF's
+    per-item BulkMedicationItemSerializer.
+    """
+    import re
+    from dispatch.serializers import BulkMedicationItemSerializer
+    from dispatch.validators import validate_medications
+
+    batch = [
+        {'name': f'Bench-{index}', 'weight': 1.0, 'code': f'BENCH_{index}', 'image': 'photos/panadol.jpeg'}
+        for index in range(items)
+    ]
+    # One item in a hundred breaks a rule, as in a real payload with typos
+    for item in batch[::100]:
+        item['name'] += ' x'
+
+    def uncompiled(items):
+        errors = []
+        for item in items:
+            errors.append(re.match(r'^[A-Za-z0-9_-]+$', item['name']) is None or re.match(r'^[A-Z0-9_]+$', item['code']) is None)
+        return errors
+
+    result = {'items': items}
+    for label, validate in (
+        ('re_match', uncompiled),
+        ('batch', validate_medications),
+        ('serializer', lambda items: BulkMedicationItemSerializer(data=items, many=True).is_valid()),
+    ):
+        started = time.perf_counter()
+        validate(batch)
+        result[f'{label}_items_per_second'] = items / (time.perf_counter() - started)
+    return result
+
+
+def api_requests(drones, medications, pictures):
+    """
+    Request builders for every route in dispatch/urls.py, keyed by URL name. Each takes the
+    request index and returns ``(method, path, data)``; writes use fresh codes, serial
+    numbers and drones so every request does the full amount of work.
+    """
+    from urllib.parse import urlencode
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    rng = random.Random(11)
+    idle = [drone for drone in drones if drone.state == 'IDLE' and drone.battery_capacity >= 25]
+    # Separate drones for each state-changing route, so one route's writes never make another's fail
+    third = len(idle) // 3
+    loadable, transition_pool, bulk_transition_pool = idle[:third], idle[third:2 * third], idle[2 * third:]
+    loaded_drone_ids = sorted({medication.drone_id for medication in medications}) or [drones[0].id]
+
+    def any_drone():
+        return rng.choice(drones).id
+
+    def path(name, **kwargs):
+        return reverse(name, kwargs=kwargs or None)
+
+    def pickup_point():
+        return {'latitude': rng.uniform(-1.6, -1.0), 'longitude': rng.uniform(36.5, 37.1), 'weight': rng.choice((0, 50, 150))}
+
+    return {
+        'register_drone': lambda index: ('post', path('register_drone'), {
+            'serial_number': f'API-{index:07d}', 'model': 'LIGHTWEIGHT', 'weight_limit': 200, 'battery_capacity': 90.0, 'state': 'IDLE'}),
+        'load_medication': lambda index: ('post', path('load_medication', id=loadable[index % len(loadable)].id), {
+            'name': f'Api-{index}', 'weight': 0.01, 'code': f'API_LOAD_{index}',
+            'image': SimpleUploadedFile(f'api_{index}.jpg', pictures, content_type='image/jpeg')}),
+        'bulk_load_medication': lambda index: ('post', path('bulk_load_medication', id=loadable[-1 - index % len(loadable)].id), {
+            'medications': [
+                {'name': f'Api-{index}-{item}', 'weight': 0.01, 'code': f'API_BULK_{index}_{item}', 'image': 'photos/panadol.jpeg'}
+                for item in range(10)
+            ]}),
+        'loaded_medications': lambda index: ('get', path('loaded_medications', id=rng.choice(loaded_drone_ids)), None),
+        'async_loaded_medications': lambda index: ('get', path('async_loaded_medications', id=rng.choice(loaded_drone_ids)), None),
+        'available_drones_for_loading': lambda index: ('get', path('available_drones_for_loading'), None),
+        'nearest_drones': lambda index: ('get', path('nearest_drones') + '?' + urlencode(pickup_point()), None),
+        'nearest_drones_batch': lambda index: ('post', path('nearest_drones_batch'), {
+            'points': [pickup_point() for _ in range(100)]}),
+        'dispatch_plan': lambda index: ('post', path('dispatch_plan'), {
+            'medications': [{'code': f'PLAN_{item}', 'weight': 5 + item} for item in range(20)]}),
+        'drone_transition': lambda index: ('post', path('drone_transition', id=transition_pool[index % len(transition_pool)].id), {
+            'state': 'LOADING'}),
+        'bulk_drone_transition': lambda index: ('post', path('bulk_drone_transition'), {
+            'drones': [drone.id for drone in bulk_transition_pool[index * 100 % len(bulk_transition_pool):][:100]],
+            'from_state': 'IDLE', 'to_state': 'LOADING'}),
+        'check_drone_battery': lambda index: ('get', path('check_drone_battery', id=any_drone()), None),
+        'async_check_drone_battery': lambda index: ('get', path('async_check_drone_battery', id=any_drone()), None),
+        'drone_battery_history': lambda index: ('get', path('drone_battery_history', id=rng.choice(drones[:100]).id), None),
+        'drone_telemetry': lambda index: ('post', path('drone_telemetry'), [
+            # Kept above 25% so loadable drones stay loadable
+            {'serial_number': rng.choice(drones).serial_number, 'battery': rng.uniform(30, 100)} for _ in range(100)]),
+        'drone-battery-audit-list': lambda index: ('get', path('drone-battery-audit-list'), None),
+        'task_metrics': lambda index: ('get', path('task_metrics'), None),
+        'fleet_events': lambda index: ('stream', path('fleet_events'), None),
+    }
+
+
+@scenario('api', rollback=False)
+def api(drones=10000, items=5000, requests=20, concurrency=50, **options):
+    """
+    Drive every route in dispatch/urls.py with ``requests`` requests from ``concurrency``
+    threads over a fleet of ``drones`` drones carrying ``items`` medications, and report
+    requests/sec, p50/p95/p99 latency and queries per request for each route. Each thread
+    has its own client and database connection, as under a threaded server, so the seeded
+    data is committed and deleted afterwards. fleet_events is timed to its first frame.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest import mock
+    from asgiref.sync import async_to_sync
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.db import connections
+    from django.test import AsyncClient, override_settings
+    from django.utils import timezone
+    from PIL import Image
+    from dispatch import urls
+    from dispatch.models import DroneBatteryAudit, DroneBatteryRollup, Medication
+
+    check_unseeded('BENCH-', 'API-')
+    # Seeded in one transaction, so a failed seed leaves nothing behind
+    with transaction.atomic():
+        seeded = seed_drones(drones)
+    # Only what this run created is deleted afterwards: the seeded drones and the registered ones
+    created_ids = [drone.id for drone in seeded]
+    try:
+        loaded = [drone for drone in seeded if drone.state == 'LOADING'] or seeded
+        medications = Medication.objects.bulk_create(
+            (Medication(name=f'Bench-{index}', weight=0.01, code=f'BENCH{index:07d}', image='photos/panadol.jpeg',
+                        drone=loaded[index % len(loaded)]) for index in range(items)),
+            batch_size=5000,
+        )
+        now = timezone.now()
+        DroneBatteryAudit.objects.bulk_create(
+            (DroneBatteryAudit(drone=seeded[index % len(seeded)], battery_level=50.0, task_name='bench', expires_at=now)
+             for index in range(items)),
+            batch_size=5000,
+        )
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        DroneBatteryRollup.objects.bulk_create(
+            DroneBatteryRollup(drone=drone, period='HOUR', bucket_start=hour - timezone.timedelta(hours=offset), sample_count=4,
+                               min_level=40.0, max_level=60.0, sum_level=200.0, last_level=50.0, last_timestamp=hour)
+            for drone in seeded[:100] for offset in range(24)
+        )
+        picture = io.BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(picture, 'JPEG')
+
+        builders = api_requests(seeded, medications, picture.getvalue())
+        missing = {pattern.name for pattern in urls.urlpatterns} - set(builders)
+        if missing:
+            raise RuntimeError(f'No benchmark requests for routes: {", ".join(sorted(missing))}')
+
+        async def first_frame(path):
+            response = await AsyncClient().get(path)
+            stream = aiter(response.streaming_content)
+            await anext(stream)
+            await stream.aclose()
+            return response
+
+        def send(client, method, path, data):
+            if method == 'stream':
+                return async_to_sync(first_frame)(path)
+            if method == 'get':
+                return client.get(path)
+            if isinstance(data, dict) and any(hasattr(value, 'read') for value in data.values()):
+                return client.post(path, data)
+            return client.post(path, json.dumps(data), content_type='application/json')
+
+        def drive(name, thread, counts):
+            client = Client()
+            samples, errors = [], []
+
+            def count_query(execute, sql, params, many, context):
+                counts[thread] += 1
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_query):
+                    for index in range(thread, requests, concurrency):
+                        method, path, data = builders[name](index)
+                        started = time.perf_counter()
+                        response = send(client, method, path, data)
+                        samples.append(time.perf_counter() - started)
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+                        elif name == 'register_drone':
+                            created_ids.append(response.data['id'])
+            finally:
+                connections.close_all()
+            return samples, errors
+
+        result = {'database': connection.vendor, 'drones': drones, 'medications': items, 'concurrency': concurrency}
+        # Measure the database, not the Celery broker that committed writes queue tasks on
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('dispatch.views.schedule_image_processing'), \
+                mock.patch('dispatch.telemetry.schedule_delete_expired_audit_logs'), \
+                mock.patch('dispatch.signals.schedule_delete_expired_audit_logs'), quiet('django.request'):
+            # Bulk loads may only reference images already in storage
+            default_storage.save('photos/panadol.jpeg', ContentFile(picture.getvalue()))
+            for name in sorted(builders):
+                counts = [0] * concurrency
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    outcomes = list(executor.map(lambda thread: drive(name, thread, counts), range(concurrency)))
+                elapsed = time.perf_counter() - started
+                summary = latency_summary([sample for samples, _ in outcomes for sample in samples])
+                key = name.replace('-', '_')
+                result.update({
+                    f'{key}_requests_per_second': requests / elapsed,
+                    f'{key}_p50_ms': summary['p50_ms'],
+                    f'{key}_p95_ms': summary['p95_ms'],
+                    f'{key}_p99_ms': summary['p99_ms'],
+                    f'{key}_queries_per_request': sum(counts) / requests,
+                    f'{key}_errors': sum(len(errors) for _, errors in outcomes),
+                })
+    finally:
+        delete_drones(created_ids)
+    return result
+
+
+@scenario('nearest-drones')
+def nearest_drones(drones=100000, items=5000, requests=200, **options):
+    """
+    Latency of the nearest-available-drone search over ``drones`` drones: building the
+    grid index for a new fleet snapshot, single pickup points through the locator and
+    through the endpoint, and ``items`` points answered as one batch.
+    """
+    import numpy as np
+    from dispatch.locator import get_locator
+
+    seed_drones(drones)
+    fleet = get_fleet()
+    rng = random.Random(5)
+    points = [(rng.uniform(-1.6, -1.0), rng.uniform(36.5, 37.1), rng.choice((0, 50, 150))) for _ in range(max(requests, items))]
+    result = {'drones': drones}
+
+    started = time.perf_counter()
+    locator = get_locator(fleet)
+    result['index_build_ms'] = (time.perf_counter() - started) * 1000
+    result['indexed_drones'] = len(locator)
+    result['cell_degrees'] = locator.cell_degrees
+
+    samples = []
+    for latitude, longitude, weight in points[:requests]:
+        started = time.perf_counter()
+        locator.nearest([latitude], [longitude], [weight], 5)
+        samples.append(time.perf_counter() - started)
+    summary = latency_summary(samples)
+    result.update({f'query_{key}': summary[key] for key in ('p50_ms', 'p95_ms', 'p99_ms')})
+
+    client = Client()
+    url = reverse('nearest_drones')
+    samples = []
+    for latitude, longitude, weight in points[:requests]:
+        started = time.perf_counter()
+        client.get(url, {'latitude': latitude, 'longitude': longitude, 'weight': weight})
+        samples.append(time.perf_counter() - started)
+    summary = latency_summary(samples)
+    result.update({f'endpoint_{key}': summary[key] for key in ('p50_ms', 'p99_ms')})
+
+    batch = np.array(points[:items], dtype=float).T
+    started = time.perf_counter()
+    locator.nearest(batch[0], batch[1], batch[2], 5)
+    elapsed = time.perf_counter() - started
+    result['batch_points'] = items
+    result['batch_ms'] = elapsed * 1000
+    result['batch_points_per_second'] = items / elapsed
+
+    # Checking every drone for every point, as a reference for the grid
+    started = time.perf_counter()
+    for latitude, longitude, weight in points[:requests]:
+        locator.nearest_exhaustive(*np.radians([latitude, longitude]), np.cos(np.radians(latitude)), weight, 5)
+    result['exhaustive_query_mean_ms'] = (time.perf_counter() - started) / requests * 1000
+    return result
+
+
+@scenario('concurrent-loads', rollback=False)
+def concurrent_loads(drones=100, requests=20, concurrency=16, **options):
+    """
+    Throughput of medication loads and loaded-medication reads sent from ``concurrency``
+    threads at once, half writing and half reading, each with its own database
+    connection as under a threaded WSGI server. The seeded fleet is committed, so the
+    writers really contend for the database, and deleted afterwards.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest import mock
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.db import connections
+    from django.test import override_settings
+    from PIL import Image
+
+    picture = io.BytesIO()
+    Image.new('RGB', (64, 64), 'red').save(picture, 'JPEG')
+    check_unseeded('BENCH-')
+    with transaction.atomic():
+        seeded = seed_drones(drones, state='IDLE', battery_capacity=90.0, weight_limit=500)
+
+    def worker(thread):
+        client = Client()
+        rng = random.Random(thread)
+        writes = thread % 2 == 0
+        samples, errors = [], []
+        try:
+            for index in range(requests):
+                drone_id = rng.choice(seeded).id
+                started = time.perf_counter()
+                if writes:
+                    response = client.post(reverse('load_medication', kwargs={'id': drone_id}), {
+                        'name': f'Bench-{thread}-{index}',
+                        'weight': 0.01,
+                        'code': f'BENCH_{thread}_{index}',
+                        'image': SimpleUploadedFile(f'bench_{thread}_{index}.jpg', picture.getvalue(), content_type='image/jpeg'),
+                    })
+                else:
+                    response = client.get(reverse('loaded_medications', kwargs={'id': drone_id}))
+                samples.append(time.perf_counter() - started)
+                if response.status_code >= 500 or (writes and response.status_code != 200):
+                    errors.append(response.status_code)
+        finally:
+            connections.close_all()
+        return writes, samples, errors
+
+    settings_dict = connection.settings_dict
+    result = {
+        'database': connection.vendor,
+        'engine': settings_dict['ENGINE'],
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+        'drones': drones,
+        'threads': concurrency,
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            result['journal_mode'] = cursor.fetchone()[0]
+    try:
+        # Measure the database, not the Celery broker that committed loads queue image processing on
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('dispatch.views.schedule_image_processing'), quiet('django.request'):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(worker, range(concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        # Loaded medications go with their drones
+        delete_drones(drone.id for drone in seeded)
+
+    for label, writes in (('write', True), ('read', False)):
+        samples = [sample for is_write, thread_samples, _ in outcomes if is_write == writes for sample in thread_samples]
+        errors = [error for is_write, _, thread_errors in outcomes if is_write == writes for error in thread_errors]
+        summary = latency_summary(samples)
+        result.update({
+            f'{label}s_per_second': len(samples) / elapsed,
+            f'{label}_p50_ms': summary['p50_ms'],
+            f'{label}_p99_ms': summary['p99_ms'],
+            f'{label}_errors': len(errors),
+        })
+    return result
+
+
+@scenario('query-profiling')
+def query_profiling(drones=10000, requests=200, **options):
+    """
+    Latency of a cheap and a query-heavy read without QueryProfilingMiddleware, with it
+    at the default sample rate, and with every request profiled.
+    """
+    from django.conf import settings
+    from django.test import override_settings
+    from dispatch.models import Medication
+    from dispatch.profiling import clear_profiles
+
+    seeded = seed_drones(drones, state='LOADING')
+    Medication.objects.bulk_create(
+        Medication(name=f'Bench-{index}', weight=5.0, code=f'BENCH{index:07d}', image='photos/panadol.jpeg', drone=seeded[0])
+        for index in range(50)
+    )
+    urls = {
+        'medications': reverse('loaded_medications', kwargs={'id': seeded[0].id}),
+        'history': reverse('drone_battery_history', kwargs={'id': seeded[0].id}),
+    }
+    profiled = ['dispatch.profiling.QueryProfilingMiddleware', *settings.MIDDLEWARE]
+    cases = (
+        ('off', settings.MIDDLEWARE, 0),
+        ('sampled', profiled, settings.QUERY_PROFILING_SAMPLE_RATE),
+        ('all', profiled, 1),
+    )
+    result = {'drones': drones, 'sample_rate': settings.QUERY_PROFILING_SAMPLE_RATE}
+    with quiet('dispatch.profiling'):
+        # Each client builds its middleware chain on its first request
+        clients = {}
+        for label, middleware, sample_rate in cases:
+            with override_settings(MIDDLEWARE=middleware, QUERY_PROFILING_SAMPLE_RATE=sample_rate):
+                clients[label] = Client()
+                for url in urls.values():
+                    time_requests(clients[label], url, 20)
+        # Interleave the cases in rounds so drift over the run affects them equally
+        samples = {(name, label): [] for name in urls for label in clients}
+        for _ in range(0, requests, 20):
+            for name, url in urls.items():
+                for label, client in clients.items():
+                    samples[name, label] += time_requests(client, url, 20)
+        for (name, label), latencies in samples.items():
+            summary = latency_summary(latencies)
+            result.update({f'{name}_{label}_{key}': summary[key] for key in ('mean_ms', 'p50_ms', 'p99_ms')})
+        clear_profiles()
+    for name in urls:
+        for label in ('sampled', 'all'):
+            result[f'{name}_{label}_overhead_percent'] = (result[f'{name}_{label}_p50_ms'] / result[f'{name}_off_p50_ms'] - 1) * 100
+    return result
@@ -0,0 +1,31 @@
+"""
+Invalidation for hot drone reads, which are served from the per-process fleet snapshot
+in dispatch.fleet.
+
+Drone saves and deletes invalidate through signals; queryset ``update()`` and
+``bulk_create()`` writers call drone_rows_changed() or invalidate_drone_caches()
+themselves.
+"""
+from django.db import transaction
+from dispatch.fleet import bump_fleet_version, get_fleet
+from dispatch.serializers import AvailableDroneSerializer
+
+
+def get_available_drones(fleet=None):
+    """Return the drones available for loading as serialized dicts, ordered by id."""
+    # Use greater or equal to include drones with 25% battery or more
+    return (fleet or get_fleet()).available(AvailableDroneSerializer.Meta.fields)
+
+
+def invalidate_drone_caches(drone_ids=None):
+    """Drop every cached answer derived from drone rows; ``drone_ids`` limits the reload to those drones."""
+    bump_fleet_version(drone_ids)
+
+
+def drone_rows_changed(drone_ids=None):
+    """
+    Invalidate for reads on this connection now, and for every other process once the
+    change commits and becomes visible to them.
+    """
+    invalidate_drone_caches(drone_ids)
+    transaction.on_commit(lambda: invalidate_drone_caches(drone_ids))
@@ -12,4 +12,23 @@ STATE_CHOICES = (
     ("DELIVERING", 'Delivering'),
     ("DELIVERED", 'Delivered'),
     ("RETURNING", 'Returning'), 
-)
\ No newline at end of file
+)
+
+ROLLUP_PERIOD_CHOICES = (
+    ("HOUR", 'Hour'),
+    ("DAY", 'Day'),
+)
+
+# States in which a drone accepts more medications
+LOADABLE_STATES = ("IDLE", "LOADING")
+
+# Legal state changes: each state maps to the states a drone may move to from it.
+# IDLE can jump straight to LOADED when a single load fills the drone.
+STATE_TRANSITIONS = {
+    "IDLE": ("LOADING", "LOADED"),
+    "LOADING": ("LOADED", "DELIVERING"),
+    "LOADED": ("DELIVERING",),
+    "DELIVERING": ("DELIVERED",),
+    "DELIVERED": ("RETURNING",),
+    "RETURNING": ("IDLE",),
+}
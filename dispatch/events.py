@@ -0,0 +1,189 @@
+"""
+Push channel for fleet changes, served to dispatch consoles as server-sent events.
+
+publish() encodes each event once as an SSE frame. With REDIS_URL set the frame goes
+out on a Redis pub/sub channel, so writes in any web or Celery process reach every
+ASGI process; each ASGI process runs one listener that hands frames to its local
+broker. Without Redis the local broker is used directly, which only reaches
+subscribers in the publishing process. Either way fan-out is a queue put per
+subscriber: no per-client encoding and no database access.
+"""
+import asyncio
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'dispatch:fleet-events'
+
+# Frames buffered per subscriber before it is told to resync and disconnected
+QUEUE_SIZE = 1000
+
+# Seconds between keepalive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+
+RESYNC_FRAME = b'event: resync\ndata: {}\n\n'
+
+# Drone fields carried by "drone" events
+DRONE_EVENT_FIELDS = ('id', 'serial_number', 'state', 'battery_capacity', 'loaded_weight', 'weight_limit')
+
+
+def encode_event(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode()
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, frame):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A consumer this far behind has lost events anyway; have it start over
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+
+
+class LocalBroker:
+    """
+    In-process fan-out to subscriptions created on asyncio event loops. deliver() may be
+    called from any thread; frames are handed to each loop once, not once per subscriber.
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """Create a subscription on the running event loop."""
+        subscription = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def deliver(self, frame):
+        with self.lock:
+            by_loop = {}
+            for subscription in self.subscriptions:
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        for loop, subscriptions in by_loop.items():
+            if loop is running_loop:
+                self.put_all(subscriptions, frame)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(self.put_all, subscriptions, frame)
+
+    @staticmethod
+    def put_all(subscriptions, frame):
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+
+class RedisRelay:
+    """Publishes frames to Redis and relays the channel into the local broker of this process."""
+
+    def __init__(self, url, broker):
+        self.url = url
+        self.broker = broker
+        self.client = None
+        self.listeners = {}
+
+    def publish(self, frame):
+        import redis
+
+        if self.client is None:
+            self.client = redis.Redis.from_url(self.url)
+        self.client.publish(CHANNEL, frame)
+
+    def ensure_listener(self):
+        """Start the channel listener for the running event loop unless it is already running."""
+        loop = asyncio.get_running_loop()
+        task = self.listeners.get(loop)
+        if task is None or task.done():
+            self.listeners[loop] = loop.create_task(self.listen())
+
+    async def listen(self):
+        import redis
+        import redis.asyncio as aioredis
+
+        while True:
+            try:
+                client = aioredis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.broker.deliver(message['data'])
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f'Fleet event listener lost Redis: {e}; reconnecting')
+                await asyncio.sleep(1)
+
+
+broker = LocalBroker()
+relay = RedisRelay(settings.REDIS_URL, broker) if settings.REDIS_URL else None
+
+
+def publish(event_type, data):
+    """Send one event to every subscriber. Call it once the change is committed."""
+    frame = encode_event(event_type, data)
+    if relay is None:
+        broker.deliver(frame)
+        return
+    try:
+        relay.publish(frame)
+    except Exception as e:
+        # A push channel outage must not fail the write that triggered it
+        logger.warning(f'Could not publish fleet event to Redis: {e}')
+
+
+def drone_event(drone):
+    """The "drone" event payload for ``drone``, skipping deferred fields so building it never queries."""
+    return {field: getattr(drone, field) for field in DRONE_EVENT_FIELDS if field in drone.__dict__}
+
+
+def publish_drone(drone):
+    publish('drone', drone_event(drone))
+
+
+def publish_battery_levels(levels):
+    """Publish ``{drone_id: battery_level}`` as one "battery" event."""
+    publish('battery', {'levels': [{'id': drone_id, 'battery_level': level} for drone_id, level in levels.items()]})
+
+
+def publish_transition(drone_ids, from_state, to_state):
+    """Publish a bulk transition: every listed drone that was in ``from_state`` is now in ``to_state``."""
+    publish('transition', {'drones': sorted(drone_ids), 'from_state': from_state, 'to_state': to_state})
+
+
+async def stream_events(subscription):
+    """Yield SSE frames for ``subscription`` until the client goes away or falls too far behind."""
+    try:
+        yield b': connected\n\n'
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            yield frame
+            if frame is RESYNC_FRAME:
+                return
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,286 @@
+"""
+Per-process snapshot of every drone's hot columns for read-heavy endpoints.
+
+Battery, availability and planning reads are answered from memory: get_fleet() costs
+one shared-cache GET to compare the snapshot against the fleet version counter, and no
+query while nothing has changed. Writers bump the counter through
+invalidate_drone_caches(), recording which drones changed, so a process that is a few
+versions behind re-reads just those rows; unknown or large changes reload everything.
+
+The counter lives in the default cache, which is Redis shared by every web and Celery
+process in docker-compose. With FLEET_SNAPSHOT off, as it is without Redis, get_fleet()
+returns a DatabaseFleet instead, which answers the same calls with targeted queries.
+"""
+import threading
+import time
+from operator import attrgetter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from dispatch.choices import LOADABLE_STATES
+from dispatch.models import Drone
+
+FLEET_VERSION_KEY = 'dispatch:fleet-version'
+
+# How long the per-version record of changed drone ids is kept
+CHANGE_LOG_TIMEOUT = 300
+
+# Beyond these a full reload is cheaper than replaying changes
+MAX_REPLAYED_VERSIONS = 100
+MAX_REPLAYED_DRONES = 1000
+
+SNAPSHOT_FIELDS = ('id', 'serial_number', 'model', 'weight_limit', 'battery_capacity', 'state', 'loaded_weight', 'latitude', 'longitude', 'discharge_rate')
+
+
+class DroneSnapshot:
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, id, serial_number, model, weight_limit, battery_capacity, state, loaded_weight, latitude, longitude, discharge_rate):
+        self.id = id
+        self.serial_number = serial_number
+        self.model = model
+        self.weight_limit = weight_limit
+        self.battery_capacity = battery_capacity
+        self.state = state
+        self.loaded_weight = loaded_weight
+        self.latitude = latitude
+        self.longitude = longitude
+        self.discharge_rate = discharge_rate
+
+    def mission_battery(self, hours):
+        return self.battery_capacity - (self.discharge_rate or 0) * hours
+
+
+def mission_hours():
+    return settings.MISSION_DURATION_MINUTES / 60
+
+
+def mission_battery(battery_capacity, discharge_rate):
+    """
+    The battery level forecast for the end of a MISSION_DURATION_MINUTES mission starting
+    now. Drones without a fitted ``discharge_rate`` are taken at their current level.
+    """
+    return battery_capacity - (discharge_rate or 0) * mission_hours()
+
+
+def forecast_q(battery_floor=25):
+    """
+    Filter for drones forecast to stay at ``battery_floor`` through a mission, as in
+    mission_battery(). The plain bound lets the database range-scan the battery index.
+    """
+    mission_drain = Coalesce(F('discharge_rate'), Value(0.0)) * mission_hours()
+    return Q(battery_capacity__gte=battery_floor) & Q(battery_capacity__gte=Value(float(battery_floor)) + mission_drain)
+
+
+class FleetSnapshot:
+    """Immutable view of the fleet at ``version``; replaying changes builds a new one."""
+
+    def __init__(self, drones, version, transaction_blocks):
+        self.drones = drones  # id -> DroneSnapshot
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.local_changes = _local_changes
+        # Atomic blocks open when the rows were read; uncommitted rows are only trusted inside them
+        self.transaction_blocks = transaction_blocks
+        self._derived = {}
+
+    @classmethod
+    def from_rows(cls, rows, version):
+        return cls({row[0]: DroneSnapshot(*row) for row in rows}, version, current_transaction_blocks())
+
+    def replay(self, rows, changed_ids, version):
+        drones = dict(self.drones)
+        for drone_id in changed_ids:
+            drones.pop(drone_id, None)
+        for row in rows:
+            drones[row[0]] = DroneSnapshot(*row)
+        return FleetSnapshot(drones, version, current_transaction_blocks())
+
+    def is_visible(self):
+        """False once the transaction the snapshot was read in has ended, as it may have rolled back."""
+        blocks = connection.atomic_blocks
+        return len(blocks) >= len(self.transaction_blocks) and all(
+            block is loaded_in for block, loaded_in in zip(blocks, self.transaction_blocks)
+        )
+
+    def get(self, drone_id):
+        return self.drones.get(drone_id)
+
+    def available(self, fields):
+        """
+        Drones available for loading as dicts of ``fields``, ordered by id. Built once per
+        snapshot and shared between callers, so treat the result as read-only.
+        """
+        fields = tuple(fields)
+        # attrgetter returns a bare value rather than a tuple for a single field
+        get_values = attrgetter(*fields) if len(fields) > 1 else lambda drone: (getattr(drone, fields[0]),)
+        hours = mission_hours()
+        return self.derived(('available', fields), lambda: [
+            dict(zip(fields, get_values(drone)))
+            for drone in sorted(self.drones.values(), key=attrgetter('id'))
+            if drone.state == 'IDLE' and drone.mission_battery(hours) >= 25
+        ])
+
+    def derived(self, key, build):
+        """Return ``build()``, computed once per snapshot under ``key``."""
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+
+    def loadable(self, battery_floor=25):
+        """
+        Drones that can take more medications and are forecast to stay at ``battery_floor``
+        through a mission, as (id, serial_number, weight_limit, loaded_weight) rows.
+        """
+        hours = mission_hours()
+        return [
+            (drone.id, drone.serial_number, drone.weight_limit, drone.loaded_weight)
+            for drone in sorted(self.drones.values(), key=lambda drone: drone.id)
+            if drone.state in LOADABLE_STATES and drone.mission_battery(hours) >= battery_floor and drone.loaded_weight < drone.weight_limit
+        ]
+
+    def locatable(self):
+        """Loadable drones with a known position, for the nearest-drone search."""
+        hours = mission_hours()
+        return [
+            drone for drone in self.drones.values()
+            if drone.latitude is not None and drone.longitude is not None and drone.state in LOADABLE_STATES
+            and drone.mission_battery(hours) >= 25 and drone.loaded_weight < drone.weight_limit
+        ]
+
+
+class DatabaseFleet:
+    """
+    FleetSnapshot's reads answered by targeted queries, for processes without a snapshot.
+    Nothing is kept between calls, so every read sees committed changes from any process.
+    """
+
+    def get(self, drone_id):
+        row = Drone.objects.filter(id=drone_id).values_list(*SNAPSHOT_FIELDS).first()
+        return DroneSnapshot(*row) if row is not None else None
+
+    async def aget(self, drone_id):
+        row = await Drone.objects.filter(id=drone_id).values_list(*SNAPSHOT_FIELDS).afirst()
+        return DroneSnapshot(*row) if row is not None else None
+
+    # Rows are sorted here: an ORDER BY id can lead the planner to scan the primary key
+    # instead of the partial drone_idle_battery_idx index
+
+    def available(self, fields):
+        fields = tuple(fields)
+        rows = Drone.objects.filter(forecast_q(), state='IDLE').order_by().values_list('id', *fields)
+        return [dict(zip(fields, row[1:])) for row in sorted(rows)]
+
+    def derived(self, key, build):
+        return build()
+
+    def loadable(self, battery_floor=25):
+        return sorted(
+            Drone.objects.filter(forecast_q(battery_floor), state__in=LOADABLE_STATES, loaded_weight__lt=F('weight_limit'))
+            .order_by().values_list('id', 'serial_number', 'weight_limit', 'loaded_weight')
+        )
+
+    def locatable(self):
+        rows = Drone.objects.filter(
+            forecast_q(), state__in=LOADABLE_STATES, loaded_weight__lt=F('weight_limit'),
+            latitude__isnull=False, longitude__isnull=False,
+        ).values_list(*SNAPSHOT_FIELDS)
+        return [DroneSnapshot(*row) for row in rows]
+
+
+_snapshot = None
+_lock = threading.Lock()
+# Fleet changes made by this process, which the staleness allowance never hides
+_local_changes = 0
+
+
+def current_transaction_blocks():
+    return tuple(connection.atomic_blocks)
+
+
+def change_log_key(version):
+    return f'{FLEET_VERSION_KEY}:{version}'
+
+
+def current_version():
+    version = cache.get(FLEET_VERSION_KEY)
+    if version is None:
+        # Start from the clock so the counter never runs backwards after the cache is flushed
+        cache.add(FLEET_VERSION_KEY, time.time_ns())
+        version = cache.get(FLEET_VERSION_KEY)
+    return version
+
+
+def bump_fleet_version(drone_ids=None):
+    """Mark the fleet changed. Pass the ids of the changed drones when known so readers reload only those."""
+    global _local_changes
+    _local_changes += 1
+    try:
+        version = cache.incr(FLEET_VERSION_KEY)
+    except ValueError:
+        cache.add(FLEET_VERSION_KEY, time.time_ns())
+        return
+    if drone_ids is not None:
+        cache.set(change_log_key(version), list(drone_ids), CHANGE_LOG_TIMEOUT)
+
+
+def changed_drone_ids(from_version, to_version):
+    """Ids changed between two versions, or None when they cannot be replayed."""
+    if not 0 < to_version - from_version <= MAX_REPLAYED_VERSIONS:
+        return None
+    keys = [change_log_key(version) for version in range(from_version + 1, to_version + 1)]
+    logged = cache.get_many(keys)
+    if len(logged) < len(keys):
+        return None
+    changed = set()
+    for drone_ids in logged.values():
+        changed.update(drone_ids)
+        if len(changed) > MAX_REPLAYED_DRONES:
+            return None
+    return changed
+
+
+def get_fleet():
+    """
+    Return a FleetSnapshot no older than the fleet version, give or take
+    FLEET_SNAPSHOT_MAX_STALENESS. With FLEET_SNAPSHOT off it returns a DatabaseFleet.
+    """
+    global _snapshot
+    if not settings.FLEET_SNAPSHOT:
+        # A process-local cache never sees version bumps made by other processes
+        return DatabaseFleet()
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_visible():
+        if snapshot.version == version:
+            return snapshot
+        if snapshot.local_changes == _local_changes and time.monotonic() - snapshot.loaded_at < settings.FLEET_SNAPSHOT_MAX_STALENESS:
+            return snapshot
+
+    with _lock:
+        if _snapshot is not None and _snapshot is not snapshot and _snapshot.version == version and _snapshot.is_visible():
+            return _snapshot  # Another thread refreshed it while we waited
+        snapshot = _snapshot if _snapshot is not None and _snapshot.is_visible() else None
+        changed = changed_drone_ids(snapshot.version, version) if snapshot is not None else None
+        fields = Drone.objects.order_by('id').values_list(*SNAPSHOT_FIELDS)
+        if changed is None:
+            _snapshot = FleetSnapshot.from_rows(fields, version)
+        else:
+            _snapshot = snapshot.replay(fields.filter(id__in=changed), changed, version)
+        return _snapshot
+
+
+async def aget_drone(drone_id):
+    """The drone's snapshot row for async views, read with the async ORM when there is no fleet snapshot."""
+    if not settings.FLEET_SNAPSHOT:
+        return await DatabaseFleet().aget(drone_id)
+    # The snapshot may need a reload, which touches the database
+    return (await sync_to_async(get_fleet)()).get(drone_id)
+
+
+def clear_fleet_snapshot():
+    global _snapshot
+    _snapshot = None
@@ -0,0 +1,144 @@
+"""
+Battery drain forecasting from the fleet's battery history.
+
+refresh_forecasts() fits every drone's discharge rate, in percent per hour, by least
+squares over its battery samples from the last BATTERY_FORECAST_HISTORY_HOURS: the raw
+DroneBatteryAudit rows still in the audit store, and the last sample of each hourly
+DroneBatteryRollup the expired ones were compacted into. Only samples since the drone's
+last recharge count, so a charge does not read as negative drain.
+
+The fit is a handful of NumPy passes over the whole fleet's samples at once, with the
+per-drone sums taken by bincount, and only rates that moved are written back to
+Drone.discharge_rate. Availability, loading and planning then require a drone's
+battery to stay at the 25% floor to the end of a mission (see fleet.mission_battery).
+"""
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Func
+from django.utils import timezone
+from dispatch.caching import drone_rows_changed
+from dispatch.fleet import MAX_REPLAYED_DRONES
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup
+
+# Fewest samples since the last recharge for a drone's rate to be fitted
+MIN_SAMPLES = 3
+
+# Shortest stretch of history, in hours, a rate is fitted over
+MIN_SPAN_HOURS = 0.1
+
+# A rise in battery level larger than this, in percent, between two samples is a recharge
+RECHARGE_THRESHOLD = 1.0
+
+# Stored rates are rounded to this many decimals; rates that round the same are not rewritten
+RATE_DECIMALS = 2
+
+
+def fit_discharge_rates(drone_ids, timestamps, levels):
+    """
+    Fit discharge rates from battery samples given as parallel arrays of drone ids, epoch
+    seconds and levels, in any order. Returns ``(drone_ids, rates)`` arrays for the drones
+    with enough history; rates are in percent per hour and never negative.
+    """
+    drone_ids = np.asarray(drone_ids, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=float)
+    levels = np.asarray(levels, dtype=float)
+    order = np.lexsort((timestamps, drone_ids))
+    drone_ids, timestamps, levels = drone_ids[order], timestamps[order], levels[order]
+    drones, group = np.unique(drone_ids, return_inverse=True)
+    if not len(drones):
+        return drones, np.zeros(0)
+
+    # Start each drone's fit at its first sample, or the sample after its latest recharge
+    first = np.searchsorted(group, np.arange(len(drones)))
+    recharges = np.flatnonzero((group[1:] == group[:-1]) & (np.diff(levels) > RECHARGE_THRESHOLD)) + 1
+    np.maximum.at(first, group[recharges], recharges)
+    since = np.arange(len(group)) >= first[group]
+    group, levels = group[since], levels[since]
+    # Hours since the first counted sample keep the sums well conditioned
+    hours = (timestamps[since] - timestamps[first][group]) / 3600
+
+    count = np.bincount(group, minlength=len(drones))
+    sum_hours = np.bincount(group, hours, minlength=len(drones))
+    sum_levels = np.bincount(group, levels, minlength=len(drones))
+    sum_squares = np.bincount(group, hours * hours, minlength=len(drones))
+    sum_products = np.bincount(group, hours * levels, minlength=len(drones))
+    spread = count * sum_squares - sum_hours ** 2
+    span = np.zeros(len(drones))
+    np.maximum.at(span, group, hours)
+
+    fitted = (count >= MIN_SAMPLES) & (span >= MIN_SPAN_HOURS) & (spread > 0)
+    slope = (count * sum_products - sum_hours * sum_levels)[fitted] / spread[fitted]
+    return drones[fitted], np.maximum(-slope, 0)
+
+
+class EpochSeconds(Func):
+    """
+    Seconds since the Unix epoch of a datetime, computed by the database. Reading the
+    history as floats skips building and converting a datetime object per sample, which
+    costs several times more than the rest of a refresh.
+    """
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)', **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)::double precision', **extra_context)
+
+
+def battery_history(since):
+    """Every drone's battery samples since ``since`` as ``(drone_ids, timestamps, levels)`` arrays."""
+    audits = DroneBatteryAudit.objects.filter(timestamp__gte=since).order_by().values_list(
+        'drone_id', 'battery_level', EpochSeconds('timestamp'))
+    rollups = DroneBatteryRollup.objects.filter(period='HOUR', last_timestamp__gte=since).order_by().values_list(
+        'drone_id', 'last_level', EpochSeconds('last_timestamp'))
+    # Every column is already a number, so the rows are read without the ORM's per-value
+    # converters. Listed in SQL order: the expression is selected after the fields
+    samples = []
+    with connection.cursor() as cursor:
+        for queryset in (audits, rollups):
+            cursor.execute(*queryset.query.sql_with_params())
+            samples += cursor.fetchall()
+    samples = np.array(samples, dtype=float).reshape(-1, 3)
+    return samples[:, 0].astype(np.int64), samples[:, 2], samples[:, 1]
+
+
+def update_discharge_rates(rates):
+    """Set ``discharge_rate`` from ``{drone_id: rate}`` with one UPDATE."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(Drone._meta.db_table)
+    pk = quote_name(Drone._meta.pk.column)
+    column = quote_name(Drone._meta.get_field('discharge_rate').column)
+    cases = ' '.join(['WHEN %s THEN %s'] * len(rates))
+    placeholders = ', '.join(['%s'] * len(rates))
+    params = [value for rate in rates.items() for value in rate] + list(rates)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET {column} = CASE {pk} {cases} END WHERE {pk} IN ({placeholders})', params)
+
+
+def refresh_forecasts(now=None):
+    """
+    Refit every drone's discharge rate and store the ones that changed. Drones without
+    enough recent history keep their last rate. Returns ``(fitted, updated)`` counts.
+    """
+    now = now or timezone.now()
+    drone_ids, rates = fit_discharge_rates(*battery_history(now - timezone.timedelta(hours=settings.BATTERY_FORECAST_HISTORY_HOURS)))
+    rates = np.round(rates, RATE_DECIMALS)
+    stored = dict(Drone.objects.filter(discharge_rate__isnull=False).values_list('id', 'discharge_rate'))
+    changed = {
+        drone_id: rate for drone_id, rate in zip(drone_ids.tolist(), rates.tolist())
+        if stored.get(drone_id) != rate
+    }
+
+    # Keep each statement within the backend's bound-parameter limit
+    max_params = connection.features.max_query_params
+    size = max_params // 3 if max_params else len(changed) or 1
+    items = list(changed.items())
+    with transaction.atomic():
+        for start in range(0, len(items), size):
+            update_discharge_rates(dict(items[start:start + size]))
+        if changed:
+            # Past MAX_REPLAYED_DRONES readers reload the whole fleet anyway; skip logging the ids
+            drone_rows_changed(list(changed) if len(changed) <= MAX_REPLAYED_DRONES else None)
+    return len(drone_ids), len(changed)
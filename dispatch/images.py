@@ -0,0 +1,144 @@
+"""
+Post-upload processing of medication images, run by the process_medication_images task.
+
+Each image is stored under the SHA-256 of its content, so identical uploads share one
+file however many medications use them. Single uploads are saved under that name as they
+arrive (store_upload), so the URL a client is given never changes. Originals wider or taller than
+MEDICATION_IMAGE_MAX_DIMENSION are downscaled when stored, and a JPEG thumbnail no
+larger than MEDICATION_THUMBNAIL_SIZE is written once per distinct image. Listings
+link the thumbnail rather than the original.
+"""
+import hashlib
+import io
+import logging
+import os
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from PIL import Image
+from dispatch.models import Medication
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbnails'
+
+# image_hash of medications whose image could not be read; the sweep skips them until it is reset to ''
+UNREADABLE_IMAGE_HASH = 'unreadable'
+
+
+def image_storage():
+    return Medication._meta.get_field('image').storage
+
+
+def downscale(content, max_dimension):
+    """Return ``content`` re-encoded to fit within ``max_dimension`` pixels, or unchanged if it already fits."""
+    image = Image.open(io.BytesIO(content))
+    if max(image.size) <= max_dimension:
+        return content
+    image_format = image.format
+    image.thumbnail((max_dimension, max_dimension))
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+def make_thumbnail(content, size):
+    image = Image.open(io.BytesIO(content))
+    image.thumbnail((size, size))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
+def hashed_name(content, name):
+    """The storage name for image ``content`` uploaded as ``name``: its SHA-256 under the upload directory."""
+    image_hash = hashlib.sha256(content).hexdigest()
+    extension = os.path.splitext(name)[1].lower() or '.jpg'
+    return f"{Medication._meta.get_field('image').upload_to}/{image_hash}{extension}", image_hash
+
+
+def store_upload(upload):
+    """
+    Save an uploaded image under its content hash and return ``(stored_name, created)``.
+    The file keeps that name when it is processed, so the URL returned for the upload
+    stays valid. An identical image already in storage is reused rather than written
+    again, and ``created`` is False.
+    """
+    content = upload.read()
+    name, _ = hashed_name(content, upload.name)
+    storage = image_storage()
+    if storage.exists(name):
+        return name, False
+    return storage.save(name, ContentFile(content)), True
+
+
+def discard_upload(name):
+    """Delete an image store_upload() wrote for a medication that was never saved, unless another medication uses it."""
+    if not Medication.objects.filter(image=name).exists():
+        image_storage().delete(name)
+
+
+def store_image(name):
+    """
+    Store the image at ``name`` under its content hash and make sure its thumbnail exists.
+    Returns ``(stored_name, image_hash, thumbnail_name)``. Files already stored for the
+    same content are reused, so this hashes the image but writes nothing for duplicates.
+    """
+    storage = image_storage()
+    with storage.open(name) as file:
+        content = file.read()
+    stored_name, image_hash = hashed_name(content, name)
+    if stored_name == name:
+        # Uploads stored by store_upload() are downscaled in place so their URL stays valid
+        downscaled = downscale(content, settings.MEDICATION_IMAGE_MAX_DIMENSION)
+        if downscaled is not content:
+            with storage.open(name, 'wb') as file:
+                file.write(downscaled)
+    elif not storage.exists(stored_name):
+        stored_name = storage.save(stored_name, ContentFile(downscale(content, settings.MEDICATION_IMAGE_MAX_DIMENSION)))
+
+    thumbnail_name = f'{THUMBNAIL_DIR}/{image_hash}.jpg'
+    if not storage.exists(thumbnail_name):
+        thumbnail_name = storage.save(thumbnail_name, ContentFile(make_thumbnail(content, settings.MEDICATION_THUMBNAIL_SIZE)))
+    return stored_name, image_hash, thumbnail_name
+
+
+def process_medication_images(medication_ids=None, remove_replaced=False, limit=None):
+    """
+    Hash, deduplicate and thumbnail the images of unprocessed medications: those in
+    ``medication_ids``, or any up to ``limit`` when it is None. Medications sharing an
+    image file are handled with one read of it. With ``remove_replaced`` the files the
+    medications pointed at are deleted once nothing references them; leave it off for
+    images that were not uploaded for these medications. Returns how many were updated.
+    """
+    pending = Medication.objects.filter(image_hash='').order_by('pk')
+    if medication_ids is not None:
+        pending = pending.filter(pk__in=medication_ids)
+    rows = pending.values_list('pk', 'image')
+    if limit is not None:
+        rows = rows[:limit]
+
+    by_image = {}
+    for pk, name in rows:
+        by_image.setdefault(name, []).append(pk)
+
+    storage = image_storage()
+    processed = 0
+    for name, pks in by_image.items():
+        try:
+            stored_name, image_hash, thumbnail_name = store_image(name)
+        # A missing file, one PIL cannot read or is too large to decode, or a path outside the storage
+        except (OSError, ValueError, Image.DecompressionBombError, SuspiciousFileOperation) as e:
+            logger.warning(f"Could not process medication image '{name}': {e}")
+            Medication.objects.filter(pk__in=pks, image=name).update(image_hash=UNREADABLE_IMAGE_HASH)
+            continue
+        # Skip medications whose image changed while this one was processed
+        processed += Medication.objects.filter(pk__in=pks, image=name).update(
+            image=stored_name, image_hash=image_hash, thumbnail=thumbnail_name)
+        if remove_replaced and stored_name != name and not Medication.objects.filter(image=name).exists():
+            storage.delete(name)
+
+    logger.info(f'Processed images of {processed} medications from {len(by_image)} files.')
+    return processed
@@ -0,0 +1,244 @@
+"""
+Nearest loadable drones to pickup points, answered from the fleet snapshot without PostGIS.
+
+DroneLocator puts every loadable drone that has reported a position on a grid of square
+cells, sized so the fleet averages about DRONES_PER_CELL drones per cell, and sorts them
+by cell, row by row, so the drones in one grid row between two columns are a single
+slice found with searchsorted. A query scans the square of cells around its point and
+computes great-circle distances for the drones in it only, widening the square until
+the K-th nearest drone found is closer than any drone outside it could be. Points still
+searching after MAX_SEARCH_RADIUS cells, near the poles or in an empty region, fall back
+to checking every drone.
+
+Batches of points are answered together: each step is one NumPy operation over all the
+points still searching. The index is built once per fleet snapshot by get_locator().
+"""
+import math
+import numpy as np
+from dispatch.fleet import get_fleet
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Upper bounds on pickup points per batch request and on drones returned per point
+MAX_POINTS = 10000
+MAX_NEAREST = 100
+
+# Average drones per grid cell over the fleet's bounding box
+DRONES_PER_CELL = 16
+
+# Grid cells are between these sizes, in degrees; 0.001 degrees is about 110 m
+MIN_CELL_DEGREES = 0.001
+MAX_CELL_DEGREES = 10
+
+# Widest square, in cells from the point's own, scanned before falling back to every drone
+MAX_SEARCH_RADIUS = 64
+
+
+def haversine_km(latitude, longitude, cos_latitude, other_latitude, other_longitude, other_cos_latitude):
+    """Great-circle distances between points given in radians, with their latitudes' cosines."""
+    a = np.sin((other_latitude - latitude) / 2) ** 2 + cos_latitude * other_cos_latitude * np.sin((other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+class DroneLocator:
+    """Grid index over ``drones`` (DroneSnapshot objects with a position)."""
+
+    def __init__(self, drones, cell_degrees=None):
+        latitude = np.array([drone.latitude for drone in drones], dtype=float)
+        longitude = np.array([drone.longitude for drone in drones], dtype=float)
+        free = np.array([drone.weight_limit - drone.loaded_weight for drone in drones], dtype=float)
+
+        if cell_degrees is None:
+            area = np.ptp(latitude) * np.ptp(longitude) if len(drones) else 0
+            cell_degrees = np.sqrt(area * DRONES_PER_CELL / len(drones)) if area else MAX_CELL_DEGREES
+        # A whole number of columns around the globe, so wrapping at the antimeridian is exact
+        self.columns = int(np.ceil(360 / np.clip(cell_degrees, MIN_CELL_DEGREES, MAX_CELL_DEGREES)))
+        self.cell_degrees = 360 / self.columns
+        self.rows = int(np.ceil(180 / self.cell_degrees))
+        row, column = self.cells(latitude, longitude)
+        order = np.argsort(row * self.columns + column, kind='stable')
+
+        self.drones = [drones[index] for index in order]
+        self.keys = (row * self.columns + column)[order]
+        self.latitude = np.radians(latitude)[order]
+        self.longitude = np.radians(longitude)[order]
+        self.cos_latitude = np.cos(self.latitude)
+        self.free = free[order]
+
+    def __len__(self):
+        return len(self.drones)
+
+    def cells(self, latitude, longitude):
+        row = np.clip(((latitude + 90) // self.cell_degrees).astype(np.int64), 0, self.rows - 1)
+        column = np.clip(((longitude + 180) // self.cell_degrees).astype(np.int64), 0, self.columns - 1)
+        return row, column
+
+    def nearest(self, latitudes, longitudes, weights, k):
+        """
+        The ``k`` nearest drones with at least ``weights[i]`` grams of free capacity to each
+        point ``(latitudes[i], longitudes[i])``, in degrees. Returns one list per point of
+        ``(DroneSnapshot, distance_km)`` pairs, nearest first.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        row, column = self.cells(latitudes, longitudes)
+        latitude = np.radians(latitudes)
+        longitude = np.radians(longitudes)
+        cos_latitude = np.cos(latitude)
+        weights = np.asarray(weights, dtype=float)
+        results = [[] for _ in range(len(latitude))]
+        if not self.drones:
+            return results
+
+        pending = np.arange(len(latitude))
+        radius = 1
+        while len(pending) and radius <= MAX_SEARCH_RADIUS:
+            point, drone = self.candidates(row[pending], column[pending], radius)
+            fits = self.free[drone] >= weights[pending][point]
+            point, drone = point[fits], drone[fits]
+            distance = haversine_km(
+                latitude[pending][point], longitude[pending][point], cos_latitude[pending][point],
+                self.latitude[drone], self.longitude[drone], self.cos_latitude[drone],
+            )
+
+            # Keep each point's k nearest, grouped by point and nearest first. Distances are
+            # below 2e4 km, so one float sort key orders by point, then distance.
+            order = np.argsort(point * 2e4 + distance, kind='stable')
+            point, drone, distance = point[order], drone[order], distance[order]
+            rank = np.arange(len(point)) - np.searchsorted(point, point)
+            keep = rank < k
+            point, drone, distance = point[keep], drone[keep], distance[keep]
+            starts = np.searchsorted(point, np.arange(len(pending) + 1))
+            found = np.diff(starts)
+
+            kth = np.full(len(pending), np.inf)
+            full = found == k
+            kth[full] = distance[starts[:-1][full] + k - 1]
+            bound = self.outside_distance(latitudes[pending], longitudes[pending], cos_latitude[pending], row[pending], column[pending], radius)
+            done = (full & (kth <= bound)) | np.isinf(bound)
+            for index in np.flatnonzero(done):
+                results[pending[index]] = [
+                    (self.drones[drone_index], float(drone_distance))
+                    for drone_index, drone_distance in zip(drone[starts[index]:starts[index + 1]], distance[starts[index]:starts[index + 1]])
+                ]
+            pending = pending[~done]
+            radius *= 2
+
+        for index in pending:
+            results[index] = self.nearest_exhaustive(latitude[index], longitude[index], cos_latitude[index], weights[index], k)
+        return results
+
+    def candidates(self, row, column, radius):
+        """
+        Indexes of the drones in the square of ``radius`` cells around each point, as
+        ``(point, drone)`` arrays pairing each point's position in ``row`` with a drone.
+        """
+        rows = row[:, None] + np.arange(-radius, radius + 1)[None, :]
+        valid_rows = (rows >= 0) & (rows < self.rows)
+        if 2 * radius + 1 >= self.columns:
+            column_ranges = [(np.zeros_like(column), np.full_like(column, self.columns - 1))]
+        else:
+            first, last = column - radius, column + radius
+            # The square may wrap around the antimeridian at either side
+            column_ranges = [
+                (np.maximum(first, 0), np.minimum(last, self.columns - 1)),
+                (first + self.columns, np.full_like(column, self.columns - 1)),
+                (np.zeros_like(column), last - self.columns),
+            ]
+        lows, highs = [], []
+        for start, end in column_ranges:
+            low = np.searchsorted(self.keys, rows * self.columns + start[:, None], 'left')
+            high = np.searchsorted(self.keys, rows * self.columns + end[:, None], 'right')
+            lows.append(low)
+            highs.append(np.where(valid_rows & (end >= start)[:, None], high, low))
+        low = np.concatenate(lows, axis=1).ravel()
+        lengths = np.concatenate(highs, axis=1).ravel() - low
+
+        point = np.repeat(np.arange(len(row)).repeat(len(lengths) // len(row)), lengths)
+        # Consecutive indexes low..high-1 for every slice, flattened
+        offsets = np.cumsum(lengths) - lengths
+        drone = np.repeat(low - offsets, lengths) + np.arange(lengths.sum())
+        return point, drone
+
+    def outside_distance(self, latitude, longitude, cos_latitude, row, column, radius):
+        """
+        A lower bound, in km, on the distance from each point (in degrees) to any drone
+        outside the square of ``radius`` cells around it; infinite when the square covers
+        the grid.
+        """
+        south = (row - radius) * self.cell_degrees - 90
+        north = (row + radius + 1) * self.cell_degrees - 90
+        # Outside the square's rows a drone is at least as far as the nearer of its north and south edges
+        latitude_gap = np.minimum(
+            np.where(row - radius > 0, latitude - south, np.inf),
+            np.where(row + radius < self.rows - 1, north - latitude, np.inf),
+        )
+        latitude_bound = np.radians(latitude_gap) * EARTH_RADIUS_KM
+        if 2 * radius + 1 >= self.columns:
+            return latitude_bound
+        # Within its rows it is past the west or east edge, at a latitude no nearer the equator than the square's
+        west = (column - radius) * self.cell_degrees - 180
+        east = (column + radius + 1) * self.cell_degrees - 180
+        longitude_gap = np.radians(np.minimum(longitude - west, east - longitude))
+        farthest = np.radians(np.minimum(np.maximum(np.abs(south), np.abs(north)), 90))
+        a = cos_latitude * np.cos(farthest) * np.sin(longitude_gap / 2) ** 2
+        longitude_bound = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+        return np.minimum(latitude_bound, longitude_bound)
+
+    def nearest_exhaustive(self, latitude, longitude, cos_latitude, weight, k):
+        candidates = np.flatnonzero(self.free >= weight)
+        distance = haversine_km(
+            latitude, longitude, cos_latitude,
+            self.latitude[candidates], self.longitude[candidates], self.cos_latitude[candidates],
+        )
+        if len(candidates) > k:
+            nearest = np.argpartition(distance, k)[:k]
+            candidates, distance = candidates[nearest], distance[nearest]
+        order = np.argsort(distance, kind='stable')
+        return [(self.drones[index], float(distance[position])) for position, index in zip(order, candidates[order])]
+
+
+def get_locator(fleet=None):
+    """The DroneLocator for the current fleet snapshot: loadable drones with a known position."""
+    fleet = fleet or get_fleet()
+    return fleet.derived('locator', lambda: DroneLocator(fleet.locatable()))
+
+
+def is_number(value, low, high):
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value) and low <= value <= high
+
+
+def parse_points(payload):
+    """
+    Validate a list of ``{latitude, longitude, weight}`` pickup points, ``weight``
+    defaulting to 0. Returns ``(latitudes, longitudes, weights)`` lists and a list of
+    per-item error dicts that is empty when every point is valid. Like telemetry, a
+    batch skips the DRF serializer machinery, which would cost more than the search.
+    """
+    if not isinstance(payload, list) or not payload:
+        return ([], [], []), [{'non_field_errors': ['Expected a non-empty list of points.']}]
+    if len(payload) > MAX_POINTS:
+        return ([], [], []), [{'non_field_errors': [f'At most {MAX_POINTS} points are accepted per request.']}]
+
+    latitudes, longitudes, weights = [], [], []
+    errors = []
+    for item in payload:
+        if not isinstance(item, dict):
+            errors.append({'non_field_errors': ['Expected an object.']})
+            continue
+        error = {}
+        latitude, longitude, weight = item.get('latitude'), item.get('longitude'), item.get('weight', 0)
+        if not is_number(latitude, -90, 90):
+            error['latitude'] = ['Enter a number between -90 and 90.']
+        if not is_number(longitude, -180, 180):
+            error['longitude'] = ['Enter a number between -180 and 180.']
+        if not is_number(weight, 0, 500):
+            error['weight'] = ['Enter a number between 0 and 500.']
+        errors.append(error)
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        weights.append(weight)
+
+    if any(errors):
+        return ([], [], []), errors
+    return (latitudes, longitudes, weights), []
@@ -0,0 +1,73 @@
+import json
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.db import transaction
+from dispatch.benchmarks import SCENARIOS
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a seeded fleet; seeded data is rolled back or deleted afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Benchmark scenario to run')
+        parser.add_argument('--drones', type=int, default=10000, help='Number of drones to seed')
+        parser.add_argument('--batch-size', type=int, default=None, help='Batch size for batched code paths')
+        parser.add_argument('--items', type=int, default=5000, help='Medications to plan or validate')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per measured endpoint')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests kept in flight by concurrent scenarios')
+        parser.add_argument('--output', help='Also write the results as JSON to this file, for diffing between commits')
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help='Run scenarios that commit their seeded data even with DEBUG off',
+        )
+
+    def handle(self, *args, **options):
+        scenario = SCENARIOS[options['scenario']]
+        kwargs = {
+            'drones': options['drones'],
+            'batch_size': options['batch_size'],
+            'requests': options['requests'],
+            'items': options['items'],
+            'concurrency': options['concurrency'],
+        }
+        if kwargs['drones'] <= 0:
+            raise CommandError('--drones must be positive')
+        if not scenario.rollback and not (settings.DEBUG or options['allow_writes']):
+            raise CommandError(
+                f"'{options['scenario']}' commits its seeded data to the database; "
+                'run it with DEBUG on or pass --allow-writes'
+            )
+
+        if scenario.rollback:
+            with transaction.atomic():
+                result = scenario(**kwargs)
+                transaction.set_rollback(True)
+        else:
+            result = scenario(**kwargs)
+
+        self.stdout.write(self.style.SUCCESS(f"Benchmark '{options['scenario']}' results:"))
+        for key, value in result.items():
+            if isinstance(value, float):
+                value = f'{value:.4f}'
+            self.stdout.write(f'  {key}: {value}')
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'scenario': options['scenario'],
+                    'commit': current_commit(),
+                    'finished_at': timezone.now().isoformat(),
+                    'options': kwargs,
+                    'results': result,
+                }, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+
+
+def current_commit():
+    """The checked out git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -1,32 +1,93 @@
+import gzip
 import os
-import json
-from django.core.management.base import BaseCommand
+import time
+from django.core.management.base import BaseCommand, CommandError
 from django.core.serializers import serialize
-from dispatch.models import Drone, Medication, DroneBatteryAudit
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from dispatch.models import Drone, Medication, DroneBatteryAudit, DroneBatteryRollup
+
+# Export name -> (model, output file stem, timestamp field used by --since)
+EXPORTS = {
+    'drones': (Drone, 'drones', None),
+    'medications': (Medication, 'medications', None),
+    'audits': (DroneBatteryAudit, 'drone_battery_audits', 'timestamp'),
+    'rollups': (DroneBatteryRollup, 'drone_battery_rollups', 'last_timestamp'),
+}
+
+FORMAT_EXTENSIONS = {'json': '.json', 'jsonl': '.jsonl'}
+COMPRESSION_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
 
 class Command(BaseCommand):
-    help = 'Export data from models to JSON files'
+    help = 'Export data from models to JSON files, streaming rows so memory stays flat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', choices=sorted(EXPORTS), default=list(EXPORTS), help='Models to export (default: all)')
+        parser.add_argument('--format', choices=sorted(FORMAT_EXTENSIONS), default='json', help='json: Django fixture array; jsonl: one object per line (NDJSON)')
+        parser.add_argument('--compress', choices=sorted(COMPRESSION_EXTENSIONS), default='none', help='Compress output files')
+        parser.add_argument('--since', help='Only export audits and rollups recorded at or after this ISO 8601 datetime')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database per round trip')
+        parser.add_argument('--output-dir', default='data_exports', help='Directory to write the export files to')
 
     def handle(self, *args, **options):
+        since = self.parse_since(options['since'])
+        started = time.perf_counter()
+        total = 0
         try:
-            # Export Drone data
-            drones_data = serialize('json', Drone.objects.all())
-            self.write_to_file('drones.json', drones_data)
-
-            # Export Medication data
-            medications_data = serialize('json', Medication.objects.all())
-            self.write_to_file('medications.json', medications_data)
-
-            # Export DroneBatteryAudit data
-            audits_data = serialize('json', DroneBatteryAudit.objects.all())
-            self.write_to_file('drone_battery_audits.json', audits_data)
+            for name in options['models']:
+                model, stem, timestamp_field = EXPORTS[name]
+                queryset = model.objects.order_by('pk')
+                if since and timestamp_field:
+                    queryset = queryset.filter(**{f'{timestamp_field}__gte': since})
+                elif since:
+                    self.stdout.write(f'{name} have no timestamp; exporting all rows')
 
-            self.stdout.write(self.style.SUCCESS('Successfully exported data to JSON files'))
+                filename = stem + FORMAT_EXTENSIONS[options['format']] + COMPRESSION_EXTENSIONS[options['compress']]
+                count = self.export(queryset, filename, options)
+                total += count
+                self.stdout.write(f'Exported {count} {name} to {filename}')
+        except CommandError:
+            raise
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Failed to export data: {str(e)}'))
+            return
 
-    def write_to_file(self, filename, data):
-        file_path = os.path.join('data_exports', filename)  
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully exported {total} rows to JSON files in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/sec)'
+        ))
+
+    def parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            raise CommandError(f'--since must be an ISO 8601 datetime, got "{value}"')
+        return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+    def export(self, queryset, filename, options):
+        """Serialize ``queryset`` into ``filename`` one chunk at a time and return the row count."""
+        counter = {'rows': 0}
+
+        def rows():
+            for obj in queryset.iterator(chunk_size=options['chunk_size']):
+                counter['rows'] += 1
+                yield obj
+
+        file_path = os.path.join(options['output_dir'], filename)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as file:
-            file.write(data)
+        indent = 4 if options['format'] == 'json' else None
+        with self.open_output(file_path, options['compress']) as file:
+            serialize(options['format'], rows(), stream=file, indent=indent)
+        return counter['rows']
+
+    def open_output(self, file_path, compress):
+        if compress == 'gzip':
+            return gzip.open(file_path, 'wt', encoding='utf-8')
+        if compress == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise CommandError('zstd compression requires the zstandard package')
+            return zstandard.open(file_path, 'wt', encoding='utf-8')
+        return open(file_path, 'w', encoding='utf-8')
@@ -1,43 +1,187 @@
-import os
+import gzip
 import json
-from django.core.management.base import BaseCommand
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from dispatch.caching import invalidate_drone_caches
 from dispatch.models import Drone, Medication
 
+# Input file stems in the order they must be imported; medications reference drones
+IMPORTS = ('drones', 'medications')
+
+# Extensions tried for each stem, matching what exportdatajson writes
+INPUT_EXTENSIONS = ('.json', '.jsonl', '.json.gz', '.jsonl.gz', '.json.zst', '.jsonl.zst')
+
+WHITESPACE = ' \t\n\r'
+
 class Command(BaseCommand):
-    help = 'Import data from JSON files to database'
+    help = 'Import data from JSON files to database, upserting drones by serial number and medications by code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input-dir', default='data_exports', help='Directory holding the export files')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows upserted per transaction')
 
     def handle(self, *args, **options):
+        started = time.perf_counter()
         try:
-            # Import Drones from JSON
-            file_path_drones = 'data_exports/drones.json'  
-            with open(file_path_drones, 'r') as file:
-                drones_data = json.load(file)
-                for drone_obj in drones_data:
-                    fields = drone_obj['fields']
-                    drone = Drone(
-                        serial_number=fields['serial_number'],
-                        model=fields['model'],
-                        weight_limit=fields['weight_limit'],
-                        battery_capacity=fields['battery_capacity'],
-                        state=fields['state']
-                    )
-                    drone.save()
-
-            # Import Medications from JSON
-            file_path_medications = 'data_exports/medications.json'  
-            with open(file_path_medications, 'r') as file:
-                medications_data = json.load(file)
-                for medication_obj in medications_data:
-                    fields = medication_obj['fields']
-                    medication = Medication(
-                        name=fields['name'],
-                        weight=fields['weight'],
-                        code=fields['code'],
-                        image=fields['image'],  
-                        drone_id=fields['drone']  
-                    )
-                    medication.save()
-
-            self.stdout.write(self.style.SUCCESS('Successfully imported data to database'))
+            drones_path, medications_path = (self.find_input(options['input_dir'], stem) for stem in IMPORTS)
+
+            # Fixture pk -> serial number, so medications can be remapped onto this database's drone ids
+            serial_numbers = {}
+            drone_count = self.import_drones(drones_path, options['batch_size'], serial_numbers)
+            medication_count, skipped = self.import_medications(medications_path, options['batch_size'], serial_numbers)
+
+            # Keep the denormalized load in step with the imported medications
+            Drone.objects.sync_loaded_weight()
+            invalidate_drone_caches()
+        except CommandError:
+            raise
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Failed to import data: {str(e)}'))
+            return
+
+        elapsed = time.perf_counter() - started
+        total = drone_count + medication_count
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} medications whose drone is not in the drones file'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully imported data to database: {drone_count} drones, {medication_count} medications '
+            f'in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/sec)'
+        ))
+
+    def find_input(self, input_dir, stem):
+        for extension in INPUT_EXTENSIONS:
+            path = os.path.join(input_dir, stem + extension)
+            if os.path.exists(path):
+                return path
+        raise CommandError(f'No {stem} export found in {input_dir}')
+
+    def import_drones(self, path, batch_size, serial_numbers):
+        count = 0
+        for batch in self.batches(path, batch_size):
+            drones = []
+            for drone_obj in batch:
+                fields = drone_obj['fields']
+                serial_numbers[drone_obj['pk']] = fields['serial_number']
+                drones.append(Drone(
+                    serial_number=fields['serial_number'],
+                    model=fields['model'],
+                    weight_limit=fields['weight_limit'],
+                    battery_capacity=fields['battery_capacity'],
+                    state=fields['state']
+                ))
+            with transaction.atomic():
+                Drone.objects.bulk_create(
+                    drones,
+                    update_conflicts=True,
+                    unique_fields=['serial_number'],
+                    update_fields=['model', 'weight_limit', 'battery_capacity', 'state'],
+                )
+            count += len(drones)
+        return count
+
+    def import_medications(self, path, batch_size, serial_numbers):
+        count = skipped = 0
+        for batch in self.batches(path, batch_size):
+            batch_serials = {serial_numbers.get(medication_obj['fields']['drone']) for medication_obj in batch}
+            drone_ids = dict(Drone.objects.filter(serial_number__in=batch_serials - {None}).values_list('serial_number', 'id'))
+
+            medications = []
+            for medication_obj in batch:
+                fields = medication_obj['fields']
+                # Delivered medications are no longer attached to a drone
+                drone_id = None
+                if fields['drone'] is not None:
+                    drone_id = drone_ids.get(serial_numbers.get(fields['drone']))
+                    if drone_id is None:
+                        skipped += 1
+                        continue
+                medications.append(Medication(
+                    name=fields['name'],
+                    weight=fields['weight'],
+                    code=fields['code'],
+                    image=fields['image'],
+                    drone_id=drone_id,
+                    delivered_at=fields.get('delivered_at'),
+                ))
+            with transaction.atomic():
+                Medication.objects.bulk_create(
+                    medications,
+                    update_conflicts=True,
+                    unique_fields=['code'],
+                    update_fields=['name', 'weight', 'image', 'drone', 'delivered_at'],
+                )
+            count += len(medications)
+        return count, skipped
+
+    def batches(self, path, batch_size):
+        """Yield lists of up to ``batch_size`` fixture objects streamed from ``path``."""
+        with self.open_input(path) as file:
+            objects = iter_json_lines(file) if '.jsonl' in path else iter_json_array(file)
+            batch = []
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def open_input(self, path):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8')
+        if path.endswith('.zst'):
+            try:
+                import zstandard
+            except ImportError:
+                raise CommandError('Reading .zst files requires the zstandard package')
+            return zstandard.open(path, 'rt', encoding='utf-8')
+        return open(path, 'r', encoding='utf-8')
+
+
+def iter_json_lines(file):
+    """Yield one object per non-blank line of an NDJSON file."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_array(file, read_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    opened = False
+
+    while True:
+        # Skip whitespace and separators, refilling the buffer when it runs dry
+        while pos < len(buffer) and (buffer[pos] in WHITESPACE or (opened and buffer[pos] == ',')):
+            pos += 1
+        if pos == len(buffer):
+            chunk = file.read(read_size)
+            if not chunk:
+                raise ValueError('Unexpected end of JSON array')
+            buffer, pos = chunk, 0
+            continue
+
+        if not opened:
+            if buffer[pos] != '[':
+                raise ValueError('Expected a JSON array')
+            opened = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element straddles the end of the buffer; keep the tail and read more
+            chunk = file.read(read_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield obj
+        pos = end
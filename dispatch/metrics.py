@@ -0,0 +1,147 @@
+"""
+Per-task Celery metrics, collected by the signal receivers in dispatch.signals and
+served in the Prometheus text format by the task_metrics view.
+
+Each finished task adds its runtime, queue wait, query count and the rows it reports
+touching (the int a task returns) to counters in the default cache. That is the Redis
+instance shared by the web and Celery processes in docker-compose, so the web app can
+expose what the workers measured. Counters are integers, kept in microseconds for
+durations, so Redis can increment them atomically.
+"""
+import logging
+import time
+from datetime import datetime
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'dispatch:task-metrics'
+
+# Upper bounds, in seconds, of the runtime histogram buckets
+RUNTIME_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, float('inf'))
+
+# Message header carrying the time a task was published, for queue wait
+SENT_AT_HEADER = 'dispatch_sent_at'
+
+COUNTERS = {
+    'runs': ('dispatch_task_runs_total', 'counter', 'Tasks finished, by outcome.'),
+    'queue_wait_us': ('dispatch_task_queue_wait_seconds_total', 'counter', 'Time tasks spent queued past their due time.'),
+    'queue_waits': ('dispatch_task_queue_waits_total', 'counter', 'Tasks whose queue wait was measured.'),
+    'queries': ('dispatch_task_queries_total', 'counter', 'Database queries issued by tasks.'),
+    'rows': ('dispatch_task_rows_total', 'counter', 'Rows tasks reported touching.'),
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class TaskRun:
+    """Measurements for one task execution, from task_prerun to task_postrun."""
+
+    def __init__(self, queue_wait):
+        self.started = time.perf_counter()
+        self.queue_wait = queue_wait
+        self.queries = QueryCounter()
+
+
+# task_id -> TaskRun for the tasks running in this worker process
+_runs = {}
+
+
+def metric_key(task_name, metric, label=''):
+    return f'{METRICS_KEY}:{task_name}:{metric}:{label}'
+
+
+def increment(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # First sample; a concurrent add wins the race, so fall back to incrementing it
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def queue_wait(request):
+    """Seconds the task waited between becoming due (sent, or its ETA) and starting, or None."""
+    sent_at = getattr(request, SENT_AT_HEADER, None) or (request.headers or {}).get(SENT_AT_HEADER)
+    if sent_at is None:
+        return None
+    due = float(sent_at)
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        due = max(due, eta.timestamp())
+    return max(time.time() - due, 0)
+
+
+def task_started(task_id, request):
+    run = TaskRun(queue_wait(request))
+    connection.execute_wrappers.append(run.queries)
+    _runs[task_id] = run
+
+
+def task_finished(task_id, task_name, retval, state):
+    run = _runs.pop(task_id, None)
+    if run is None:
+        return
+    runtime = time.perf_counter() - run.started
+    connection.execute_wrappers.remove(run.queries)
+    rows = retval if isinstance(retval, int) and not isinstance(retval, bool) else 0
+
+    increment(metric_key(task_name, 'runs', state or 'UNKNOWN'))
+    increment(metric_key(task_name, 'runtime_us'), round(runtime * 1e6))
+    increment(metric_key(task_name, 'queries'), run.queries.count)
+    increment(metric_key(task_name, 'rows'), rows)
+    if run.queue_wait is not None:
+        increment(metric_key(task_name, 'queue_wait_us'), round(run.queue_wait * 1e6))
+        increment(metric_key(task_name, 'queue_waits'))
+    bucket = next(bound for bound in RUNTIME_BUCKETS if runtime <= bound)
+    increment(metric_key(task_name, 'runtime_bucket', bucket))
+    logger.info(
+        'Task %s %s in %.3fs: %d queries, %d rows, queue wait %s',
+        task_name, state, runtime, run.queries.count, rows,
+        'unknown' if run.queue_wait is None else f'{run.queue_wait:.3f}s',
+    )
+
+
+def render_metrics(task_names):
+    """The counters of ``task_names`` in the Prometheus text exposition format."""
+    states = ('SUCCESS', 'FAILURE', 'RETRY', 'UNKNOWN')
+    keys = []
+    for task_name in task_names:
+        keys += [metric_key(task_name, 'runs', state) for state in states]
+        keys += [metric_key(task_name, metric) for metric in ('runtime_us', 'queue_wait_us', 'queue_waits', 'queries', 'rows')]
+        keys += [metric_key(task_name, 'runtime_bucket', bound) for bound in RUNTIME_BUCKETS]
+    values = cache.get_many(keys)
+
+    def value(task_name, metric, label=''):
+        return values.get(metric_key(task_name, metric, label), 0)
+
+    lines = []
+    for metric, (name, kind, help_text) in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for task_name in task_names:
+            if metric == 'runs':
+                lines += [f'{name}{{task="{task_name}",state="{state}"}} {value(task_name, metric, state)}' for state in states]
+            elif metric.endswith('_us'):
+                lines.append(f'{name}{{task="{task_name}"}} {value(task_name, metric) / 1e6}')
+            else:
+                lines.append(f'{name}{{task="{task_name}"}} {value(task_name, metric)}')
+
+    name = 'dispatch_task_runtime_seconds'
+    lines += [f'# HELP {name} Task runtime.', f'# TYPE {name} histogram']
+    for task_name in task_names:
+        cumulative = 0
+        for bound in RUNTIME_BUCKETS:
+            cumulative += value(task_name, 'runtime_bucket', bound)
+            le = '+Inf' if bound == float('inf') else bound
+            lines.append(f'{name}_bucket{{task="{task_name}",le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{task="{task_name}"}} {value(task_name, "runtime_us") / 1e6}')
+        lines.append(f'{name}_count{{task="{task_name}"}} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,27 @@
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_loaded_weight(apps, schema_editor):
+    Drone = apps.get_model('dispatch', 'Drone')
+    Medication = apps.get_model('dispatch', 'Medication')
+    medication_weight = Medication.objects.filter(drone=OuterRef('pk')).values('drone').annotate(total=Sum('weight')).values('total')
+    Drone.objects.update(loaded_weight=Coalesce(Subquery(medication_weight), Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0005_alter_medication_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='loaded_weight',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RunPython(backfill_loaded_weight, migrations.RunPython.noop),
+    ]
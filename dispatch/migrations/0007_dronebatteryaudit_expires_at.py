@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_expires_at(apps, schema_editor):
+    DroneBatteryAudit = apps.get_model('dispatch', 'DroneBatteryAudit')
+    durations = DroneBatteryAudit.objects.order_by().values_list('expiry_duration_minutes', flat=True).distinct()
+    for minutes in list(durations):
+        DroneBatteryAudit.objects.filter(expiry_duration_minutes=minutes).update(
+            expires_at=F('timestamp') + timedelta(minutes=minutes)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0006_drone_loaded_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dronebatteryaudit',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dronebatteryaudit',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
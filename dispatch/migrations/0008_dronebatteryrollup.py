@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0007_dronebatteryaudit_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneBatteryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('HOUR', 'Hour'), ('DAY', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('min_level', models.FloatField()),
+                ('max_level', models.FloatField()),
+                ('sum_level', models.FloatField()),
+                ('last_level', models.FloatField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('drone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='battery_rollups', to='dispatch.drone')),
+            ],
+            options={
+                'verbose_name_plural': 'Drone Battery Rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dronebatteryrollup',
+            constraint=models.UniqueConstraint(fields=('drone', 'period', 'bucket_start'), name='unique_drone_battery_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0008_dronebatteryrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dronebatteryaudit',
+            index=models.Index(fields=['timestamp', 'id'], name='audit_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dronebatteryaudit',
+            index=models.Index(fields=['drone', 'timestamp', 'id'], name='audit_drone_timestamp_id_idx'),
+        ),
+    ]
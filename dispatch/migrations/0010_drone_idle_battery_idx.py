@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0009_dronebatteryaudit_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drone',
+            index=models.Index(condition=models.Q(('state', 'IDLE')), fields=['battery_capacity'], name='drone_idle_battery_idx'),
+        ),
+    ]
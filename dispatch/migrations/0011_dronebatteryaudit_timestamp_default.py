@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0010_drone_idle_battery_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dronebatteryaudit',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
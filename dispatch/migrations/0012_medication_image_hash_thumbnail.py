@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0011_dronebatteryaudit_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='thumbnails'),
+        ),
+    ]
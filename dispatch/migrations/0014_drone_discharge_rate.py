@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:39
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0013_drone_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='discharge_rate',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispatch', '0014_drone_discharge_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='medication',
+            name='drone',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='medications', to='dispatch.drone'),
+        ),
+    ]
@@ -1,37 +1,149 @@
 from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-import re
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from dispatch.choices import MODEL_CHOICES, STATE_CHOICES
+from dispatch.events import drone_event, publish
+from dispatch.choices import LOADABLE_STATES, MODEL_CHOICES, ROLLUP_PERIOD_CHOICES, STATE_CHOICES, STATE_TRANSITIONS
+from dispatch.validators import medication_errors
 
 # Create your models here.
 
+def validate_transition(from_state, to_state):
+    if to_state not in STATE_TRANSITIONS.get(from_state, ()):
+        raise ValidationError(f'Drone cannot move from {from_state} to {to_state}')
+
+
+def attached_weight():
+    """Total weight of the medications attached to the drone being updated, for use in ``update()``."""
+    medication_weight = Medication.objects.filter(drone=OuterRef('pk')).values('drone').annotate(total=Sum('weight')).values('total')
+    return Coalesce(Subquery(medication_weight), Value(0.0))
+
+
+class DroneQuerySet(models.QuerySet):
+
+    def sync_loaded_weight(self):
+        """Recompute ``loaded_weight`` from the medications attached to each drone."""
+        return self.update(loaded_weight=attached_weight())
+
+    def transition(self, from_state, to_state):
+        """
+        Move the drones in this queryset that are in ``from_state`` to ``to_state`` in one
+        UPDATE and return how many moved. Drones in any other state are left alone.
+        Moving to IDLE unloads the drones: their medications are marked delivered and
+        detached first, and ``loaded_weight`` is recomputed from whatever is still
+        attached, so call it inside a transaction.
+        """
+        validate_transition(from_state, to_state)
+        drones = self.filter(state=from_state)
+        if to_state == 'IDLE':
+            Medication.objects.filter(drone__in=drones.values('pk')).update(drone=None, delivered_at=timezone.now())
+            return drones.update(state=to_state, loaded_weight=attached_weight())
+        return drones.update(state=to_state)
+
+
 class Drone(models.Model):
     serial_number = models.CharField(max_length=100, unique=True)
     model = models.CharField(max_length=20, choices=MODEL_CHOICES)
     weight_limit = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(500)])
     battery_capacity = models.FloatField(validators=[MinValueValidator(0), MaxValueValidator(100)])
     state = models.CharField(max_length=20, choices=STATE_CHOICES, default="IDLE")
+    loaded_weight = models.FloatField(default=0, validators=[MinValueValidator(0)])
+    # Last reported position in decimal degrees, set by telemetry; null until the drone reports one
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Battery percent lost per hour, fitted from battery history by refresh_battery_forecasts; null until enough history
+    discharge_rate = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0)])
+
+    objects = DroneQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.serial_number} - {self.model} - {self.state}"
 
+    def reserve_weight(self, weight):
+        """
+        Add ``weight`` to the drone's load in a single conditional UPDATE, so concurrent
+        loaders can never push it past ``weight_limit``. The UPDATE also takes the row lock,
+        so callers should issue it first in their transaction. The state moves to LOADED
+        when the drone is full and LOADING otherwise. Returns False, with the drone
+        refreshed, if it is no longer loadable or the weight no longer fits.
+        """
+        # The battery must still be at 25% at the end of the mission, as in mission_battery()
+        mission_drain = Coalesce(F('discharge_rate'), Value(0.0)) * (settings.MISSION_DURATION_MINUTES / 60)
+        reserved = Drone.objects.filter(
+            pk=self.pk,
+            state__in=LOADABLE_STATES,
+            battery_capacity__gte=Value(25.0) + mission_drain,
+            loaded_weight__lte=F('weight_limit') - weight,
+        ).update(
+            loaded_weight=F('loaded_weight') + weight,
+            state=Case(
+                When(loaded_weight__gte=F('weight_limit') - weight, then=Value('LOADED')),
+                default=Value('LOADING'),
+            ),
+        )
+        self.refresh_from_db(fields=['loaded_weight', 'state', 'battery_capacity', 'discharge_rate'])
+        if reserved:
+            self.publish_on_commit()
+        return bool(reserved)
+
+    def transition_to(self, state):
+        """
+        Move the drone to ``state`` with an UPDATE conditioned on the state it was read in,
+        so a concurrent change makes this one fail rather than be overwritten. Raises
+        ValidationError for an illegal transition. Returns False, with the drone
+        refreshed, if its state changed since it was read.
+        """
+        with transaction.atomic():
+            moved = Drone.objects.filter(pk=self.pk).transition(self.state, state)
+        self.refresh_from_db(fields=['state', 'loaded_weight'])
+        if moved:
+            self.publish_on_commit()
+        return bool(moved)
+
+    def publish_on_commit(self):
+        """Push the drone's current state to fleet event subscribers once the transaction commits."""
+        event = drone_event(self)
+        transaction.on_commit(lambda: publish('drone', event))
+
+    class Meta:
+        indexes = [
+            # Only idle drones are candidates for loading, so index just those by battery
+            models.Index(fields=['battery_capacity'], condition=Q(state='IDLE'), name='drone_idle_battery_idx'),
+        ]
+
     
 class Medication(models.Model):
     name = models.CharField(max_length=255)
     weight = models.FloatField()
     code = models.CharField(max_length=100, unique=True)
     image = models.ImageField(upload_to='photos', null=False, blank=False)
-    drone = models.ForeignKey(Drone, related_name='medications', on_delete=models.CASCADE)
+    # Cleared when the drone returns to IDLE; delivered_at records when that happened
+    drone = models.ForeignKey(Drone, related_name='medications', on_delete=models.CASCADE, null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # Filled in by the process_medication_images task; empty until the image is processed
+    image_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    thumbnail = models.ImageField(upload_to='thumbnails', blank=True)
+
+    # The drone the medication was read with, so moving it also resyncs the drone it left
+    loaded_drone_id = None
+    # Set by loaders that already added the weight with Drone.reserve_weight(), which skips the resync
+    weight_reserved = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        medication = super().from_db(db, field_names, values)
+        medication.loaded_drone_id = medication.__dict__.get('drone_id')
+        return medication
 
     def clean(self):
-        if not re.match(r'^[A-Za-z0-9_-]+$', self.name):
-            raise ValidationError('Invalid name')
-        if not re.match(r'^[A-Z0-9_]+$', self.code):
-            raise ValidationError('Invalid code')
+        errors = medication_errors(self.name, self.code)
+        if errors:
+            raise ValidationError(errors)
         
     def __str__(self):
         return self.name
@@ -41,15 +153,54 @@ class DroneBatteryAudit(models.Model):
     drone = models.ForeignKey(Drone, on_delete=models.CASCADE)
     battery_level = models.FloatField()
     task_name = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Telemetry supplies the time of the reading
     expiry_duration_minutes = models.IntegerField(default=5)  # Set expiry duration to 5 minutes
+    expires_at = models.DateTimeField(db_index=True)  # Stored so expiry can be found through an index
 
     @property
     def expiry_timestamp(self):
         return self.timestamp + timezone.timedelta(minutes=self.expiry_duration_minutes)
 
+    def save(self, *args, **kwargs):
+        # bulk_create skips save(), so batch writers must set expires_at themselves
+        if self.expires_at is None:
+            # From the reading's time, so a back-dated reading expires when it is due
+            self.expires_at = self.expiry_timestamp
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.drone.serial_number} - Battery Level: {self.battery_level}% - Task: {self.task_name}"
 
     class Meta:
-        verbose_name_plural = "Drone Battery Audits"
\ No newline at end of file
+        verbose_name_plural = "Drone Battery Audits"
+        indexes = [
+            # Back the (timestamp, id) cursor of the audit list, fleet-wide and per drone
+            models.Index(fields=['timestamp', 'id'], name='audit_timestamp_id_idx'),
+            models.Index(fields=['drone', 'timestamp', 'id'], name='audit_drone_timestamp_id_idx'),
+        ]
+
+
+class DroneBatteryRollup(models.Model):
+    """Battery samples for one drone compacted into an hourly or daily bucket."""
+    drone = models.ForeignKey(Drone, related_name='battery_rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=ROLLUP_PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField()
+    min_level = models.FloatField()
+    max_level = models.FloatField()
+    sum_level = models.FloatField()  # Kept instead of the average so buckets can keep absorbing samples
+    last_level = models.FloatField()
+    last_timestamp = models.DateTimeField()
+
+    @property
+    def avg_level(self):
+        return self.sum_level / self.sample_count
+
+    def __str__(self):
+        return f"{self.drone_id} - {self.period} {self.bucket_start} - Avg: {self.avg_level:.1f}%"
+
+    class Meta:
+        verbose_name_plural = "Drone Battery Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['drone', 'period', 'bucket_start'], name='unique_drone_battery_rollup_bucket'),
+        ]
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DroneBatteryAuditCursorPagination(CursorPagination):
+    # Newest first; id breaks ties between audits written in the same snapshot
+    ordering = ('-timestamp', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
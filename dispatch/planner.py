@@ -0,0 +1,81 @@
+"""
+Batch dispatch planning: pack pending medications onto loadable drones.
+
+plan_dispatch() runs first-fit-decreasing: medications are placed heaviest first
+into the first drone, in order of decreasing free capacity, that can still carry
+them. A max segment tree over the drones' free capacity finds that drone in
+O(log drones), so thousands of medications plan in milliseconds.
+"""
+from dispatch.fleet import get_fleet
+
+
+class CapacityTree:
+    """Max segment tree over free capacities answering "first slot that fits" queries."""
+
+    def __init__(self, capacities):
+        self.size = 1
+        while self.size < len(capacities):
+            self.size *= 2
+        self.tree = [-1.0] * (2 * self.size)
+        self.tree[self.size:self.size + len(capacities)] = capacities
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def first_fit(self, weight):
+        """Return the lowest slot index with at least ``weight`` free, or None."""
+        if self.tree[1] < weight:
+            return None
+        node = 1
+        while node < self.size:
+            node = 2 * node if self.tree[2 * node] >= weight else 2 * node + 1
+        return node - self.size
+
+    def consume(self, index, weight):
+        node = index + self.size
+        self.tree[node] -= weight
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+
+def loadable_drones(battery_floor=25):
+    """
+    Drones that can take more medications and are forecast to stay at ``battery_floor``
+    through a mission, as (id, serial_number, weight_limit, loaded_weight) rows.
+    """
+    return get_fleet().loadable(battery_floor)
+
+
+def plan_dispatch(medications, drones):
+    """
+    Assign ``medications`` (dicts with ``code`` and ``weight``) to ``drones`` (rows from
+    loadable_drones()) with first-fit-decreasing. Returns ``(assignments, unassigned)``:
+    a list of per-drone plans for the drones that received medications, and the
+    medications that fit nowhere.
+    """
+    drones = sorted(drones, key=lambda drone: drone[2] - drone[3], reverse=True)
+    tree = CapacityTree([weight_limit - loaded_weight for _, _, weight_limit, loaded_weight in drones])
+    loads = {}
+    unassigned = []
+
+    for medication in sorted(medications, key=lambda medication: medication['weight'], reverse=True):
+        index = tree.first_fit(medication['weight'])
+        if index is None:
+            unassigned.append(medication)
+            continue
+        tree.consume(index, medication['weight'])
+        loads.setdefault(index, []).append(medication)
+
+    assignments = []
+    for index in sorted(loads):
+        drone_id, serial_number, weight_limit, loaded_weight = drones[index]
+        planned_weight = sum(medication['weight'] for medication in loads[index])
+        assignments.append({
+            'drone_id': drone_id,
+            'serial_number': serial_number,
+            'medications': [medication['code'] for medication in loads[index]],
+            'planned_weight': planned_weight,
+            'remaining_weight': weight_limit - loaded_weight - planned_weight,
+        })
+    return assignments, unassigned
@@ -0,0 +1,176 @@
+"""
+Opt-in SQL profiling of API requests, enabled with QUERY_PROFILING=True.
+
+QueryProfilingMiddleware wraps a sample of requests (QUERY_PROFILING_SAMPLE_RATE) in a
+database execute wrapper that times every statement. Each profiled request is logged
+with its query count, database time, duplicate statements and slowest statements, and
+the totals are returned in X-DB-* response headers. Requests over the slow thresholds
+are kept in the default cache, shared by every web process, which holds the
+QUERY_PROFILING_BUFFER_SIZE worst by database time for staff to browse at
+/admin/query-profiles/. Requests that are not sampled skip all of it.
+"""
+import logging
+import random
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILES_KEY = 'dispatch:query-profiles'
+LOCK_KEY = f'{PROFILES_KEY}:lock'
+
+# Held only while a slot is re-checked and written; expires on its own if a process dies holding it
+LOCK_TIMEOUT = 5
+LOCK_ATTEMPTS = 3
+LOCK_WAIT = 0.01
+
+
+class QueryProfile:
+    """Statements one request ran, collected by calling the profile as an execute wrapper."""
+
+    def __init__(self):
+        self.statements = []  # (sql, params, seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, params, time.perf_counter() - started))
+
+    def summary(self, request, response, duration):
+        """The request's profile as a JSON-serializable dict."""
+        # Duplicates repeat the same statement with the same parameters; similar statements
+        # only share the SQL, which is the pattern of a query issued once per row
+        duplicates = Counter((sql, repr(params)) for sql, params, _ in self.statements)
+        similar = Counter(sql for sql, _, _ in self.statements)
+        slowest = sorted(self.statements, key=lambda statement: statement[2], reverse=True)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'finished_at': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'query_count': len(self.statements),
+            'db_time_ms': round(sum(seconds for _, _, seconds in self.statements) * 1000, 2),
+            'duplicate_queries': sum(count - 1 for count in duplicates.values()),
+            'similar_queries': sum(count - 1 for count in similar.values()),
+            'most_repeated': [
+                {'sql': sql, 'count': count} for sql, count in similar.most_common(settings.QUERY_PROFILING_TOP_STATEMENTS)
+                if count > 1
+            ],
+            'slowest': [
+                {'sql': sql, 'time_ms': round(seconds * 1000, 2)}
+                for sql, _, seconds in slowest[:settings.QUERY_PROFILING_TOP_STATEMENTS]
+            ],
+        }
+
+
+def is_slow(profile):
+    return (profile['db_time_ms'] >= settings.QUERY_PROFILING_SLOW_REQUEST_MS
+            or profile['query_count'] >= settings.QUERY_PROFILING_MAX_QUERIES)
+
+
+def profile_slots():
+    return [f'{PROFILES_KEY}:{slot}' for slot in range(settings.QUERY_PROFILING_BUFFER_SIZE)]
+
+
+def replaceable_slot(profile):
+    """The slot ``profile`` should go in: an empty one, else the one with the least database time if ``profile`` beats it."""
+    stored = cache.get_many(profile_slots())
+    empty = [key for key in profile_slots() if key not in stored]
+    if empty:
+        return empty[0]
+    key = min(stored, key=lambda key: stored[key]['db_time_ms'])
+    return key if profile['db_time_ms'] > stored[key]['db_time_ms'] else None
+
+
+def record_profile(profile):
+    """
+    Keep ``profile`` if it is among the QUERY_PROFILING_BUFFER_SIZE worst by database time,
+    replacing the least slow one kept. Most slow requests lose the first comparison and
+    write nothing; the rest re-check and replace under a short lock shared through the
+    cache, so concurrent processes never overwrite each other's worse profile.
+    """
+    if replaceable_slot(profile) is None:
+        return
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(LOCK_KEY, True, timeout=LOCK_TIMEOUT):
+            try:
+                key = replaceable_slot(profile)
+                if key is not None:
+                    cache.set(key, profile, timeout=None)
+            finally:
+                cache.delete(LOCK_KEY)
+            return
+        time.sleep(LOCK_WAIT)
+    logger.debug('Dropped a slow request profile: the profile buffer stayed locked')
+
+
+def recorded_profiles():
+    """The buffered profiles, worst database time first."""
+    return sorted(cache.get_many(profile_slots()).values(), key=lambda profile: profile['db_time_ms'], reverse=True)
+
+
+def clear_profiles():
+    cache.delete_many([LOCK_KEY, *profile_slots()])
+
+
+def report(request, response, profile, started):
+    summary = profile.summary(request, response, time.perf_counter() - started)
+    response['X-DB-Query-Count'] = summary['query_count']
+    response['X-DB-Time-Ms'] = summary['db_time_ms']
+    response['X-DB-Duplicate-Queries'] = summary['duplicate_queries']
+    logger.info(
+        '%s %s: %d queries in %.2f ms, %d duplicate, %d similar',
+        summary['method'], summary['path'], summary['query_count'], summary['db_time_ms'],
+        summary['duplicate_queries'], summary['similar_queries'], extra={'query_profile': summary},
+    )
+    if is_slow(summary):
+        record_profile(summary)
+
+
+class QueryProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.QUERY_PROFILING_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+        report(request, response, profile, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        profile = QueryProfile()
+        started = time.perf_counter()
+        # Async views query through sync_to_async, on the connection of the thread-sensitive
+        # executor rather than the event loop's, so the wrapper is installed there
+        await sync_to_async(lambda: connection.execute_wrappers.append(profile))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(profile))()
+        report(request, response, profile, started)
+        return response
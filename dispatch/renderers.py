@@ -0,0 +1,16 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class PrerenderedJSONRenderer(JSONRenderer):
+    """
+    Sends the bytes a view attached to the response as ``prerendered_json`` instead of
+    encoding ``data`` again, so a body built from the fleet snapshot is encoded once per
+    snapshot rather than once per request. Indented output is still rendered normally.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        content = getattr(renderer_context.get('response'), 'prerendered_json', None)
+        if content is None or self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content
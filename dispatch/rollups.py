@@ -0,0 +1,83 @@
+"""
+Compaction of raw battery samples into per-drone hourly and daily rollups.
+
+delete_expired_audit_logs folds every expired DroneBatteryAudit chunk into
+DroneBatteryRollup buckets before deleting it, so history outlives the raw
+samples while the rollup table only grows with drones x buckets.
+"""
+from datetime import timezone as dt_timezone
+from dispatch.choices import ROLLUP_PERIOD_CHOICES
+from dispatch.models import DroneBatteryRollup
+
+ROLLUP_UPDATE_FIELDS = ['sample_count', 'min_level', 'max_level', 'sum_level', 'last_level', 'last_timestamp']
+
+
+def bucket_start(timestamp, period):
+    """Truncate ``timestamp`` to the start of its UTC hour or day."""
+    timestamp = timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if period == 'DAY':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def roll_up_battery_samples(samples):
+    """
+    Fold ``(drone_id, battery_level, timestamp)`` samples into their hourly and daily
+    buckets, merging with buckets that already exist. Call inside a transaction.
+    Returns the number of buckets written.
+    """
+    buckets = {}
+    for drone_id, level, timestamp in samples:
+        for period, _ in ROLLUP_PERIOD_CHOICES:
+            key = (drone_id, period, bucket_start(timestamp, period))
+            rollup = buckets.get(key)
+            if rollup is None:
+                buckets[key] = DroneBatteryRollup(
+                    drone_id=drone_id, period=period, bucket_start=key[2], sample_count=1,
+                    min_level=level, max_level=level, sum_level=level,
+                    last_level=level, last_timestamp=timestamp,
+                )
+            else:
+                merge_sample(rollup, level, timestamp)
+
+    if not buckets:
+        return 0
+
+    existing = DroneBatteryRollup.objects.select_for_update().filter(
+        drone_id__in={key[0] for key in buckets},
+        bucket_start__in={key[2] for key in buckets},
+    )
+    for stored in existing:
+        rollup = buckets.get((stored.drone_id, stored.period, stored.bucket_start))
+        if rollup is not None:
+            merge_rollup(rollup, stored)
+
+    DroneBatteryRollup.objects.bulk_create(
+        buckets.values(),
+        update_conflicts=True,
+        unique_fields=['drone', 'period', 'bucket_start'],
+        update_fields=ROLLUP_UPDATE_FIELDS,
+    )
+    return len(buckets)
+
+
+def merge_sample(rollup, level, timestamp):
+    """Fold one raw sample into the pending ``rollup``."""
+    rollup.sample_count += 1
+    rollup.min_level = min(rollup.min_level, level)
+    rollup.max_level = max(rollup.max_level, level)
+    rollup.sum_level += level
+    if timestamp >= rollup.last_timestamp:
+        rollup.last_level = level
+        rollup.last_timestamp = timestamp
+
+
+def merge_rollup(rollup, stored):
+    """Fold the already stored bucket ``stored`` into the pending ``rollup``."""
+    rollup.sample_count += stored.sample_count
+    rollup.min_level = min(rollup.min_level, stored.min_level)
+    rollup.max_level = max(rollup.max_level, stored.max_level)
+    rollup.sum_level += stored.sum_level
+    if stored.last_timestamp > rollup.last_timestamp:
+        rollup.last_level = stored.last_level
+        rollup.last_timestamp = stored.last_timestamp
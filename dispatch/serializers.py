@@ -1,22 +1,159 @@
+import math
+import posixpath
+from django.core.exceptions import SuspiciousFileOperation
 from rest_framework import serializers
-from .models import Drone, DroneBatteryAudit, Medication
+from .choices import STATE_CHOICES, STATE_TRANSITIONS
+from .locator import MAX_NEAREST
+from .models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from .validators import CODE_TAKEN_ERROR, medication_errors, validate_medications
 from django.db.models import Sum
 
 
+class FiniteFloatField(serializers.FloatField):
+    # float() accepts 'nan' and 'inf', and NaN passes the min and max checks
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('invalid')
+        return value
+
+
 class DroneSerializer(serializers.ModelSerializer):
     medications = serializers.StringRelatedField(many=True, read_only=True)
     
     class Meta:
         model = Drone
         fields = '__all__'
+        read_only_fields = ('loaded_weight', 'discharge_rate')
+
+    def validate(self, data):
+        if (data.get('latitude') is None) != (data.get('longitude') is None):
+            raise serializers.ValidationError('Send latitude and longitude together.')
+        return data
+
+    def create(self, validated_data):
+        drone = super().create(validated_data)
+        # A new drone has no medications; prime the prefetch cache so rendering them costs no query
+        drone._prefetched_objects_cache = {'medications': Medication.objects.none()}
+        return drone
         
 
 class MedicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Medication
         fields = '__all__'
+        # Set by the image processing task and by drones returning to IDLE
+        read_only_fields = ('image_hash', 'thumbnail', 'delivered_at')
+
+    def validate(self, data):
+        # The rules of Medication.clean(), which DRF does not call; partial updates keep stored values
+        name = data.get('name', getattr(self.instance, 'name', None))
+        code = data.get('code', getattr(self.instance, 'code', None))
+        errors = medication_errors(name, code)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
+
+class LoadMedicationSerializer(MedicationSerializer):
+    # The view already holds the drone and passes it to save(), sparing a second lookup
+    class Meta(MedicationSerializer.Meta):
+        read_only_fields = ('drone', *MedicationSerializer.Meta.read_only_fields)
+
+    def create(self, validated_data):
+        # LoadMedicationView has reserved the weight on the drone, so the save need not resync it
+        medication = Medication(**validated_data)
+        medication.weight_reserved = True
+        medication.save()
+        return medication
         
         
+class BulkMedicationItemSerializer(serializers.ModelSerializer):
+    # Batch payloads reference images already in storage, and code uniqueness is
+    # checked once for the whole batch by BulkLoadMedicationSerializer.
+    # The batch total is reserved at once, so a negative weight would offset an overweight item
+    weight = FiniteFloatField(min_value=0, max_value=500)
+    code = serializers.CharField(max_length=100)
+    image = serializers.CharField(max_length=100)
+
+    class Meta:
+        model = Medication
+        fields = ('name', 'weight', 'code', 'image')
+
+
+def stored_image_error(name):
+    """Why batch items may not reference ``name``, or None if it is an uploaded image in storage."""
+    field = Medication._meta.get_field('image')
+    if posixpath.normpath(name) != name or not name.startswith(f'{field.upload_to}/'):
+        return f'Enter the path of an uploaded image under {field.upload_to}/.'
+    try:
+        if field.storage.exists(name):
+            return None
+    except SuspiciousFileOperation:
+        pass
+    return 'No uploaded image has this path.'
+
+
+class BulkLoadMedicationSerializer(serializers.Serializer):
+    medications = BulkMedicationItemSerializer(many=True, allow_empty=False)
+
+    def validate_medications(self, value):
+        errors = validate_medications(value) or [{} for _ in value]
+        codes = [item['code'] for item in value]
+        seen = set()
+        taken = set(Medication.objects.filter(code__in=codes).values_list('code', flat=True))
+        for code, error in zip(codes, errors):
+            # Added to any format error validate_medications() already reported for the code
+            if code in taken:
+                error.setdefault('code', []).append(CODE_TAKEN_ERROR)
+            elif code in seen:
+                error.setdefault('code', []).append('Duplicate code in this batch.')
+            seen.add(code)
+
+        # Each distinct image is looked up once, however many items share it
+        images = {item['image'] for item in value}
+        image_errors = {image: stored_image_error(image) for image in images}
+        for item, error in zip(value, errors):
+            if image_errors[item['image']]:
+                error['image'] = [image_errors[item['image']]]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return value
+        
+
+class PlannedMedicationSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=100)
+    weight = serializers.FloatField(min_value=0, max_value=500)
+
+
+class DispatchPlanSerializer(serializers.Serializer):
+    medications = PlannedMedicationSerializer(many=True, allow_empty=False)
+    battery_floor = serializers.FloatField(min_value=25, max_value=100, default=25)
+
+
+class NearestDronesSerializer(serializers.Serializer):
+    latitude = FiniteFloatField(min_value=-90, max_value=90)
+    longitude = FiniteFloatField(min_value=-180, max_value=180)
+    weight = FiniteFloatField(min_value=0, max_value=500, default=0)
+    k = serializers.IntegerField(min_value=1, max_value=MAX_NEAREST, default=5)
+
+
+class DroneTransitionSerializer(serializers.Serializer):
+    state = serializers.ChoiceField(choices=STATE_CHOICES)
+
+
+class BulkDroneTransitionSerializer(serializers.Serializer):
+    drones = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    from_state = serializers.ChoiceField(choices=STATE_CHOICES)
+    to_state = serializers.ChoiceField(choices=STATE_CHOICES)
+
+    def validate(self, data):
+        if data['to_state'] not in STATE_TRANSITIONS[data['from_state']]:
+            raise serializers.ValidationError(f"Drone cannot move from {data['from_state']} to {data['to_state']}")
+        return data
+
+
 class DroneLodedMedicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Drone
@@ -33,4 +170,12 @@ class AvailableDroneSerializer(serializers.ModelSerializer):
 class DroneBatteryAuditSerializer(serializers.ModelSerializer):
     class Meta:
         model = DroneBatteryAudit
-        fields = ('drone', 'battery_level', 'timestamp')
\ No newline at end of file
+        fields = ('drone', 'battery_level', 'timestamp')
+
+
+class DroneBatteryRollupSerializer(serializers.ModelSerializer):
+    avg_level = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = DroneBatteryRollup
+        fields = ('period', 'bucket_start', 'sample_count', 'min_level', 'max_level', 'avg_level', 'last_level', 'last_timestamp')
@@ -1,11 +1,74 @@
-from django.db.models.signals import post_save, post_delete
+import time
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from dispatch.models import DroneBatteryAudit
-from dispatch.tasks import delete_expired_audit_logs
+from dispatch.caching import drone_rows_changed
+from dispatch import metrics
+from dispatch.events import publish, publish_battery_levels
+from dispatch.models import Drone, DroneBatteryAudit, Medication
+from dispatch.tasks import schedule_delete_expired_audit_logs
+from dispatch.telemetry import serial_ids
 
 @receiver(post_save, sender=DroneBatteryAudit)
-@receiver(post_delete, sender=DroneBatteryAudit)
-def schedule_delete_expired_logs(sender, instance, **kwargs):
-    # Schedule the task to delete expired logs
-    delete_expired_audit_logs.apply_async()
+def schedule_delete_expired_logs(sender, instance, created, **kwargs):
+    # Schedule the task to delete expired logs once the audit is committed; a pending run absorbs repeat calls
+    if created:
+        transaction.on_commit(schedule_delete_expired_audit_logs)
+
+@receiver(post_save, sender=DroneBatteryAudit)
+def publish_battery_audit(sender, instance, created, **kwargs):
+    if created:
+        levels = {instance.drone_id: instance.battery_level}
+        transaction.on_commit(lambda: publish_battery_levels(levels))
+
+@receiver(post_save, sender=Drone)
+@receiver(post_delete, sender=Drone)
+def invalidate_cached_drones(sender, instance, **kwargs):
+    # Cached drone reads must not outlive the change
+    drone_rows_changed([instance.pk])
+
+@receiver(post_save, sender=Drone)
+def publish_saved_drone(sender, instance, **kwargs):
+    instance.publish_on_commit()
+
+@receiver(post_delete, sender=Drone)
+def publish_deleted_drone(sender, instance, **kwargs):
+    event = {'id': instance.pk}
+    transaction.on_commit(lambda: publish('removed', event))
+
+@receiver(post_save, sender=Medication)
+@receiver(post_delete, sender=Medication)
+def sync_drone_loaded_weight(sender, instance, raw=False, **kwargs):
+    # loaded_weight is the weight of the attached medications; correct the drone a moved medication left too
+    if raw:
+        return
+    drone_ids = {instance.drone_id, instance.loaded_drone_id} - {None}
+    instance.loaded_drone_id = instance.drone_id
+    if instance.weight_reserved:
+        instance.weight_reserved = False
+        return
+    if drone_ids:
+        Drone.objects.filter(pk__in=drone_ids).sync_loaded_weight()
+        drone_rows_changed(list(drone_ids))
+
+@receiver(post_delete, sender=Drone)
+def forget_serial_number(sender, instance, **kwargs):
+    # Other processes find out from the telemetry UPDATE row count instead
+    serial_ids.forget([instance.serial_number])
+
+@before_task_publish.connect
+def stamp_task_sent_at(headers=None, **kwargs):
+    # Lets the worker measure how long the task sat in the queue
+    headers[metrics.SENT_AT_HEADER] = time.time()
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    if task.name.startswith('dispatch.'):
+        metrics.task_started(task_id, task.request)
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, retval=None, state=None, **kwargs):
+    if task.name.startswith('dispatch.'):
+        metrics.task_finished(task_id, task.name, retval, state)
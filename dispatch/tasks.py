@@ -1,29 +1,118 @@
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
+from . import forecast, images
 from .models import Drone, DroneBatteryAudit
+from .rollups import roll_up_battery_samples
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-@shared_task(name='dispatch.tasks.delete_expired_audit_logs')
-def delete_expired_audit_logs():
-    expiry_threshold = timezone.now() - timezone.timedelta(minutes=4)  # Expire logs older than 4 minutes
-    expired_logs = DroneBatteryAudit.objects.filter(timestamp__lte=expiry_threshold)
-    count = expired_logs.count()
-    expired_logs.delete()
+# Cache key marking that a delete_expired_audit_logs run is already queued
+AUDIT_CLEANUP_PENDING_KEY = 'dispatch:delete-expired-audit-logs:pending'
+
+
+def schedule_delete_expired_audit_logs():
+    """
+    Queue delete_expired_audit_logs unless a run is already pending, so any number of audit
+    writes within the debounce window coalesce into a single cleanup. The pending flag lives
+    in the shared cache and expires on its own if the queued run is lost.
+    Returns True if a run was queued.
+    """
+    countdown = settings.AUDIT_CLEANUP_DEBOUNCE_SECONDS
+    if not cache.add(AUDIT_CLEANUP_PENDING_KEY, True, timeout=countdown * 2 + 60):
+        return False
+    delete_expired_audit_logs.apply_async(countdown=countdown)
+    return True
+
+
+@shared_task(name='dispatch.tasks.delete_expired_audit_logs', ignore_result=not settings.STORE_TASK_RESULTS)
+def delete_expired_audit_logs(chunk_size=None):
+    # Audits written from here on may schedule the next run
+    cache.delete(AUDIT_CLEANUP_PENDING_KEY)
+
+    chunk_size = chunk_size or settings.AUDIT_CLEANUP_CHUNK_SIZE
+    expired_logs = DroneBatteryAudit.objects.filter(expires_at__lte=timezone.now())
+    count = 0
+    last_pk = 0
+
+    # Delete in bounded primary key ranges with raw DELETEs: no model instances are built,
+    # no delete signals fire, and each chunk commits on its own instead of locking the table.
+    # Each chunk is compacted into the battery rollups in the same transaction before it goes.
+    while True:
+        started = time.perf_counter()
+        with transaction.atomic():
+            samples = list(
+                expired_logs.filter(pk__gt=last_pk).order_by('pk').select_for_update()
+                .values_list('pk', 'drone_id', 'battery_level', 'timestamp')[:chunk_size]
+            )
+            if not samples:
+                break
+            roll_up_battery_samples(sample[1:] for sample in samples)
+            deleted = expired_logs.filter(pk__gt=last_pk, pk__lte=samples[-1][0])._raw_delete(expired_logs.db)
+        last_pk = samples[-1][0]
+        count += deleted
+        logger.info(f"Deleted {deleted} expired audit logs up to id {last_pk} in {(time.perf_counter() - started) * 1000:.1f} ms.")
+
     logger.info(f"Deleted {count} expired audit logs.")
+    return count
+
+def schedule_image_processing(medication_ids, remove_replaced=False):
+    """
+    Queue process_medication_images for ``medication_ids``. Call it once they are committed.
+    A broker outage is logged rather than raised, since the medications are already saved;
+    the periodic run picks up whatever was missed.
+    """
+    try:
+        process_medication_images.delay(list(medication_ids), remove_replaced)
+    except Exception as e:
+        logger.warning(f'Could not queue image processing for medications {medication_ids}: {e}')
 
-@shared_task(name='dispatch.tasks.perform_check_drone_battery')
-def perform_check_drone_battery():
-    drones = Drone.objects.all()
+
+@shared_task(name='dispatch.tasks.process_medication_images', ignore_result=not settings.STORE_TASK_RESULTS)
+def process_medication_images(medication_ids=None, remove_replaced=False):
+    # Without ids this is the periodic sweep over medications whose images were never processed
+    limit = None if medication_ids is not None else settings.MEDICATION_IMAGE_BATCH_SIZE
+    return images.process_medication_images(medication_ids, remove_replaced, limit)
+
+
+@shared_task(name='dispatch.tasks.refresh_battery_forecasts', ignore_result=not settings.STORE_TASK_RESULTS)
+def refresh_battery_forecasts():
+    started = time.perf_counter()
+    fitted, updated = forecast.refresh_forecasts()
+    logger.info(f"Fitted {fitted} discharge rates, {updated} changed, in {(time.perf_counter() - started) * 1000:.1f} ms.")
+    return updated
+
+
+@shared_task(name='dispatch.tasks.perform_check_drone_battery', ignore_result=not settings.STORE_TASK_RESULTS)
+def perform_check_drone_battery(batch_size=None):
+    batch_size = batch_size or settings.BATTERY_AUDIT_BATCH_SIZE
     current_task_name = perform_check_drone_battery.name  # Get current task name
-    for drone in drones:
-        logger.info(f'Drone {drone.serial_number} battery level: {drone.battery_capacity}')
-        # Save battery audit log including task name
-        audit_log = DroneBatteryAudit.objects.create(
-            drone=drone,
-            battery_level=drone.battery_capacity,
+
+    # Stream (id, battery) pairs and insert the snapshot in batches; bulk_create skips the per-row save signals
+    drones = Drone.objects.order_by().values_list('id', 'battery_capacity').iterator(chunk_size=batch_size)
+    expires_at = timezone.now() + timezone.timedelta(minutes=5)
+    created = 0
+    batch = []
+    for drone_id, battery_capacity in drones:
+        batch.append(DroneBatteryAudit(
+            drone_id=drone_id,
+            battery_level=battery_capacity,
             task_name=current_task_name,
-            expiry_duration_minutes=5  # Set expiry duration in minutes
-        )
-        logger.info(f"Saved audit log for Task '{current_task_name}' - {audit_log}")
+            expiry_duration_minutes=5,  # Set expiry duration in minutes
+            expires_at=expires_at
+        ))
+        if len(batch) >= batch_size:
+            DroneBatteryAudit.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        DroneBatteryAudit.objects.bulk_create(batch)
+        created += len(batch)
+
+    logger.info(f"Saved {created} battery audit logs for Task '{current_task_name}'")
+    transaction.on_commit(schedule_delete_expired_audit_logs)
+    return created
@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from dispatch.management.commands.importdatajson import iter_json_array
+from dispatch.models import Drone, DroneBatteryAudit, Medication
+
+
+class ExportDataJsonCommandTest(TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.drone = Drone.objects.create(
+            serial_number='EXP-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+        self.old_audit = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test')
+        self.new_audit = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=65.0, task_name='test')
+        DroneBatteryAudit.objects.filter(pk=self.old_audit.pk).update(timestamp=timezone.now() - timezone.timedelta(days=2))
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('exportdatajson', '--output-dir', self.output_dir, *args, stdout=out)
+        return out.getvalue()
+
+    def test_export_fixture_format(self):
+        output = self.export('--models', 'drones')
+
+        with open(os.path.join(self.output_dir, 'drones.json')) as file:
+            drones = json.load(file)
+        self.assertEqual([drone['fields']['serial_number'] for drone in drones], ['EXP-001'])
+        self.assertIn('rows/sec', output)
+
+    def test_export_ndjson_gzip_since(self):
+        since = (timezone.now() - timezone.timedelta(days=1)).isoformat()
+        self.export('--models', 'audits', '--format', 'jsonl', '--compress', 'gzip', '--since', since)
+
+        with gzip.open(os.path.join(self.output_dir, 'drone_battery_audits.jsonl.gz'), 'rt') as file:
+            audits = [json.loads(line) for line in file]
+        self.assertEqual([audit['pk'] for audit in audits], [self.new_audit.pk])
+
+
+class ImportDataJsonCommandTest(TestCase):
+
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        # Fixture pks deliberately differ from the ids this database will assign
+        self.drones = [
+            {'model': 'dispatch.drone', 'pk': 41, 'fields': {'serial_number': 'IMP-001', 'model': 'LIGHTWEIGHT', 'weight_limit': 200, 'battery_capacity': 60.0, 'state': 'LOADING'}},
+            {'model': 'dispatch.drone', 'pk': 42, 'fields': {'serial_number': 'IMP-002', 'model': 'HEAVYWEIGHT', 'weight_limit': 500, 'battery_capacity': 90.0, 'state': 'IDLE'}},
+        ]
+        self.medications = [
+            {'model': 'dispatch.medication', 'pk': 7, 'fields': {'name': 'Med-A', 'weight': 50.0, 'code': 'IMP_A', 'image': 'photos/omega.jpeg', 'drone': 41}},
+            {'model': 'dispatch.medication', 'pk': 8, 'fields': {'name': 'Med-B', 'weight': 25.0, 'code': 'IMP_B', 'image': 'photos/omega.jpeg', 'drone': 41}},
+        ]
+        with open(os.path.join(self.input_dir, 'drones.json'), 'w') as file:
+            json.dump(self.drones, file, indent=4)
+        with gzip.open(os.path.join(self.input_dir, 'medications.jsonl.gz'), 'wt') as file:
+            file.writelines(json.dumps(medication) + '\n' for medication in self.medications)
+
+    def tearDown(self):
+        shutil.rmtree(self.input_dir, ignore_errors=True)
+
+    def import_data(self):
+        call_command('importdatajson', '--input-dir', self.input_dir, '--batch-size', '1', stdout=StringIO())
+
+    def test_import_remaps_drones_and_is_idempotent(self):
+        self.import_data()
+        self.import_data()
+
+        self.assertEqual(Drone.objects.count(), 2)
+        self.assertEqual(Medication.objects.count(), 2)
+        drone = Drone.objects.get(serial_number='IMP-001')
+        self.assertEqual(set(drone.medications.values_list('code', flat=True)), {'IMP_A', 'IMP_B'})
+        self.assertEqual(drone.loaded_weight, 75.0)
+
+    def test_import_updates_existing_rows(self):
+        Drone.objects.create(serial_number='IMP-002', model='LIGHTWEIGHT', weight_limit=100, battery_capacity=10.0, state='IDLE')
+        self.import_data()
+
+        drone = Drone.objects.get(serial_number='IMP-002')
+        self.assertEqual(drone.model, 'HEAVYWEIGHT')
+        self.assertEqual(drone.battery_capacity, 90.0)
+
+    def test_iter_json_array_across_read_boundaries(self):
+        with open(os.path.join(self.input_dir, 'drones.json')) as file:
+            self.assertEqual(list(iter_json_array(file, read_size=5)), self.drones)
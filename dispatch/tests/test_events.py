@@ -0,0 +1,59 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from django.urls import reverse
+from dispatch.events import broker, encode_event, publish, QUEUE_SIZE, RESYNC_FRAME
+from dispatch.models import Drone
+
+
+class FleetEventsTest(TestCase):
+
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='EVT-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=80.0,
+            state='IDLE'
+        )
+
+    def transition(self):
+        # The transition's savepoint, UPDATE and refresh; fan-out adds nothing per subscriber
+        with self.assertNumQueries(4), self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.drone.transition_to('LOADING'))
+
+    async def test_thousand_subscribers_share_one_publish_without_queries(self):
+        subscriptions = [broker.subscribe() for _ in range(1000)]
+        try:
+            await sync_to_async(self.transition)()
+            await asyncio.sleep(0)  # Let the loop run the delivery scheduled from the sync thread
+
+            frames = {subscription.queue.get_nowait() for subscription in subscriptions}
+            self.assertEqual(len(frames), 1)
+            frame = frames.pop().decode()
+            self.assertTrue(frame.startswith('event: drone\n'))
+            self.assertIn('"state": "LOADING"', frame)
+        finally:
+            for subscription in subscriptions:
+                broker.unsubscribe(subscription)
+
+    async def test_slow_subscriber_is_told_to_resync(self):
+        subscription = broker.subscribe()
+        try:
+            for index in range(QUEUE_SIZE + 5):
+                publish('battery', {'levels': [{'id': 1, 'battery_level': index}]})
+            frames = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+            self.assertEqual(len(frames), QUEUE_SIZE)
+            self.assertIs(frames[-1], RESYNC_FRAME)
+        finally:
+            broker.unsubscribe(subscription)
+
+    async def test_event_stream_endpoint(self):
+        response = await self.async_client.get(reverse('fleet_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b': connected\n\n')
+
+        publish('removed', {'id': 7})
+        self.assertEqual(await anext(stream), encode_event('removed', {'id': 7}))
+        await stream.aclose()
@@ -0,0 +1,116 @@
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from dispatch.caching import get_available_drones, invalidate_drone_caches
+from dispatch.fleet import FLEET_VERSION_KEY, DatabaseFleet, aget_drone, change_log_key, forecast_q, get_fleet
+from dispatch.models import Drone
+
+
+@override_settings(FLEET_SNAPSHOT=True)
+class FleetSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.drones = [
+            Drone.objects.create(
+                serial_number=f'FLT-{index:03d}',
+                model='LIGHTWEIGHT',
+                weight_limit=200,
+                battery_capacity=80.0,
+                state='IDLE'
+            )
+            for index in range(3)
+        ]
+        get_fleet()
+
+    def test_unchanged_fleet_is_served_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(get_fleet().get(self.drones[0].id).battery_capacity, 80.0)
+
+    def test_changed_drones_are_replayed(self):
+        Drone.objects.filter(pk=self.drones[1].pk).update(battery_capacity=10.0)
+        invalidate_drone_caches([self.drones[1].pk])
+
+        with self.assertNumQueries(1):
+            fleet = get_fleet()
+        self.assertEqual(fleet.get(self.drones[1].id).battery_capacity, 10.0)
+        self.assertEqual([drone['id'] for drone in fleet.available(['id'])], [self.drones[0].id, self.drones[2].id])
+
+    def test_deleted_drone_is_dropped(self):
+        drone_id = self.drones[2].id
+        self.drones[2].delete()
+        self.assertIsNone(get_fleet().get(drone_id))
+        self.assertIn(self.drones[0].id, get_fleet().drones)
+
+    def test_unknown_changes_reload_everything(self):
+        Drone.objects.update(state='LOADING')
+        invalidate_drone_caches()
+        self.assertEqual(get_fleet().available(['id']), [])
+
+    def test_expired_change_log_reloads_everything(self):
+        Drone.objects.filter(pk=self.drones[0].pk).update(state='LOADING')
+        invalidate_drone_caches([self.drones[0].pk])
+        cache.delete(change_log_key(cache.get(FLEET_VERSION_KEY)))
+        self.assertEqual(get_fleet().get(self.drones[0].id).state, 'LOADING')
+
+    def test_rolled_back_rows_are_not_served(self):
+        try:
+            with transaction.atomic():
+                Drone.objects.filter(pk=self.drones[0].pk).update(battery_capacity=5.0)
+                invalidate_drone_caches([self.drones[0].pk])
+                self.assertEqual(get_fleet().get(self.drones[0].id).battery_capacity, 5.0)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(get_fleet().get(self.drones[0].id).battery_capacity, 80.0)
+
+    @override_settings(FLEET_SNAPSHOT_MAX_STALENESS=60)
+    def test_staleness_window_defers_reload(self):
+        fleet = get_fleet()
+        cache.incr(FLEET_VERSION_KEY)  # A change made by another process
+        with self.assertNumQueries(0):
+            self.assertIs(get_fleet(), fleet)
+
+        # Changes made by this process are always seen
+        Drone.objects.filter(pk=self.drones[0].pk).update(state='LOADING')
+        invalidate_drone_caches([self.drones[0].pk])
+        self.assertEqual(get_fleet().get(self.drones[0].id).state, 'LOADING')
+
+
+@override_settings(FLEET_SNAPSHOT=False)
+class UnsharedCacheFleetTest(TestCase):
+    """Without a shared cache other processes' version bumps never arrive, so reads go to the database."""
+
+    def test_change_made_by_another_process_is_read(self):
+        drone = Drone.objects.create(serial_number='FLT-OTHER', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=90.0, state='IDLE')
+        self.assertEqual(get_fleet().get(drone.id).battery_capacity, 90.0)
+
+        # Another process bumps the version in its own process-local cache
+        with patch('dispatch.fleet.cache', LocMemCache('other-process', {})):
+            Drone.objects.filter(pk=drone.pk).update(battery_capacity=10.0)
+            invalidate_drone_caches([drone.pk])
+
+        self.assertEqual(get_fleet().get(drone.id).battery_capacity, 10.0)
+        self.assertEqual(get_available_drones(), [])
+
+    def test_reads_are_targeted_queries(self):
+        drones = Drone.objects.bulk_create([
+            Drone(serial_number=f'FLT-DB-{index}', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=battery, state=state)
+            for index, (battery, state) in enumerate(((90.0, 'IDLE'), (10.0, 'IDLE'), (90.0, 'LOADED')))
+        ])
+        self.assertIsInstance(get_fleet(), DatabaseFleet)
+
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(get_fleet().get(drones[2].id).state, 'LOADED')
+        self.assertIn('WHERE', queries.captured_queries[0]['sql'])
+        self.assertEqual(async_to_sync(aget_drone)(drones[0].id).serial_number, 'FLT-DB-0')
+        self.assertIsNone(get_fleet().get(0))
+        self.assertEqual([drone['id'] for drone in get_available_drones()], [drones[0].id])
+
+    def test_availability_uses_the_idle_battery_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Reads the SQLite query plan')
+        plan = Drone.objects.filter(forecast_q(), state='IDLE').order_by().explain()
+        self.assertIn('drone_idle_battery_idx', plan)
@@ -0,0 +1,112 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from dispatch.fleet import get_fleet
+from dispatch.forecast import fit_discharge_rates, refresh_forecasts
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup
+from dispatch.planner import loadable_drones
+from dispatch.tasks import refresh_battery_forecasts
+
+
+class FitDischargeRatesTest(TestCase):
+
+    def test_fits_linear_drain(self):
+        # Drone 1 loses 10% an hour and drone 2 20%, sampled every 10 minutes in mixed order
+        samples = [(drone, minute * 60.0, 90 - rate * minute / 60) for minute in range(0, 60, 10) for drone, rate in ((2, 20), (1, 10))]
+        drones, rates = fit_discharge_rates(*zip(*reversed(samples)))
+
+        self.assertEqual(drones.tolist(), [1, 2])
+        self.assertAlmostEqual(rates[0], 10)
+        self.assertAlmostEqual(rates[1], 20)
+
+    def test_fits_only_samples_since_last_recharge(self):
+        levels = [80, 70, 60, 95, 94, 93, 92]
+        drones, rates = fit_discharge_rates([1] * len(levels), [hour * 3600.0 for hour in range(len(levels))], levels)
+
+        self.assertAlmostEqual(rates[0], 1)
+
+    def test_skips_drones_with_too_little_history(self):
+        drones, _ = fit_discharge_rates([1, 1, 2, 2, 2], [0, 3600, 0, 1, 2], [80, 70, 80, 79, 78])
+
+        self.assertEqual(drones.tolist(), [])
+
+    def test_rate_is_never_negative(self):
+        _, rates = fit_discharge_rates([1, 1, 1], [0, 3600, 7200], [50, 50.5, 51])
+
+        self.assertEqual(rates.tolist(), [0])
+
+
+class RefreshForecastsTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.drone = Drone.objects.create(serial_number='FCT-001', model='LIGHTWEIGHT', weight_limit=500, battery_capacity=40.0, state='IDLE')
+        # Two expired hours compacted into rollups, then the raw samples of the last ten minutes
+        DroneBatteryRollup.objects.bulk_create([
+            DroneBatteryRollup(
+                drone=self.drone, period='HOUR', bucket_start=self.now - timezone.timedelta(hours=hours), sample_count=1,
+                min_level=level, max_level=level, sum_level=level, last_level=level,
+                last_timestamp=self.now - timezone.timedelta(hours=hours),
+            )
+            for hours, level in ((2, 120.0), (1, 80.0))
+        ])
+        DroneBatteryAudit.objects.bulk_create([
+            DroneBatteryAudit(
+                drone=self.drone, battery_level=40.0 + minutes * 40 / 60, task_name='test',
+                timestamp=self.now - timezone.timedelta(minutes=minutes), expires_at=self.now,
+            )
+            for minutes in (10, 0)
+        ])
+
+    def test_stores_changed_rates(self):
+        self.assertEqual(refresh_forecasts(self.now), (1, 1))
+        self.drone.refresh_from_db()
+        self.assertAlmostEqual(self.drone.discharge_rate, 40)
+
+        self.assertEqual(refresh_forecasts(self.now), (1, 0))
+
+    @override_settings(BATTERY_FORECAST_HISTORY_HOURS=1)
+    def test_fits_recent_history_only(self):
+        DroneBatteryAudit.objects.all().delete()
+        refresh_forecasts(self.now)
+        self.drone.refresh_from_db()
+        self.assertIsNone(self.drone.discharge_rate)
+
+    def test_task_refreshes_forecasts(self):
+        self.assertEqual(refresh_battery_forecasts(), 1)
+        self.assertEqual(get_fleet().get(self.drone.id).discharge_rate, 40)
+
+
+@override_settings(MISSION_DURATION_MINUTES=30)
+class ForecastAvailabilityTest(TestCase):
+
+    def setUp(self):
+        # At 40% a drone losing 40% an hour would be at 20% by the end of a 30 minute mission
+        self.draining = Drone.objects.create(
+            serial_number='FCT-DRN', model='LIGHTWEIGHT', weight_limit=500, battery_capacity=40.0, state='IDLE', discharge_rate=40.0)
+        self.steady = Drone.objects.create(
+            serial_number='FCT-STD', model='LIGHTWEIGHT', weight_limit=500, battery_capacity=40.0, state='IDLE', discharge_rate=20.0)
+
+    def test_available_drones_exclude_forecast_below_threshold(self):
+        response = self.client.get(reverse('available_drones_for_loading'))
+
+        self.assertEqual([drone['id'] for drone in response.data['available_drones']], [self.steady.id])
+        self.assertEqual([drone[0] for drone in loadable_drones()], [self.steady.id])
+
+    def test_loading_rejected_when_forecast_below_threshold(self):
+        payload = {'medications': [{'name': 'Med', 'weight': 10, 'code': 'FCT_1', 'image': 'photos/omega.jpeg'}]}
+        response = self.client.post(reverse('bulk_load_medication', kwargs={'id': self.draining.id}), payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('forecast', response.data['status'])
+
+    def test_reservation_checks_forecast(self):
+        self.assertFalse(self.draining.reserve_weight(10))
+        self.assertTrue(self.steady.reserve_weight(10))
+
+    def test_battery_level_reports_forecast(self):
+        response = self.client.get(reverse('check_drone_battery', kwargs={'id': self.draining.id}))
+
+        self.assertEqual(response.data['discharge_rate'], 40.0)
+        self.assertEqual(response.data['mission_battery_level'], 20.0)
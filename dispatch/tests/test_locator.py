@@ -0,0 +1,74 @@
+import random
+from django.test import SimpleTestCase
+from dispatch.fleet import DroneSnapshot
+from dispatch.locator import DroneLocator, haversine_km, parse_points
+import numpy as np
+
+
+class DroneLocatorTest(SimpleTestCase):
+    """The grid search must return exactly what checking every drone would."""
+
+    def drones(self, count, latitudes, longitudes, seed=0):
+        rng = random.Random(seed)
+        return [
+            DroneSnapshot(index, f'LOC-{index}', 'LIGHTWEIGHT', 500, 80.0, 'IDLE', float(rng.randrange(500)),
+                          rng.uniform(*latitudes), rng.uniform(*longitudes), None)
+            for index in range(count)
+        ]
+
+    def brute_force(self, drones, latitude, longitude, weight, k):
+        latitude, longitude = np.radians(latitude), np.radians(longitude)
+        distances = sorted(
+            (float(haversine_km(latitude, longitude, np.cos(latitude), np.radians(drone.latitude),
+                                np.radians(drone.longitude), np.cos(np.radians(drone.latitude)))), drone.id)
+            for drone in drones if drone.weight_limit - drone.loaded_weight >= weight
+        )
+        return [drone_id for _, drone_id in distances[:k]]
+
+    def assertMatchesBruteForce(self, drones, points):
+        locator = DroneLocator(drones)
+        rng = random.Random(1)
+        weights = [rng.uniform(0, 400) for _ in points]
+        results = locator.nearest([point[0] for point in points], [point[1] for point in points], weights, 5)
+        for point, weight, nearest in zip(points, weights, results):
+            self.assertEqual([drone.id for drone, _ in nearest], self.brute_force(drones, *point, weight, 5), point)
+            distances = [distance for _, distance in nearest]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_dense_city_fleet(self):
+        rng = random.Random(2)
+        drones = self.drones(2000, (-1.5, -1.1), (36.6, 37.0))
+        self.assertMatchesBruteForce(drones, [(rng.uniform(-1.6, -1.0), rng.uniform(36.5, 37.1)) for _ in range(100)])
+
+    def test_global_fleet(self):
+        rng = random.Random(3)
+        drones = self.drones(2000, (-89, 89), (-180, 180))
+        self.assertMatchesBruteForce(drones, [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(100)])
+
+    def test_search_wraps_around_the_antimeridian(self):
+        rng = random.Random(4)
+        drones = self.drones(500, (-5, 5), (179, 180))
+        self.assertMatchesBruteForce(drones, [(rng.uniform(-5, 5), rng.uniform(-180, -179.5)) for _ in range(50)])
+
+    def test_point_far_from_every_drone(self):
+        drones = self.drones(200, (-1.5, -1.1), (36.6, 37.0))
+        self.assertMatchesBruteForce(drones, [(60.0, -100.0), (-89.9, 0.0)])
+
+    def test_fewer_drones_than_k(self):
+        drones = self.drones(3, (-1.5, -1.1), (36.6, 37.0))
+        [nearest] = DroneLocator(drones).nearest([-1.3], [36.8], [0], 5)
+        self.assertEqual(len(nearest), 3)
+
+    def test_empty_fleet(self):
+        self.assertEqual(DroneLocator([]).nearest([-1.3, 0], [36.8, 0], [0, 0], 5), [[], []])
+
+
+class ParsePointsTest(SimpleTestCase):
+
+    def test_rejects_non_finite_values(self):
+        _, errors = parse_points([
+            {'latitude': float('nan'), 'longitude': 36.82},
+            {'latitude': -1.29, 'longitude': 36.82, 'weight': float('inf')},
+        ])
+
+        self.assertEqual([sorted(error) for error in errors], [['latitude'], ['weight']])
@@ -40,6 +40,22 @@ class DroneMedicationModelTest(TestCase):
         self.assertEqual(medication.weight, 50.0)
         self.assertEqual(medication.drone, self.drone)
 
+    def test_medication_changes_sync_loaded_weight(self):
+        self.drone.refresh_from_db()
+        self.assertEqual(self.drone.loaded_weight, 50.0)
+
+        other = Drone.objects.create(serial_number='TEST-002', model='Model A', weight_limit=500, battery_capacity=80.0, state='IDLE')
+        medication = Medication.objects.get(pk=self.medication.pk)
+        medication.drone = other
+        medication.save()
+        self.drone.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.drone.loaded_weight, other.loaded_weight), (0, 50.0))
+
+        medication.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.loaded_weight, 0)
+
     def test_invalid_medication_name(self):
         with self.assertRaises(ValidationError):
             invalid_medication = Medication(
@@ -51,6 +67,30 @@ class DroneMedicationModelTest(TestCase):
             )
             invalid_medication.clean()
 
+    def test_transition_to_follows_legal_edges(self):
+        self.assertTrue(self.drone.transition_to('LOADING'))
+        self.assertEqual(Drone.objects.get(pk=self.drone.pk).state, 'LOADING')
+        with self.assertRaises(ValidationError):
+            self.drone.transition_to('RETURNING')
+
+    def test_transition_to_fails_on_stale_state(self):
+        Drone.objects.filter(pk=self.drone.pk).update(state='LOADED')
+        # self.drone still believes it is IDLE, so the conditional UPDATE matches nothing
+        self.assertFalse(self.drone.transition_to('LOADING'))
+        self.assertEqual(self.drone.state, 'LOADED')
+
+    def test_transition_to_idle_unloads_drone(self):
+        Drone.objects.filter(pk=self.drone.pk).update(state='RETURNING', loaded_weight=50.0)
+        self.drone.refresh_from_db()
+        self.assertTrue(self.drone.transition_to('IDLE'))
+        self.assertEqual(self.drone.loaded_weight, 0)
+        self.assertFalse(Medication.objects.filter(drone=self.drone).exists())
+
+        # The delivered medication is kept, detached from the drone
+        self.medication.refresh_from_db()
+        self.assertIsNone(self.medication.drone)
+        self.assertIsNotNone(self.medication.delivered_at)
+
     def test_invalid_medication_code(self):
         with self.assertRaises(ValidationError):
             invalid_medication = Medication(
@@ -99,4 +139,20 @@ class DroneBatteryAuditPeriodicTaskTest(TestCase):
         self.assertEqual(audit2.battery_level, 60.0)
         self.assertEqual(audit2.task_name, 'dispatch.tasks.perform_check_drone_battery')
 
-        mock_logger.info.assert_called()
\ No newline at end of file
+        mock_logger.info.assert_called()
+
+    @patch('dispatch.tasks.logger')
+    def test_perform_check_drone_battery_in_batches(self, mock_logger):
+        # One streaming SELECT plus one INSERT per batch, and a single summary log line
+        with self.assertNumQueries(3):
+            created = perform_check_drone_battery(batch_size=1)
+
+        self.assertEqual(created, 2)
+        self.assertEqual(DroneBatteryAudit.objects.count(), 2)
+        mock_logger.info.assert_called_once()
+
+    def test_save_expires_audit_from_its_timestamp(self):
+        timestamp = timezone.now() - timezone.timedelta(hours=1)
+        audit = DroneBatteryAudit.objects.create(drone=self.drone1, battery_level=80.0, task_name='test', timestamp=timestamp)
+
+        self.assertEqual(audit.expires_at, timestamp + timezone.timedelta(minutes=5))
@@ -0,0 +1,107 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from dispatch.models import Drone, Medication
+from dispatch.profiling import LOCK_KEY, QueryProfile, clear_profiles, record_profile, recorded_profiles
+
+PROFILED_MIDDLEWARE = ['dispatch.profiling.QueryProfilingMiddleware', *settings.MIDDLEWARE]
+
+
+@override_settings(MIDDLEWARE=PROFILED_MIDDLEWARE, QUERY_PROFILING_SAMPLE_RATE=1, QUERY_PROFILING_SLOW_REQUEST_MS=0)
+class QueryProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        clear_profiles()
+        self.drone = Drone.objects.create(serial_number='PRF-001', model='LIGHTWEIGHT', weight_limit=500, battery_capacity=80.0, state='IDLE')
+        Medication.objects.create(name='Med-1', weight=5.0, code='PRF_1', image='photos/omega.jpeg', drone=self.drone)
+
+    def tearDown(self):
+        clear_profiles()
+
+    def test_profiled_request_reports_queries_in_headers(self):
+        url = reverse('loaded_medications', kwargs={'id': self.drone.id})
+        with self.assertLogs('dispatch.profiling', 'INFO') as logs:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-DB-Query-Count']), 1)
+        self.assertEqual(int(response['X-DB-Duplicate-Queries']), 0)
+        self.assertGreaterEqual(float(response['X-DB-Time-Ms']), 0)
+        profile = logs.records[0].query_profile
+        self.assertEqual(profile['path'], url)
+        self.assertEqual(profile['query_count'], 1)
+        self.assertEqual(len(profile['slowest']), 1)
+
+    def test_async_view_is_profiled(self):
+        url = reverse('async_loaded_medications', kwargs={'id': self.drone.id})
+        response = async_to_sync(AsyncClient().get)(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['X-DB-Query-Count']), 1)
+
+    @override_settings(QUERY_PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_profiled(self):
+        response = self.client.get(reverse('loaded_medications', kwargs={'id': self.drone.id}))
+
+        self.assertNotIn('X-DB-Query-Count', response)
+        self.assertEqual(recorded_profiles(), [])
+
+    @override_settings(QUERY_PROFILING_SLOW_REQUEST_MS=10000, QUERY_PROFILING_MAX_QUERIES=100)
+    def test_fast_request_is_not_recorded(self):
+        self.client.get(reverse('loaded_medications', kwargs={'id': self.drone.id}))
+
+        self.assertEqual(recorded_profiles(), [])
+
+    @override_settings(QUERY_PROFILING_BUFFER_SIZE=2)
+    def test_buffer_keeps_worst_slow_requests(self):
+        for path, db_time_ms in (('/a/', 30.0), ('/b/', 10.0), ('/c/', 50.0), ('/d/', 20.0)):
+            record_profile({'path': path, 'db_time_ms': db_time_ms})
+
+        self.assertEqual([profile['path'] for profile in recorded_profiles()], ['/c/', '/a/'])
+
+    @override_settings(QUERY_PROFILING_BUFFER_SIZE=1)
+    def test_buffer_is_not_written_while_locked(self):
+        record_profile({'path': '/a/', 'db_time_ms': 10.0})
+        cache.add(LOCK_KEY, True)
+        record_profile({'path': '/b/', 'db_time_ms': 20.0})
+        cache.delete(LOCK_KEY)
+
+        self.assertEqual([profile['path'] for profile in recorded_profiles()], ['/a/'])
+
+    def test_admin_lists_recorded_profiles(self):
+        self.client.get(reverse('loaded_medications', kwargs={'id': self.drone.id}))
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+        self.assertEqual(self.client.get(reverse('query_profiles')).status_code, 302)
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('query_profiles'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'/api/drone/{self.drone.id}/medications/')
+        self.assertContains(self.client.get(reverse('admin:index')), reverse('query_profiles'))
+
+
+class QueryProfileTest(TestCase):
+
+    def test_counts_duplicate_and_similar_statements(self):
+        profile = QueryProfile()
+        with connection.execute_wrapper(profile):
+            for drone_id in (1, 1, 2):
+                list(Drone.objects.filter(id=drone_id))
+
+        class Request:
+            method = 'GET'
+            path = '/'
+
+        class Response:
+            status_code = 200
+
+        summary = profile.summary(Request(), Response(), 0.01)
+        self.assertEqual(summary['query_count'], 3)
+        self.assertEqual(summary['duplicate_queries'], 1)
+        self.assertEqual(summary['similar_queries'], 2)
+        self.assertEqual(summary['most_repeated'][0]['count'], 3)
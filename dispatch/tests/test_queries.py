@@ -0,0 +1,162 @@
+import io
+import shutil
+import tempfile
+from asgiref.sync import async_to_sync
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from dispatch import urls
+from dispatch.caching import invalidate_drone_caches
+from dispatch.fleet import get_fleet
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from dispatch.telemetry import serial_ids
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FLEET_SNAPSHOT=True)
+class EndpointQueryCountTest(APITestCase):
+    """
+    Query budget for every endpoint in dispatch/urls.py. The fixture gives each drone
+    several medications, audits and rollups, so a count that grows with the rows
+    returned shows up here as a failure. Counts are for a warm fleet snapshot.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Bulk loads reference images already in storage
+        default_storage.save('photos/omega.jpeg', cls.image())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        serial_ids.clear()
+        self.drones = Drone.objects.bulk_create([
+            Drone(serial_number=f'QRY-{index:03d}', model='LIGHTWEIGHT', weight_limit=500, battery_capacity=80.0, state='IDLE')
+            for index in range(3)
+        ])
+        self.drone = self.drones[0]
+        Medication.objects.bulk_create([
+            Medication(name=f'Med-{index}', weight=5.0, code=f'QRY_{index}', image='photos/omega.jpeg', drone=self.drone)
+            for index in range(5)
+        ])
+        now = timezone.now()
+        DroneBatteryAudit.objects.bulk_create([
+            DroneBatteryAudit(drone=drone, battery_level=80.0, task_name='test', expires_at=now)
+            for drone in self.drones for _ in range(5)
+        ])
+        bucket_start = now.replace(minute=0, second=0, microsecond=0)
+        DroneBatteryRollup.objects.bulk_create([
+            DroneBatteryRollup(
+                drone=self.drone, period='HOUR', bucket_start=bucket_start - timezone.timedelta(hours=hour), sample_count=1,
+                min_level=80.0, max_level=80.0, sum_level=80.0, last_level=80.0, last_timestamp=bucket_start
+            )
+            for hour in range(5)
+        ])
+        # bulk_create sends no signals
+        invalidate_drone_caches()
+        get_fleet()
+
+    @staticmethod
+    def image():
+        file = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(file, 'JPEG')
+        return SimpleUploadedFile('query_count.jpg', file.getvalue(), content_type='image/jpeg')
+
+    def assertQueries(self, count, method, name, data=None, format='json', **kwargs):
+        url = reverse(name, kwargs=kwargs or None)
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(url, data, format=format)
+        self.assertLess(response.status_code, 300, getattr(response, 'data', response.content))
+        return response
+
+    def test_every_endpoint_is_covered(self):
+        covered = {name[len('test_'):] for name in dir(self) if name.startswith('test_') and name != 'test_every_endpoint_is_covered'}
+        names = {pattern.name.replace('-', '_') for pattern in urls.urlpatterns}
+        self.assertEqual(names - covered, set())
+
+    def test_register_drone(self):
+        # Unique serial check and the INSERT; the new drone's medication list needs no query
+        payload = {'serial_number': 'QRY-NEW', 'model': 'LIGHTWEIGHT', 'weight_limit': 200, 'battery_capacity': 50.0, 'state': 'IDLE'}
+        self.assertQueries(2, 'post', 'register_drone', payload)
+
+    def test_load_medication(self):
+        # Drone lookup, unique code check, then reservation UPDATE, refresh and INSERT in a savepoint
+        payload = {'name': 'Loaded', 'weight': 10, 'code': 'QRY_LOAD', 'image': self.image()}
+        self.assertQueries(7, 'post', 'load_medication', payload, format='multipart', id=self.drones[1].id)
+
+    def test_bulk_load_medication(self):
+        payload = {'medications': [
+            {'name': f'Bulk-{index}', 'weight': 1, 'code': f'QRY_BULK_{index}', 'image': 'photos/omega.jpeg'}
+            for index in range(10)
+        ]}
+        self.assertQueries(7, 'post', 'bulk_load_medication', payload, id=self.drones[1].id)
+
+    def test_loaded_medications(self):
+        response = self.assertQueries(1, 'get', 'loaded_medications', id=self.drone.id)
+        self.assertEqual(len(response.data['medications']), 5)
+
+    def test_async_loaded_medications(self):
+        self.assertQueries(1, 'get', 'async_loaded_medications', id=self.drone.id)
+
+    def test_available_drones_for_loading(self):
+        self.assertQueries(0, 'get', 'available_drones_for_loading')
+
+    def test_dispatch_plan(self):
+        payload = {'medications': [{'code': f'PLAN_{index}', 'weight': 50} for index in range(20)]}
+        self.assertQueries(0, 'post', 'dispatch_plan', payload)
+
+    def test_nearest_drones(self):
+        self.assertQueries(0, 'get', 'nearest_drones', {'latitude': -1.29, 'longitude': 36.82, 'weight': 50})
+
+    def test_nearest_drones_batch(self):
+        payload = {'points': [{'latitude': -1.29, 'longitude': 36.82 + index / 100, 'weight': 50} for index in range(20)]}
+        self.assertQueries(0, 'post', 'nearest_drones_batch', payload)
+
+    def test_drone_transition(self):
+        self.assertQueries(5, 'post', 'drone_transition', {'state': 'LOADING'}, id=self.drones[1].id)
+
+    def test_bulk_drone_transition(self):
+        payload = {'drones': [drone.id for drone in self.drones], 'from_state': 'IDLE', 'to_state': 'LOADING'}
+        self.assertQueries(3, 'post', 'bulk_drone_transition', payload)
+
+    def test_check_drone_battery(self):
+        self.assertQueries(0, 'get', 'check_drone_battery', id=self.drone.id)
+
+    def test_async_check_drone_battery(self):
+        self.assertQueries(0, 'get', 'async_check_drone_battery', id=self.drone.id)
+
+    def test_drone_battery_history(self):
+        self.assertQueries(1, 'get', 'drone_battery_history', id=self.drone.id)
+
+    def test_drone_telemetry(self):
+        # Cold serial cache: the lookup, then one UPDATE and one INSERT in a savepoint
+        payload = [{'serial_number': drone.serial_number, 'battery': 70.0} for drone in self.drones for _ in range(3)]
+        self.assertQueries(5, 'post', 'drone_telemetry', payload)
+
+    def test_drone_battery_audit_list(self):
+        response = self.assertQueries(1, 'get', 'drone-battery-audit-list')
+        self.assertEqual(len(response.data['results']), 15)
+
+    def test_task_metrics(self):
+        self.assertQueries(0, 'get', 'task_metrics')
+
+    def test_fleet_events(self):
+        async def connect():
+            response = await self.async_client.get(reverse('fleet_events'))
+            stream = aiter(response.streaming_content)
+            first_frame = await anext(stream)
+            await stream.aclose()
+            return first_frame
+
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(connect)(), b': connected\n\n')
+
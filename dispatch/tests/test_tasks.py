@@ -0,0 +1,308 @@
+import io
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest.mock import patch
+from celery.app.task import Context
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from dispatch.images import UNREADABLE_IMAGE_HASH, store_upload
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from dispatch.metrics import SENT_AT_HEADER, queue_wait
+from dispatch.tasks import delete_expired_audit_logs, perform_check_drone_battery, process_medication_images
+
+class AuditCleanupSchedulingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.drone = Drone.objects.create(
+            serial_number='RET-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('dispatch.tasks.delete_expired_audit_logs.apply_async')
+    def test_many_audit_inserts_enqueue_one_cleanup(self, mock_apply_async):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(50):
+                DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test')
+
+        mock_apply_async.assert_called_once()
+
+    @patch('dispatch.tasks.logger')
+    @patch('dispatch.tasks.delete_expired_audit_logs.apply_async')
+    def test_cleanup_run_allows_next_schedule(self, mock_apply_async, mock_logger):
+        with self.captureOnCommitCallbacks(execute=True):
+            DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test')
+        delete_expired_audit_logs()
+        with self.captureOnCommitCallbacks(execute=True):
+            DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test')
+
+        self.assertEqual(mock_apply_async.call_count, 2)
+
+
+class DeleteExpiredAuditLogsTest(TestCase):
+
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='RET-002',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+
+    @patch('dispatch.tasks.logger')
+    def test_uses_per_row_expiry_duration(self, mock_logger):
+        short_lived = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test', expiry_duration_minutes=5)
+        long_lived = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test', expiry_duration_minutes=10)
+
+        with patch('dispatch.tasks.timezone.now', return_value=timezone.now() + timezone.timedelta(minutes=6)):
+            deleted = delete_expired_audit_logs()
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(DroneBatteryAudit.objects.filter(pk=short_lived.pk).exists())
+        self.assertTrue(DroneBatteryAudit.objects.filter(pk=long_lived.pk).exists())
+
+    @patch('dispatch.tasks.logger')
+    def test_deletes_in_chunks(self, mock_logger):
+        for _ in range(5):
+            DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test')
+        kept = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=70.0, task_name='test', expiry_duration_minutes=60)
+        DroneBatteryAudit.objects.exclude(pk=kept.pk).update(expires_at=timezone.now() - timezone.timedelta(minutes=1))
+
+        deleted = delete_expired_audit_logs(chunk_size=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(DroneBatteryAudit.objects.values_list('pk', flat=True)), [kept.pk])
+        # Three chunk lines plus the summary
+        self.assertEqual(mock_logger.info.call_count, 4)
+
+
+class BatteryRollupTest(TestCase):
+
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='ROL-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timezone.timedelta(hours=2)
+
+    def expire_samples(self, levels, minute_offset=0):
+        for minute, level in enumerate(levels):
+            audit = DroneBatteryAudit.objects.create(drone=self.drone, battery_level=level, task_name='test')
+            DroneBatteryAudit.objects.filter(pk=audit.pk).update(
+                timestamp=self.hour + timezone.timedelta(minutes=minute + minute_offset),
+                expires_at=timezone.now() - timezone.timedelta(minutes=1)
+            )
+
+    @patch('dispatch.tasks.logger')
+    def test_cleanup_compacts_samples_into_rollups(self, mock_logger):
+        self.expire_samples([90.0, 80.0, 85.0])
+        delete_expired_audit_logs(chunk_size=2)
+
+        hourly = DroneBatteryRollup.objects.get(drone=self.drone, period='HOUR')
+        self.assertEqual(hourly.bucket_start, self.hour)
+        self.assertEqual(hourly.sample_count, 3)
+        self.assertEqual(hourly.min_level, 80.0)
+        self.assertEqual(hourly.max_level, 90.0)
+        self.assertEqual(hourly.avg_level, 85.0)
+        self.assertEqual(hourly.last_level, 85.0)
+        self.assertTrue(DroneBatteryRollup.objects.filter(drone=self.drone, period='DAY').exists())
+        self.assertFalse(DroneBatteryAudit.objects.exists())
+
+    @patch('dispatch.tasks.logger')
+    def test_later_runs_merge_into_existing_rollups(self, mock_logger):
+        self.expire_samples([90.0])
+        delete_expired_audit_logs()
+        self.expire_samples([60.0], minute_offset=30)
+        delete_expired_audit_logs()
+
+        hourly = DroneBatteryRollup.objects.get(drone=self.drone, period='HOUR')
+        self.assertEqual(hourly.sample_count, 2)
+        self.assertEqual(hourly.min_level, 60.0)
+        self.assertEqual(hourly.last_level, 60.0)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDICATION_IMAGE_MAX_DIMENSION=64, MEDICATION_THUMBNAIL_SIZE=16)
+class ProcessMedicationImagesTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='IMG-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+
+    def upload(self, name, size=(32, 32), color='red'):
+        file = io.BytesIO()
+        Image.new('RGB', size, color=color).save(file, 'JPEG')
+        return default_storage.save(f'photos/{name}', ContentFile(file.getvalue()))
+
+    def medication(self, code, image):
+        return Medication.objects.create(name=code, weight=1, code=code, image=image, drone=self.drone)
+
+    @patch('dispatch.images.logger')
+    def test_identical_uploads_share_one_file(self, mock_logger):
+        first = self.medication('IMG_A', self.upload('first.jpg'))
+        second = self.medication('IMG_B', self.upload('second.jpg'))
+
+        self.assertEqual(process_medication_images([first.id, second.id], remove_replaced=True), 2)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.name, f'photos/{first.image_hash}.jpg')
+        self.assertEqual(first.thumbnail.name, f'thumbnails/{first.image_hash}.jpg')
+        self.assertFalse(default_storage.exists('photos/first.jpg'))
+        self.assertFalse(default_storage.exists('photos/second.jpg'))
+
+    @patch('dispatch.images.logger')
+    def test_oversized_original_is_downscaled_and_thumbnailed(self, mock_logger):
+        medication = self.medication('IMG_BIG', self.upload('big.jpg', size=(200, 100), color='blue'))
+        process_medication_images([medication.id], remove_replaced=True)
+
+        medication.refresh_from_db()
+        with Image.open(medication.image) as image:
+            self.assertEqual(image.size, (64, 32))
+        with Image.open(medication.thumbnail) as thumbnail:
+            self.assertEqual(thumbnail.size, (16, 8))
+
+    @patch('dispatch.images.logger')
+    def test_hash_named_upload_is_downscaled_in_place(self, mock_logger):
+        file = io.BytesIO()
+        Image.new('RGB', (200, 100), color='purple').save(file, 'JPEG')
+        name, _ = store_upload(SimpleUploadedFile('upload.jpg', file.getvalue()))
+        medication = self.medication('IMG_UPLOAD', name)
+        process_medication_images([medication.id])
+
+        medication.refresh_from_db()
+        self.assertEqual(medication.image.name, name)
+        with Image.open(medication.image) as image:
+            self.assertEqual(image.size, (64, 32))
+
+    @patch('dispatch.images.logger')
+    def test_shared_images_are_kept_without_remove_replaced(self, mock_logger):
+        name = self.upload('shared.jpg', color='green')
+        medication = self.medication('IMG_SHARED', name)
+        process_medication_images([medication.id])
+
+        medication.refresh_from_db()
+        self.assertNotEqual(medication.image.name, name)
+        self.assertTrue(default_storage.exists(name))
+
+    @patch('dispatch.images.logger')
+    def test_sweep_skips_missing_files_and_processed_medications(self, mock_logger):
+        missing = self.medication('IMG_MISSING', 'photos/missing.jpg')
+        pending = self.medication('IMG_PENDING', self.upload('pending.jpg', color='white'))
+
+        self.assertEqual(process_medication_images(), 1)
+        self.assertEqual(process_medication_images(), 0)
+        pending.refresh_from_db()
+        self.assertEqual(len(pending.image_hash), 64)
+        mock_logger.warning.assert_called()
+        missing.refresh_from_db()
+        self.assertEqual(missing.image_hash, UNREADABLE_IMAGE_HASH)
+
+    @override_settings(MEDICATION_IMAGE_BATCH_SIZE=2)
+    @patch('dispatch.images.logger')
+    def test_unreadable_images_do_not_block_the_sweep(self, mock_logger):
+        for index in range(2):
+            self.medication(f'IMG_BROKEN_{index}', f'photos/broken-{index}.jpg')
+        pending = self.medication('IMG_LATER', self.upload('later.jpg', color='black'))
+
+        self.assertEqual(process_medication_images(), 0)
+        self.assertEqual(process_medication_images(), 1)
+        pending.refresh_from_db()
+        self.assertEqual(len(pending.image_hash), 64)
+
+    @patch('dispatch.images.logger')
+    def test_paths_outside_storage_and_bombs_are_marked_unreadable(self, mock_logger):
+        outside = self.medication('IMG_OUTSIDE', '../../etc/passwd')
+        bomb = self.medication('IMG_BOMB', self.upload('bomb.jpg', color='olive'))
+        pending = self.medication('IMG_AFTER', self.upload('after.jpg', color='navy'))
+
+        with patch('dispatch.images.Image.MAX_IMAGE_PIXELS', 1):
+            self.assertEqual(process_medication_images([outside.id, bomb.id]), 0)
+        self.assertEqual(process_medication_images(), 1)
+        for medication in (outside, bomb):
+            medication.refresh_from_db()
+            self.assertEqual(medication.image_hash, UNREADABLE_IMAGE_HASH)
+        pending.refresh_from_db()
+        self.assertEqual(len(pending.image_hash), 64)
+
+
+class TaskMetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.drone = Drone.objects.create(
+            serial_number='MET-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=70.0,
+            state='IDLE'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def metrics(self):
+        response = self.client.get(reverse('task_metrics'))
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines() if not line.startswith('#'))
+
+    @patch('dispatch.tasks.logger')
+    @patch('dispatch.metrics.logger')
+    def test_task_runs_are_recorded(self, mock_metrics_logger, mock_logger):
+        perform_check_drone_battery.apply()
+        perform_check_drone_battery.apply()
+
+        task = 'task="dispatch.tasks.perform_check_drone_battery"'
+        metrics = self.metrics()
+        self.assertEqual(metrics[f'dispatch_task_runs_total{{{task},state="SUCCESS"}}'], '2')
+        self.assertEqual(metrics[f'dispatch_task_rows_total{{{task}}}'], '2')
+        self.assertEqual(metrics[f'dispatch_task_runtime_seconds_count{{{task}}}'], '2')
+        self.assertEqual(metrics[f'dispatch_task_runtime_seconds_bucket{{{task},le="+Inf"}}'], '2')
+        self.assertGreater(int(metrics[f'dispatch_task_queries_total{{{task}}}']), 0)
+        # Run in-process, so never queued
+        self.assertEqual(metrics[f'dispatch_task_queue_waits_total{{{task}}}'], '0')
+
+    def test_queue_wait_counts_from_the_later_of_sent_and_eta(self):
+        now = time.time()
+        request = Context(headers=None, eta=None)
+        setattr(request, SENT_AT_HEADER, now - 2)
+        self.assertAlmostEqual(queue_wait(request), 2, delta=0.5)
+
+        request.eta = datetime.fromtimestamp(now - 1, tz=dt_timezone.utc).isoformat()
+        self.assertAlmostEqual(queue_wait(request), 1, delta=0.5)
+        self.assertIsNone(queue_wait(Context(headers=None, eta=None)))
+
+    def test_fire_and_forget_tasks_store_no_results(self):
+        for task in (delete_expired_audit_logs, perform_check_drone_battery, process_medication_images):
+            self.assertTrue(task.ignore_result)
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+from dispatch.validators import CODE_ERROR, NAME_ERROR, medication_errors, validate_medications
+
+
+class MedicationValidatorsTest(SimpleTestCase):
+
+    def test_valid_medication_has_no_errors(self):
+        self.assertEqual(medication_errors('Med-1_a', 'MED_1'), {})
+
+    def test_every_broken_rule_is_reported(self):
+        self.assertEqual(medication_errors('Med 1', 'med1'), {'name': [NAME_ERROR], 'code': [CODE_ERROR]})
+
+    def test_trailing_newline_is_rejected(self):
+        self.assertEqual(medication_errors('Med\n', 'MED\n'), {'name': [NAME_ERROR], 'code': [CODE_ERROR]})
+
+    def test_non_string_values_are_rejected(self):
+        self.assertEqual(medication_errors(None, 7), {'name': [NAME_ERROR], 'code': [CODE_ERROR]})
+
+    def test_batch_errors_align_with_items(self):
+        items = [
+            {'name': 'Good', 'code': 'GOOD'},
+            {'name': 'Bad name', 'code': 'GOOD_2'},
+            {'name': 'Good-3', 'code': 'bad'},
+        ]
+        self.assertEqual(validate_medications(items), [{}, {'name': [NAME_ERROR]}, {'code': [CODE_ERROR]}])
+
+    def test_valid_batch_returns_no_errors(self):
+        self.assertEqual(validate_medications([{'name': f'Med-{index}', 'code': f'MED_{index}'} for index in range(100)]), [])
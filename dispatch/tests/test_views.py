@@ -1,10 +1,24 @@
+from unittest.mock import patch
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
-from dispatch.models import Drone, Medication
+from dispatch.caching import invalidate_drone_caches
+from dispatch.images import process_medication_images
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from dispatch.telemetry import ingest_readings, parse_readings, serial_ids
+from dispatch.serializers import BulkLoadMedicationSerializer
+from dispatch.validators import CODE_ERROR, CODE_TAKEN_ERROR
+from django.utils import timezone
 from PIL import Image
 import io
+import json
+import os
+import shutil
+import tempfile
 
 class RegisterDroneViewTest(APITestCase):
     def setUp(self):
@@ -72,6 +86,15 @@ class RegisterDroneViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['model'][0], '"LIGHT" is not a valid choice.')
 
+    def test_register_drone_with_position(self):
+        response = self.client.post(self.url, {**self.valid_payload, 'latitude': -1.29, 'longitude': 36.82}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['latitude'], response.data['longitude']), (-1.29, 36.82))
+
+        response = self.client.post(self.url, {**self.valid_payload, 'serial_number': 'XTY-900', 'latitude': -1.29}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['non_field_errors'][0], 'Send latitude and longitude together.')
+
 
 class LoadMedicationViewAPITest(APITestCase):
     def setUp(self):
@@ -89,7 +112,7 @@ class LoadMedicationViewAPITest(APITestCase):
         self.image = SimpleUploadedFile(name='test_image.jpg', content=image_file.read(), content_type='image/jpeg')
         
         self.payload = {
-            'name': 'Medicine A',
+            'name': 'Medicine-A',
             'weight': 20,
             'code': 'TRM500',
             'image': self.image
@@ -110,7 +133,55 @@ class LoadMedicationViewAPITest(APITestCase):
         """ Verify that only one medication was created"""
         medications = Medication.objects.filter(drone=self.drone)
         self.assertEqual(medications.count(), 1)
+
+    @patch('dispatch.tasks.process_medication_images.delay')
+    def test_load_medication_queues_image_processing(self, mock_delay):
+        url = reverse('load_medication', kwargs={'id': self.drone.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, self.payload, format='multipart')
+
+        self.assertIsNone(response.data['medication']['thumbnail'])
+        mock_delay.assert_called_once_with([response.data['medication']['id']], False)
+
+    @patch('dispatch.images.logger')
+    @patch('dispatch.tasks.process_medication_images.delay')
+    def test_returned_image_url_survives_processing(self, mock_delay, mock_logger):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        url = reverse('load_medication', kwargs={'id': self.drone.id})
+        with self.settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, self.payload, format='multipart')
+            process_medication_images(*mock_delay.call_args.args)
+
+            medication = Medication.objects.get(pk=response.data['medication']['id'])
+            self.assertEqual(medication.image.url, response.data['medication']['image'])
+            self.assertEqual(medication.image.name, f'photos/{medication.image_hash}.jpg')
+            self.assertTrue(medication.image.storage.exists(medication.image.name))
         
+    def test_upload_removed_when_load_rolls_back(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        url = reverse('load_medication', kwargs={'id': self.drone.id})
+        with self.settings(MEDIA_ROOT=media_root), \
+                patch.object(Medication, 'save', side_effect=IntegrityError('UNIQUE constraint failed')):
+            response = self.client.post(url, self.payload, format='multipart')
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(os.listdir(os.path.join(media_root, 'photos')), [])
+        self.drone.refresh_from_db()
+        self.assertEqual(self.drone.loaded_weight, 0)
+
+    def test_load_medication_invalid_name_and_code(self):
+        url = reverse('load_medication', kwargs={'id': self.drone.id})
+        self.payload.update({'name': 'Medicine A', 'code': 'trm500'})
+
+        response = self.client.post(url, self.payload, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data)
+        self.assertIn('code', response.data)
+        self.assertFalse(Medication.objects.exists())
+
     def test_load_medications_drone_not_found(self):
         url = reverse('load_medication', kwargs={'id': 999})
     
@@ -128,6 +199,112 @@ class LoadMedicationViewAPITest(APITestCase):
         self.assertEqual(response.data['status'], 'Drone must be in IDLE or LOADING state to start loading medications')
         
         
+class BulkLoadMedicationViewAPITest(APITestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='BLK-001',
+            model='HEAVYWEIGHT',
+            state='IDLE',
+            battery_capacity=50,
+            weight_limit=100
+        )
+        self.url = reverse('bulk_load_medication', kwargs={'id': self.drone.id})
+        self.payload = {
+            'medications': [
+                {'name': 'Med-A', 'weight': 30, 'code': 'BLK_A', 'image': 'photos/panadol.jpeg'},
+                {'name': 'Med-B', 'weight': 20, 'code': 'BLK_B', 'image': 'photos/omega.jpeg'},
+            ]
+        }
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_bulk_load_success(self):
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['remaining_weight'], 50)
+
+        self.drone.refresh_from_db()
+        self.assertEqual(self.drone.state, 'LOADING')
+        self.assertEqual(Medication.objects.filter(drone=self.drone).count(), 2)
+
+    def test_bulk_load_fills_drone(self):
+        self.payload['medications'][0]['weight'] = 80
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['remaining_weight'], 0)
+
+        self.drone.refresh_from_db()
+        self.assertEqual(self.drone.state, 'LOADED')
+
+    def test_bulk_load_exceeds_weight_limit(self):
+        self.payload['medications'][0]['weight'] = 90
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['status'], 'Total weight exceeds drone weight limit of 100')
+        self.assertEqual(Medication.objects.filter(drone=self.drone).count(), 0)
+
+    def test_bulk_load_duplicate_codes(self):
+        self.payload['medications'][1]['code'] = 'BLK_A'
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['medications'][0], {})
+        self.assertEqual(response.data['medications'][1]['code'][0], 'Duplicate code in this batch.')
+        self.assertEqual(Medication.objects.count(), 0)
+
+    def test_bulk_load_reports_every_invalid_item(self):
+        self.payload['medications'][0]['name'] = 'Med A'
+        self.payload['medications'][1]['code'] = 'blk_b'
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data['medications'][0]), ['name'])
+        self.assertEqual(list(response.data['medications'][1]), ['code'])
+        self.assertEqual(Medication.objects.count(), 0)
+
+    def test_bulk_load_rejects_negative_weight(self):
+        self.payload['medications'][0]['weight'] = 1000
+        self.payload['medications'][1]['weight'] = -950
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([list(error) for error in response.data['medications']], [['weight'], ['weight']])
+        self.assertEqual(Medication.objects.count(), 0)
+
+    def test_bulk_load_rejects_images_not_in_storage(self):
+        self.payload['medications'][0]['image'] = 'photos/../../etc/passwd'
+        self.payload['medications'][1]['image'] = 'photos/missing.jpeg'
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['medications'][0]['image'], ['Enter the path of an uploaded image under photos/.'])
+        self.assertEqual(response.data['medications'][1]['image'], ['No uploaded image has this path.'])
+        self.assertEqual(Medication.objects.count(), 0)
+
+    def test_bulk_load_code_taken_after_validation(self):
+        # As if a concurrent load inserted BLK_B between validation and the INSERT
+        Medication.objects.create(name='Med-B', weight=1, code='BLK_B', image='photos/omega.jpeg')
+        with patch.object(BulkLoadMedicationSerializer, 'validate_medications', lambda serializer, value: value):
+            response = self.client.post(self.url, self.payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['medications'], [{}, {'code': [CODE_TAKEN_ERROR]}])
+        self.drone.refresh_from_db()
+        self.assertEqual(self.drone.loaded_weight, 0)
+        self.assertEqual(Medication.objects.filter(drone=self.drone).count(), 0)
+
+    def test_bulk_load_keeps_format_error_on_duplicate_code(self):
+        for item in self.payload['medications']:
+            item['code'] = 'blk_a'
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['medications'][1]['code'], [CODE_ERROR, 'Duplicate code in this batch.'])
+
+    def test_bulk_load_drone_not_found(self):
+        url = reverse('bulk_load_medication', kwargs={'id': 999})
+        response = self.client.post(url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['status'], 'Drone not found')
+
+
 class CheckLoadedMedicationsViewTest(APITestCase):
     def setUp(self):
         
@@ -167,6 +344,13 @@ class CheckLoadedMedicationsViewTest(APITestCase):
         self.assertEqual(response.data['status'], True)
         self.assertEqual(len(response.data['medications']), 2)
 
+    def test_loaded_medications_link_thumbnails(self):
+        Medication.objects.filter(pk=self.medication1.pk).update(image='photos/abc.jpeg', image_hash='abc', thumbnail='thumbnails/abc.jpg')
+        medications = self.client.get(self.url).data['medications']
+
+        self.assertTrue(medications[0]['thumbnail'].endswith('thumbnails/abc.jpg'))
+        self.assertIsNone(medications[1]['thumbnail'])
+
     def test_loaded_medications_not_exist(self):
         """Test case where no medications exist for the drone"""
         Medication.objects.filter(drone=self.drone).delete()
@@ -189,6 +373,42 @@ class CheckLoadedMedicationsViewTest(APITestCase):
         self.assertEqual(response.data['message'], 'Drone does not exist')
         
               
+class AsyncReadViewsTest(APITestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='ASY-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=64.0,
+            state='LOADING'
+        )
+        Medication.objects.create(name='Med1', weight=10, code='ASY_1', image='photos/omega.jpeg', drone=self.drone)
+        Medication.objects.create(name='Med2', weight=5, code='ASY_2', drone=self.drone)
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def assertSameBody(self, sync_name, async_name, id):
+        sync_response = self.client.get(reverse(sync_name, kwargs={'id': id}))
+        async_response = self.client.get(reverse(async_name, kwargs={'id': id}))
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+
+    def test_async_views_match_sync_views(self):
+        for id in (self.drone.id, self.drone.id + 1):
+            self.assertSameBody('check_drone_battery', 'async_check_drone_battery', id)
+            self.assertSameBody('loaded_medications', 'async_loaded_medications', id)
+
+    def test_async_medications_without_medications(self):
+        Medication.objects.all().delete()
+        self.assertSameBody('loaded_medications', 'async_loaded_medications', self.drone.id)
+
+    async def test_async_battery_under_async_client(self):
+        response = await self.async_client.get(reverse('async_check_drone_battery', kwargs={'id': self.drone.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['battery_level'], 64.0)
+
+
 class AvailableDronesForLoadingViewTest(APITestCase):
     def setUp(self):
         self.drone1 = Drone.objects.create(
@@ -233,8 +453,190 @@ class AvailableDronesForLoadingViewTest(APITestCase):
             self.assertIn('state', drone_data)
             self.assertGreaterEqual(drone_data['battery_capacity'], 25)
             self.assertEqual(drone_data['state'], 'IDLE')
+
+    def test_get_available_drones_single_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('available_drones_for_loading'))
+
+    @override_settings(FLEET_SNAPSHOT=True)
+    def test_available_drones_snapshot_refreshed_on_drone_change(self):
+        url = reverse('available_drones_for_loading')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['available_drones']), 1)
+
+        self.drone2.battery_capacity = 90.0
+        self.drone2.save()
+
+        # Only the changed drone is read back
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['available_drones']), 2)
              
               
+class DispatchPlanViewTest(APITestCase):
+    def setUp(self):
+        self.small = Drone.objects.create(
+            serial_number='PLN-001',
+            model='LIGHTWEIGHT',
+            weight_limit=100,
+            battery_capacity=80.0,
+            state='IDLE'
+        )
+        self.partly_loaded = Drone.objects.create(
+            serial_number='PLN-002',
+            model='HEAVYWEIGHT',
+            weight_limit=300,
+            loaded_weight=100,
+            battery_capacity=60.0,
+            state='LOADING'
+        )
+        Drone.objects.create(
+            serial_number='PLN-003',
+            model='HEAVYWEIGHT',
+            weight_limit=500,
+            battery_capacity=30.0,  # Below the battery floor used below
+            state='IDLE'
+        )
+        self.url = reverse('dispatch_plan')
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_plan_packs_heaviest_first_into_free_capacity(self):
+        payload = {
+            'battery_floor': 50,
+            'medications': [
+                {'code': 'A', 'weight': 60},
+                {'code': 'B', 'weight': 150},
+                {'code': 'C', 'weight': 90},
+                {'code': 'D', 'weight': 400},
+            ]
+        }
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        plans = {plan['serial_number']: plan for plan in response.data['assignments']}
+        self.assertEqual(plans['PLN-002']['medications'], ['B'])
+        self.assertEqual(plans['PLN-001']['medications'], ['C'])
+        self.assertEqual(plans['PLN-002']['remaining_weight'], 50)
+        self.assertEqual(response.data['unassigned'], ['D', 'A'])
+
+    def test_plan_invalid_payload(self):
+        response = self.client.post(self.url, {'medications': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NearestDronesViewTest(APITestCase):
+    def setUp(self):
+        positions = [(-1.30, 36.79), (-1.31, 36.81), (-1.20, 36.90), (-1.29, 36.82)]
+        self.drones = Drone.objects.bulk_create([
+            Drone(serial_number=f'NRB-{index:03d}', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=80.0,
+                  state='IDLE', latitude=latitude, longitude=longitude)
+            for index, (latitude, longitude) in enumerate(positions)
+        ])
+        # Nearest of all, but too full for 150 g
+        Drone.objects.filter(pk=self.drones[3].pk).update(loaded_weight=100, state='LOADING')
+        Drone.objects.create(serial_number='NRB-LOW', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=10.0,
+                             state='IDLE', latitude=-1.29, longitude=36.82)
+        Drone.objects.create(serial_number='NRB-NOWHERE', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=80.0, state='IDLE')
+        invalidate_drone_caches()
+        self.url = reverse('nearest_drones')
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_nearest_loadable_drones_first(self):
+        response = self.client.get(self.url, {'latitude': -1.29, 'longitude': 36.82, 'k': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([drone['serial_number'] for drone in response.data['drones']], ['NRB-003', 'NRB-001', 'NRB-000'])
+        self.assertEqual(response.data['drones'][0]['free_capacity'], 100)
+        self.assertAlmostEqual(response.data['drones'][1]['distance_km'], 2.487, places=2)
+
+    def test_weight_skips_drones_without_room(self):
+        response = self.client.get(self.url, {'latitude': -1.29, 'longitude': 36.82, 'weight': 150, 'k': 10})
+
+        self.assertEqual([drone['serial_number'] for drone in response.data['drones']], ['NRB-001', 'NRB-000', 'NRB-002'])
+
+    def test_invalid_point(self):
+        response = self.client.get(self.url, {'latitude': 91, 'longitude': 36.82})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('latitude', response.data)
+
+    def test_non_finite_point(self):
+        response = self.client.get(self.url, {'latitude': 'nan', 'longitude': 36.82, 'weight': 'inf'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(response.data), ['latitude', 'weight'])
+
+    def test_batch_answers_every_point_in_order(self):
+        payload = {'k': 1, 'points': [
+            {'latitude': -1.20, 'longitude': 36.90},
+            {'latitude': -1.29, 'longitude': 36.82, 'weight': 150},
+            {'latitude': 10.0, 'longitude': -170.0},
+        ]}
+        response = self.client.post(reverse('nearest_drones_batch'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([[drone['serial_number'] for drone in drones] for drones in response.data['results']],
+                         [['NRB-002'], ['NRB-001'], ['NRB-002']])
+
+    def test_batch_invalid_points(self):
+        payload = {'points': [{'latitude': -1.29, 'longitude': 36.82}, {'latitude': -1.29}]}
+        response = self.client.post(reverse('nearest_drones_batch'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['points'], [{}, {'longitude': ['Enter a number between -180 and 180.']}])
+
+
+class DroneTransitionViewTest(APITestCase):
+    def setUp(self):
+        self.drones = Drone.objects.bulk_create([
+            Drone(serial_number=f'TRN-{index:03d}', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=80.0, state='DELIVERED')
+            for index in range(5)
+        ])
+        self.drones[4].state = 'IDLE'
+        self.drones[4].save()
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_single_transition(self):
+        url = reverse('drone_transition', kwargs={'id': self.drones[0].id})
+        response = self.client.post(url, {'state': 'RETURNING'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'RETURNING')
+
+    def test_single_illegal_transition(self):
+        url = reverse('drone_transition', kwargs={'id': self.drones[0].id})
+        response = self.client.post(url, {'state': 'LOADING'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['status'], 'Drone cannot move from DELIVERED to LOADING')
+
+    def test_bulk_transition_reports_moved_and_skipped(self):
+        payload = {
+            'drones': [drone.id for drone in self.drones],
+            'from_state': 'DELIVERED',
+            'to_state': 'RETURNING'
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk_drone_transition'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'dispatch_drone' in query['sql']], ['UPDATE'])
+        self.assertEqual(response.data['transitioned'], 4)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertEqual(Drone.objects.filter(state='RETURNING').count(), 4)
+
+    def test_bulk_illegal_transition(self):
+        payload = {'drones': [self.drones[0].id], 'from_state': 'DELIVERED', 'to_state': 'IDLE'}
+        response = self.client.post(reverse('bulk_drone_transition'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Drone.objects.filter(state='DELIVERED').count(), 4)
+
+
 class CheckDroneBatteryLevelViewTest(APITestCase):
     def setUp(self):
         self.drone = Drone.objects.create(
@@ -267,3 +669,199 @@ class CheckDroneBatteryLevelViewTest(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data['status'], 'Drone not found')
+
+
+class TelemetryIngestViewTest(APITestCase):
+    def setUp(self):
+        # Test databases reuse ids, so ids cached by earlier tests must not leak in
+        serial_ids.clear()
+        self.drones = Drone.objects.bulk_create([
+            Drone(serial_number=f'TEL-{index:03d}', model='LIGHTWEIGHT', weight_limit=200, battery_capacity=90.0, state='IDLE')
+            for index in range(3)
+        ])
+        self.url = reverse('drone_telemetry')
+        self.now = timezone.now()
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def reading(self, serial_number, battery, seconds_ago=0):
+        return {'serial_number': serial_number, 'battery': battery, 'ts': (self.now - timezone.timedelta(seconds=seconds_ago)).isoformat()}
+
+    def test_ingest_updates_battery_and_appends_audits(self):
+        payload = [
+            self.reading('TEL-000', 50.0, seconds_ago=10),
+            self.reading('TEL-000', 40.0),
+            self.reading('TEL-001', 30.0),
+            self.reading('NOPE-001', 10.0),
+        ]
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertEqual(response.data['unknown_serial_numbers'], ['NOPE-001'])
+        # The newest reading wins regardless of its position in the batch
+        self.assertEqual(Drone.objects.get(serial_number='TEL-000').battery_capacity, 40.0)
+        self.assertEqual(Drone.objects.get(serial_number='TEL-001').battery_capacity, 30.0)
+        self.assertEqual(Drone.objects.get(serial_number='TEL-002').battery_capacity, 90.0)
+        audit = DroneBatteryAudit.objects.get(drone=self.drones[0], battery_level=50.0)
+        self.assertEqual(audit.timestamp, self.now - timezone.timedelta(seconds=10))
+        self.assertEqual(audit.task_name, 'telemetry')
+
+    @patch('dispatch.telemetry.schedule_delete_expired_audit_logs')
+    @patch('dispatch.telemetry.publish_battery_levels')
+    def test_newest_reading_wins_across_statement_batches(self, mock_publish, mock_schedule):
+        payload = [
+            {**self.reading('TEL-000', 40.0), 'latitude': -1.2, 'longitude': 36.8},
+            {**self.reading('TEL-000', 70.0, seconds_ago=30), 'latitude': -1.5, 'longitude': 36.5},
+            self.reading('TEL-000', 60.0, seconds_ago=20),
+        ]
+        readings, _ = parse_readings(payload)
+        with self.captureOnCommitCallbacks(execute=True):
+            accepted, _ = ingest_readings(readings, batch_size=1)
+
+        self.assertEqual(accepted, 3)
+        drone = Drone.objects.get(serial_number='TEL-000')
+        self.assertEqual((drone.battery_capacity, drone.latitude, drone.longitude), (40.0, -1.2, 36.8))
+        mock_publish.assert_called_once_with({self.drones[0].id: 40.0})
+
+    def test_known_serials_are_resolved_from_the_cache(self):
+        payload = [self.reading(drone.serial_number, 60.0) for drone in self.drones]
+        self.client.post(self.url, payload, format='json')
+        # Warm cache: one bulk UPDATE and one INSERT, plus the savepoint pair
+        with self.assertNumQueries(4):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.data['accepted'], 3)
+
+    def test_deleted_drone_is_reported_unknown(self):
+        deleted_id = self.drones[2].id
+        self.drones[2].delete()
+        # As if another process deleted the drone: this process still has its id cached
+        serial_ids.ids['TEL-002'] = deleted_id
+
+        response = self.client.post(self.url, [self.reading('TEL-002', 50.0), self.reading('TEL-001', 50.0)], format='json')
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['unknown_serial_numbers'], ['TEL-002'])
+        self.assertNotIn('TEL-002', serial_ids.ids)
+
+    def test_readings_update_positions(self):
+        payload = [
+            {**self.reading('TEL-000', 50.0, seconds_ago=10), 'latitude': -1.0, 'longitude': 36.0},
+            {**self.reading('TEL-000', 45.0, seconds_ago=5), 'latitude': -1.5, 'longitude': 36.5},
+            self.reading('TEL-000', 40.0),
+        ]
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        drone = Drone.objects.get(serial_number='TEL-000')
+        # The newest reading without a position keeps the newest position reported
+        self.assertEqual((drone.battery_capacity, drone.latitude, drone.longitude), (40.0, -1.5, 36.5))
+        self.assertIsNone(Drone.objects.get(serial_number='TEL-001').latitude)
+
+    def test_position_needs_both_coordinates(self):
+        response = self.client.post(self.url, [{**self.reading('TEL-000', 50.0), 'latitude': 95.0}], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data[0]), {'latitude', 'longitude'})
+
+    def test_invalid_readings(self):
+        payload = [self.reading('TEL-000', 50.0), {'serial_number': 'TEL-001', 'battery': 120, 'ts': 'yesterday'}]
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(set(response.data[1]), {'battery', 'ts'})
+        self.assertFalse(DroneBatteryAudit.objects.exists())
+
+
+class DroneBatteryHistoryAPIViewTest(APITestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='HST-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=75.0,
+            state='IDLE'
+        )
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timezone.timedelta(hours=3)
+        for hour in range(3):
+            bucket_start = self.start + timezone.timedelta(hours=hour)
+            DroneBatteryRollup.objects.create(
+                drone=self.drone, period='HOUR', bucket_start=bucket_start, sample_count=2,
+                min_level=70.0, max_level=80.0, sum_level=150.0, last_level=70.0, last_timestamp=bucket_start
+            )
+        self.url = reverse('drone_battery_history', kwargs={'id': self.drone.id})
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_history_returns_hourly_buckets(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['avg_level'], 75.0)
+
+    def test_history_filters_by_range(self):
+        response = self.client.get(self.url, {'start': (self.start + timezone.timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_history_invalid_period(self):
+        response = self.client.get(self.url, {'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DroneBatteryAuditListAPIViewTest(APITestCase):
+    def setUp(self):
+        self.drone1 = Drone.objects.create(
+            serial_number='AUD-001',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=75.0,
+            state='IDLE'
+        )
+        self.drone2 = Drone.objects.create(
+            serial_number='AUD-002',
+            model='LIGHTWEIGHT',
+            weight_limit=200,
+            battery_capacity=55.0,
+            state='IDLE'
+        )
+        for drone in (self.drone1, self.drone2):
+            for _ in range(3):
+                DroneBatteryAudit.objects.create(drone=drone, battery_level=drone.battery_capacity, task_name='test')
+        self.url = reverse('drone-battery-audit-list')
+
+    def tearDown(self):
+        Drone.objects.all().delete()
+
+    def test_audit_list_is_cursor_paginated(self):
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_audit_list_filters(self):
+        response = self.client.get(self.url, {'drone': self.drone1.id})
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.client.get(self.url, {'serial_number': 'AUD-002'})
+        self.assertEqual({audit['drone'] for audit in response.data['results']}, {self.drone2.id})
+
+        response = self.client.get(self.url, {'since': (timezone.now() + timezone.timedelta(minutes=1)).isoformat()})
+        self.assertEqual(response.data['results'], [])
+
+    def test_audit_list_invalid_filter(self):
+        response = self.client.get(self.url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_audit_list_stream(self):
+        response = self.client.get(self.url, {'stream': 'true', 'drone': self.drone2.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audits = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(audits), 3)
+        self.assertEqual(audits[0]['battery_level'], 55.0)
@@ -1,14 +1,27 @@
 from django import views
 from django.urls import path
-from .views import  AvailableDronesForLoadingView, CheckDroneBatteryLevelView, CheckLoadedMedicationsView, LoadMedicationView, RegisterDroneView, DroneBatteryAuditListAPIView
+from .views import async_drone_battery_level, async_loaded_medications, fleet_events, task_metrics
+from .views import  AvailableDronesForLoadingView, BulkDroneTransitionView, BulkLoadMedicationView, CheckDroneBatteryLevelView, CheckLoadedMedicationsView, DispatchPlanView, DroneTransitionView, LoadMedicationView, NearestDronesBatchView, NearestDronesView, RegisterDroneView, DroneBatteryAuditListAPIView, DroneBatteryHistoryAPIView, TelemetryIngestView
 
 urlpatterns = [
     path('drone/register/', RegisterDroneView.as_view(), name='register_drone'),
     path('drone/<int:id>/load/', LoadMedicationView.as_view(), name='load_medication'),
+    path('drone/<int:id>/load/batch/', BulkLoadMedicationView.as_view(), name='bulk_load_medication'),
     path('drone/<int:id>/medications/', CheckLoadedMedicationsView.as_view(), name='loaded_medications'),
     path('drone/available-drones/', AvailableDronesForLoadingView.as_view(), name='available_drones_for_loading'),
+    path('drone/plan/', DispatchPlanView.as_view(), name='dispatch_plan'),
+    path('drone/nearest/', NearestDronesView.as_view(), name='nearest_drones'),
+    path('drone/nearest/batch/', NearestDronesBatchView.as_view(), name='nearest_drones_batch'),
+    path('drone/<int:id>/transition/', DroneTransitionView.as_view(), name='drone_transition'),
+    path('drone/transition/', BulkDroneTransitionView.as_view(), name='bulk_drone_transition'),
     path('drone/<int:id>/battery/', CheckDroneBatteryLevelView.as_view(), name='check_drone_battery'),
+    path('drone/<int:id>/battery/history/', DroneBatteryHistoryAPIView.as_view(), name='drone_battery_history'),
+    path('drone/telemetry/', TelemetryIngestView.as_view(), name='drone_telemetry'),
+    path('async/drone/<int:id>/medications/', async_loaded_medications, name='async_loaded_medications'),
+    path('async/drone/<int:id>/battery/', async_drone_battery_level, name='async_check_drone_battery'),
+    path('events/fleet/', fleet_events, name='fleet_events'),
     path('drone-audit/', DroneBatteryAuditListAPIView.as_view(), name='drone-battery-audit-list'),
+    path('metrics/', task_metrics, name='task_metrics'),
 ]
 
 
@@ -0,0 +1,48 @@
+"""
+Medication naming rules shared by Medication.clean(), the medication serializers and
+batch loading.
+
+The patterns are compiled once at import. medication_errors() checks one medication;
+validate_medications() checks a whole batch in one pass and reports every item's
+errors rather than stopping at the first invalid one.
+"""
+import re
+
+NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+CODE_PATTERN = re.compile(r'[A-Z0-9_]+')
+
+NAME_ERROR = 'Name may only contain letters, numbers, "-" and "_".'
+CODE_ERROR = 'Code may only contain upper case letters, numbers and "_".'
+# Worded like the unique-field error DRF gives for a single medication
+CODE_TAKEN_ERROR = 'medication with this code already exists.'
+
+
+def medication_errors(name, code):
+    """Return ``{field: [message]}`` for the rules ``name`` and ``code`` break; empty when both are valid."""
+    errors = {}
+    if not isinstance(name, str) or NAME_PATTERN.fullmatch(name) is None:
+        errors['name'] = [NAME_ERROR]
+    if not isinstance(code, str) or CODE_PATTERN.fullmatch(code) is None:
+        errors['code'] = [CODE_ERROR]
+    return errors
+
+
+def validate_medications(items):
+    """
+    Check the ``name`` and ``code`` of every dict in ``items``. Returns a list of error
+    dicts aligned with ``items``, or an empty list when every item is valid.
+    """
+    match_name = NAME_PATTERN.fullmatch
+    match_code = CODE_PATTERN.fullmatch
+    errors = []
+    invalid = False
+    for item in items:
+        name = item.get('name')
+        code = item.get('code')
+        # Both fields are almost always valid strings; fall back to the full check otherwise
+        if type(name) is str and type(code) is str and match_name(name) and match_code(code):
+            errors.append({})
+        else:
+            errors.append(medication_errors(name, code))
+            invalid = True
+    return errors if invalid else []
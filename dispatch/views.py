@@ -1,22 +1,134 @@
-from django.db.models import Sum
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render
-from rest_framework import generics, status
+from django.core.exceptions import ValidationError
+from functools import lru_cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from celery import current_app
+from rest_framework import generics, serializers, status
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db import transaction
-from dispatch.models import Drone, DroneBatteryAudit, Medication
-from dispatch.serializers import AvailableDroneSerializer, DroneBatteryAuditSerializer, DroneLodedMedicationSerializer, DroneSerializer, MedicationSerializer
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from dispatch import images
+from dispatch.caching import drone_rows_changed, get_available_drones
+from dispatch.choices import LOADABLE_STATES, ROLLUP_PERIOD_CHOICES
+from dispatch.events import broker, relay, publish_transition, stream_events
+from dispatch.fleet import aget_drone, get_fleet, mission_battery
+from dispatch.locator import MAX_NEAREST, get_locator, parse_points
+from dispatch.metrics import render_metrics
+from dispatch.models import Drone, DroneBatteryAudit, DroneBatteryRollup, Medication
+from dispatch.pagination import DroneBatteryAuditCursorPagination
+from dispatch.planner import loadable_drones, plan_dispatch
+from dispatch.renderers import PrerenderedJSONRenderer
+from dispatch.tasks import schedule_image_processing
+from dispatch.telemetry import ingest_readings, parse_readings
+from dispatch.validators import CODE_TAKEN_ERROR
+from dispatch.serializers import AvailableDroneSerializer, BulkDroneTransitionSerializer, BulkLoadMedicationSerializer, DroneBatteryAuditSerializer, DroneBatteryRollupSerializer, DispatchPlanSerializer, DroneLodedMedicationSerializer, DroneSerializer, DroneTransitionSerializer, LoadMedicationSerializer, MedicationSerializer, NearestDronesSerializer
 
 
 
 # Create your views here.
 
+def loading_error_response(drone, rejected_weight=None):
+    """
+    Return the 400 response explaining why ``drone`` cannot be loaded, or None if it can.
+    Pass ``rejected_weight`` once a weight reservation has failed so the response falls
+    back to the weight limit message.
+    """
+    if drone.state not in LOADABLE_STATES:
+        return Response({'status': 'Drone must be in IDLE or LOADING state to start loading medications'}, status=status.HTTP_400_BAD_REQUEST)
+    if drone.battery_capacity < 25:
+        return Response({'status': 'Battery level is below 25%'}, status=status.HTTP_400_BAD_REQUEST)
+    if mission_battery(drone.battery_capacity, drone.discharge_rate) < 25:
+        return Response({
+            'status': f'Battery level is forecast to fall below 25% during a {settings.MISSION_DURATION_MINUTES} minute mission'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if rejected_weight is not None:
+        return Response({
+            'status': f'Total weight exceeds drone weight limit of {drone.weight_limit}',
+            'remaining_weight': drone.weight_limit - drone.loaded_weight
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+def parse_datetime_param(params, name):
+    """Parse the ISO 8601 query parameter ``name``, raising a 400 ValidationError if it is invalid."""
+    try:
+        value = parse_datetime(params[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise serializers.ValidationError({name: 'Enter a valid ISO 8601 datetime.'})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+# Medication columns fetched alongside the drone by drone_medication_rows()
+MEDICATION_FIELDS = ('id', 'name', 'weight', 'code', 'image', 'thumbnail')
+
+
+def drone_medication_rows(id):
+    """
+    The drone and its medications as one LEFT JOIN: a row per medication, or a single row
+    with the medication columns set to None when the drone has none. No rows means no drone.
+    """
+    return (
+        Drone.objects.filter(id=id)
+        .order_by('medications__id')
+        .values(*DroneLodedMedicationSerializer.Meta.fields, *(f'medications__{field}' for field in MEDICATION_FIELDS))
+    )
+
+
+def loaded_medications_body(rows):
+    """Build the loaded-medications response from drone_medication_rows(), shaped like MedicationSerializer output."""
+    # Drones usually carry several medications sharing one image, so resolve each URL once
+    image_url = lru_cache(maxsize=None)(Medication._meta.get_field('image').storage.url)
+    drone = {field: rows[0][field] for field in DroneLodedMedicationSerializer.Meta.fields}
+    medications = [{
+        'id': row['medications__id'],
+        'name': row['medications__name'],
+        'weight': row['medications__weight'],
+        'code': row['medications__code'],
+        'image': image_url(row['medications__image']) if row['medications__image'] else None,
+        'thumbnail': image_url(row['medications__thumbnail']) if row['medications__thumbnail'] else None,
+        'drone': drone['id'],
+    } for row in rows if row['medications__id'] is not None]
+
+    body = {'status': True, 'drone': drone}
+    if not medications:
+        body['message'] = 'This drone has no medications associated with it'
+    body['medications'] = medications
+    return body
+
+
+def stream_json_array(rows, chunk_size):
+    """Yield ``rows`` as the pieces of one JSON array, ``chunk_size`` rows at a time."""
+    encoder = DjangoJSONEncoder()
+    separator = '['
+    chunk = []
+    for row in rows:
+        chunk.append(separator + encoder.encode(row))
+        separator = ','
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append('[]' if separator == '[' else ']')
+    yield ''.join(chunk)
+
+
 class RegisterDroneView(generics.CreateAPIView):
-    q_set = Drone.objects.all()
+    # DroneSerializer lists medication names; prefetch them if this view ever reads drones
+    queryset = Drone.objects.prefetch_related(Prefetch('medications', queryset=Medication.objects.only('id', 'name', 'drone_id')))
     serializer_class = DroneSerializer
     
 class LoadMedicationView(APIView):
-    serializer_class = MedicationSerializer
+    serializer_class = LoadMedicationSerializer
 
     def post(self, request, id):
         try:
@@ -25,95 +137,129 @@ class LoadMedicationView(APIView):
             return Response({'status': 'Drone not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # Check drone state and battery level
-        if drone.state not in ['IDLE', 'LOADING']:
-            return Response({'status': 'Drone must be in IDLE or LOADING state to start loading medications'}, status=status.HTTP_400_BAD_REQUEST)
-        if drone.battery_capacity < 25:
-            return Response({'status': 'Battery level is below 25%'}, status=status.HTTP_400_BAD_REQUEST)
+        error_response = loading_error_response(drone)
+        if error_response:
+            return error_response
 
         # Validate payload for medication
         medication_data = request.data
         if not medication_data:
             return Response({'status': 'No medication specified'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_weight = int(medication_data.get('weight', 0))
-        current_weight = Medication.objects.filter(drone=drone).aggregate(total_weight=Sum('weight'))['total_weight'] or 0
-
-        if total_weight + current_weight > drone.weight_limit:
-            return Response({'status': f'Total weight exceeds drone weight limit of {drone.weight_limit}'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.serializer_class(data=medication_data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         # Use transaction.atomic to ensure atomicity
+        stored_image = None
         try:
             with transaction.atomic():
-                medication_data['drone'] = id
-                serializer = self.serializer_class(data=medication_data)
-                if serializer.is_valid():
-                    medication = serializer.save()
-
-                    # Update drone state based on total weight loaded
-                    if total_weight + current_weight == drone.weight_limit:
-                        drone.state = 'LOADED'
-                    else:
-                        drone.state = 'LOADING'
-                    drone.save()
-
-                    remaining_weight = drone.weight_limit - (total_weight + current_weight)
-
-                    return Response({
-                        'status': 'Medication loaded successfully',
-                        'medication': serializer.data,
-                        'remaining_weight': remaining_weight
-                    }, status=status.HTTP_200_OK)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                # Reserve the weight on the drone row first; this re-checks state, battery and
+                # capacity atomically, so concurrent loads cannot overload the drone
+                weight = serializer.validated_data['weight']
+                if not drone.reserve_weight(weight):
+                    return loading_error_response(drone, weight)
+
+                # Only stored once the weight is reserved; removed below if the INSERT rolls back
+                image, created = images.store_upload(serializer.validated_data['image'])
+                if created:
+                    stored_image = image
+                medication = serializer.save(drone=drone, image=image)
+                drone_rows_changed([drone.id])
+                transaction.on_commit(lambda: schedule_image_processing([medication.id]))
+
+            return Response({
+                'status': 'Medication loaded successfully',
+                'medication': serializer.data,
+                'remaining_weight': drone.weight_limit - drone.loaded_weight
+            }, status=status.HTTP_200_OK)
         except Exception as e:
+            if stored_image is not None:
+                images.discard_upload(stored_image)
             return Response({
                 'status': False,
                 'message': 'Unexpected error occurred!',
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-class CheckLoadedMedicationsView(APIView):
-    serializer_class = MedicationSerializer
 
-    def get(self, request, id):
+class BulkLoadMedicationView(APIView):
+    serializer_class = BulkLoadMedicationSerializer
+
+    def post(self, request, id):
         try:
             drone = Drone.objects.get(id=id)
         except Drone.DoesNotExist:
+            return Response({'status': 'Drone not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        error_response = loading_error_response(drone)
+        if error_response:
+            return error_response
+
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items = serializer.validated_data['medications']
+        batch_weight = sum(item['weight'] for item in items)
+
+        # One reservation for the whole batch locks the drone row until the medications are inserted
+        try:
+            with transaction.atomic():
+                if not drone.reserve_weight(batch_weight):
+                    return loading_error_response(drone, batch_weight)
+
+                medications = Medication.objects.bulk_create([Medication(drone=drone, **item) for item in items])
+                drone_rows_changed([drone.id])
+                # Batch items name images already in storage, which may be shared; never delete them
+                transaction.on_commit(lambda: schedule_image_processing([medication.id for medication in medications]))
+        except IntegrityError:
+            # A concurrent load took one of the codes after validation; report it as validation would have
+            codes = [item['code'] for item in items]
+            taken = set(Medication.objects.filter(code__in=codes).values_list('code', flat=True))
+            if not taken:
+                raise
             return Response({
-                'status': False,
-                'message': 'Drone does not exist',
-            }, status=status.HTTP_404_NOT_FOUND)
+                'medications': [{'code': [CODE_TAKEN_ERROR]} if code in taken else {} for code in codes]
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'Medications loaded successfully',
+            'results': [
+                {'id': medication.id, 'code': medication.code, 'weight': medication.weight, 'status': 'Loaded'}
+                for medication in medications
+            ],
+            'remaining_weight': drone.weight_limit - drone.loaded_weight
+        }, status=status.HTTP_200_OK)
+
+
+class CheckLoadedMedicationsView(APIView):
+    serializer_class = MedicationSerializer
+
+    def get(self, request, id):
+        try:
+            rows = list(drone_medication_rows(id))
         except Exception as e:  # Catch any other exceptions, such as database errors
             return Response({
                 'status': False,
                 'message': str(e),
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        medications = Medication.objects.filter(drone=drone)
-        medication_serializer = self.serializer_class(medications, many=True)
-        drone_serializer = DroneLodedMedicationSerializer(drone)
-
-        if medications.exists():
-            return Response({
-                'status': True,
-                'drone': drone_serializer.data,
-                'medications': medication_serializer.data,
-            }, status=status.HTTP_200_OK)
-        else:
+        if not rows:
             return Response({
-                'status': True,
-                'drone': drone_serializer.data,
-                'message': 'This drone has no medications associated with it',
-                'medications': medication_serializer.data
-            }, status=status.HTTP_200_OK)
+                'status': False,
+                'message': 'Drone does not exist',
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response(loaded_medications_body(rows), status=status.HTTP_200_OK)
                  
             
 class AvailableDronesForLoadingView(APIView):
     serializer_class = AvailableDroneSerializer
+    renderer_classes = [PrerenderedJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request):
-        available_drones = Drone.objects.filter(state='IDLE', battery_capacity__gte=25)  # Use greater or equal to include drones with 25% battery or more
-        serializer = self.serializer_class(available_drones, many=True)
+        fleet = get_fleet()
+        available_drones = get_available_drones(fleet)
         
         if not available_drones:
             return Response({
@@ -121,18 +267,147 @@ class AvailableDronesForLoadingView(APIView):
                 'message': 'No available drones for loading medications.'
             }, status=status.HTTP_404_NOT_FOUND)
         
+        body = {
+            'status': 'Success',
+            'available_drones': available_drones
+        }
+        response = Response(body, status=status.HTTP_200_OK)
+        response.prerendered_json = fleet.derived('available-drones-json', lambda: JSONRenderer().render(body))
+        return response
+            
+
+def nearby_drones(nearest):
+    """Serialize the ``(DroneSnapshot, distance_km)`` pairs of a nearest-drones search."""
+    return [{
+        'id': drone.id,
+        'serial_number': drone.serial_number,
+        'model': drone.model,
+        'battery_capacity': drone.battery_capacity,
+        'free_capacity': drone.weight_limit - drone.loaded_weight,
+        'latitude': drone.latitude,
+        'longitude': drone.longitude,
+        'distance_km': round(distance, 3),
+    } for drone, distance in nearest]
+
+
+class NearestDronesView(APIView):
+    """
+    The ``k`` loadable drones nearest to a pickup point (``latitude``, ``longitude``) that
+    can carry ``weight`` more grams, nearest first. Drones that never reported a position
+    are not considered.
+    """
+    serializer_class = NearestDronesSerializer
+
+    def get(self, request):
+        serializer = self.serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        point = serializer.validated_data
+        [nearest] = get_locator().nearest([point['latitude']], [point['longitude']], [point['weight']], point['k'])
         return Response({
             'status': 'Success',
-            'available_drones': serializer.data
+            'drones': nearby_drones(nearest),
         }, status=status.HTTP_200_OK)
-            
+
+
+class NearestDronesBatchView(APIView):
+    """
+    NearestDronesView for many pickup points at once: ``{"points": [{latitude, longitude,
+    weight}, ...], "k": 5}``. Results are listed in the order of the points.
+    """
+
+    def post(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        k = data.get('k', 5)
+        if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_NEAREST:
+            return Response({'k': [f'Enter a whole number between 1 and {MAX_NEAREST}.']}, status=status.HTTP_400_BAD_REQUEST)
+        (latitudes, longitudes, weights), errors = parse_points(data.get('points'))
+        if errors:
+            return Response({'points': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = get_locator().nearest(latitudes, longitudes, weights, k)
+        return Response({
+            'status': 'Success',
+            'results': [nearby_drones(nearest) for nearest in results],
+        }, status=status.HTTP_200_OK)
+
+
+class DispatchPlanView(APIView):
+    """
+    Plan how a batch of pending medications should be spread across the loadable drones.
+    Nothing is loaded; the plan can be carried out with the batch load endpoint.
+    """
+    serializer_class = DispatchPlanSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        medications = serializer.validated_data['medications']
+        assignments, unassigned = plan_dispatch(medications, loadable_drones(serializer.validated_data['battery_floor']))
+
+        return Response({
+            'status': 'Success',
+            'assignments': assignments,
+            'unassigned': [medication['code'] for medication in unassigned],
+        }, status=status.HTTP_200_OK)
+
+
+class DroneTransitionView(APIView):
+    serializer_class = DroneTransitionSerializer
+
+    def post(self, request, id):
+        drone = get_object_or_404(Drone, id=id)
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            moved = drone.transition_to(serializer.validated_data['state'])
+        except ValidationError as e:
+            return Response({'status': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        if not moved:
+            return Response({
+                'status': 'Drone state changed while the transition was being made',
+                'state': drone.state
+            }, status=status.HTTP_409_CONFLICT)
+
+        drone_rows_changed([drone.id])
+        return Response({'status': 'Success', 'state': drone.state}, status=status.HTTP_200_OK)
+
+
+class BulkDroneTransitionView(APIView):
+    """Move every listed drone that is in ``from_state`` to ``to_state`` with one UPDATE."""
+    serializer_class = BulkDroneTransitionSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        drone_ids = set(serializer.validated_data['drones'])
+        with transaction.atomic():
+            moved = Drone.objects.filter(pk__in=drone_ids).transition(
+                serializer.validated_data['from_state'], serializer.validated_data['to_state'])
+            if moved:
+                drone_rows_changed(drone_ids)
+                transaction.on_commit(lambda: publish_transition(
+                    drone_ids, serializer.validated_data['from_state'], serializer.validated_data['to_state']))
+
+        return Response({
+            'status': 'Success',
+            'transitioned': moved,
+            'skipped': len(drone_ids) - moved
+        }, status=status.HTTP_200_OK)
+
 
 class CheckDroneBatteryLevelView(APIView):
 
     def get(self, request, id):
-        try:
-            drone = Drone.objects.get(id=id)
-        except Drone.DoesNotExist:
+        drone = get_fleet().get(id)
+        if drone is None:
             return Response({
                 'status': 'Drone not found'
             }, status=status.HTTP_404_NOT_FOUND)
@@ -141,10 +416,135 @@ class CheckDroneBatteryLevelView(APIView):
             'status': 'Success',
             'id': drone.id,
             'drone_serial_number':drone.serial_number,
-            'battery_level': drone.battery_capacity
+            'battery_level': drone.battery_capacity,
+            'discharge_rate': drone.discharge_rate,
+            'mission_battery_level': round(mission_battery(drone.battery_capacity, drone.discharge_rate), 2)
         }, status=status.HTTP_200_OK)
         
         
+class TelemetryIngestView(APIView):
+    """Accept a JSON array of ``{serial_number, battery, ts}`` battery readings."""
+
+    def post(self, request):
+        readings, errors = parse_readings(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        accepted, unknown = ingest_readings(readings)
+        return Response({
+            'status': 'Success',
+            'accepted': accepted,
+            'unknown_serial_numbers': unknown
+        }, status=status.HTTP_200_OK)
+
+
 class DroneBatteryAuditListAPIView(generics.ListAPIView):
-    queryset = DroneBatteryAudit.objects.all()
-    serializer_class = DroneBatteryAuditSerializer
\ No newline at end of file
+    """
+    Battery audits, newest first, with cursor pagination. Filter with ``drone`` (id),
+    ``serial_number``, ``since`` and ``until`` (ISO 8601 datetimes). ``stream=true``
+    returns every matching audit as one streamed JSON array instead of pages.
+    """
+    serializer_class = DroneBatteryAuditSerializer
+    pagination_class = DroneBatteryAuditCursorPagination
+    stream_chunk_size = 2000
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = DroneBatteryAudit.objects.only('id', 'drone_id', 'battery_level', 'timestamp')
+        if params.get('drone'):
+            if not params['drone'].isdigit():
+                raise serializers.ValidationError({'drone': 'A valid integer is required.'})
+            queryset = queryset.filter(drone_id=params['drone'])
+        if params.get('serial_number'):
+            queryset = queryset.filter(drone__serial_number=params['serial_number'])
+        if params.get('since'):
+            queryset = queryset.filter(timestamp__gte=parse_datetime_param(params, 'since'))
+        if params.get('until'):
+            queryset = queryset.filter(timestamp__lte=parse_datetime_param(params, 'until'))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream', '').lower() not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+
+        rows = (
+            self.get_queryset().order_by(*self.pagination_class.ordering)
+            .values('drone', 'battery_level', 'timestamp')
+            .iterator(chunk_size=self.stream_chunk_size)
+        )
+        return StreamingHttpResponse(stream_json_array(rows, self.stream_chunk_size), content_type='application/json')
+
+
+class DroneBatteryHistoryAPIView(generics.ListAPIView):
+    """
+    Battery history for one drone served from the hourly or daily rollups, optionally
+    limited to buckets starting within ``start``..``end`` (ISO 8601 datetimes).
+    """
+    serializer_class = DroneBatteryRollupSerializer
+
+    def get_queryset(self):
+        period = self.request.query_params.get('period', 'HOUR').upper()
+        if period not in dict(ROLLUP_PERIOD_CHOICES):
+            raise serializers.ValidationError({'period': f'"{period}" is not a valid choice.'})
+
+        queryset = DroneBatteryRollup.objects.filter(drone_id=self.kwargs['id'], period=period)
+        params = self.request.query_params
+        if params.get('start'):
+            queryset = queryset.filter(bucket_start__gte=parse_datetime_param(params, 'start'))
+        if params.get('end'):
+            queryset = queryset.filter(bucket_start__lte=parse_datetime_param(params, 'end'))
+        return queryset.order_by('bucket_start')
+
+
+# Async read paths for high-frequency pollers. They return the same bodies as
+# CheckDroneBatteryLevelView and CheckLoadedMedicationsView, but are plain Django
+# async views on the async ORM, so under an ASGI server a waiting query does not
+# hold a worker thread. DRF's APIView has no async support.
+
+@require_GET
+async def async_drone_battery_level(request, id):
+    drone = await aget_drone(id)
+    if drone is None:
+        return JsonResponse({'status': 'Drone not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    return JsonResponse({
+        'status': 'Success',
+        'id': drone.id,
+        'drone_serial_number': drone.serial_number,
+        'battery_level': drone.battery_capacity,
+        'discharge_rate': drone.discharge_rate,
+        'mission_battery_level': round(mission_battery(drone.battery_capacity, drone.discharge_rate), 2)
+    })
+
+
+@require_GET
+async def async_loaded_medications(request, id):
+    rows = [row async for row in drone_medication_rows(id)]
+    if not rows:
+        return JsonResponse({
+            'status': False,
+            'message': 'Drone does not exist',
+        }, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse(loaded_medications_body(rows))
+
+
+@require_GET
+async def fleet_events(request):
+    """
+    Server-sent events for fleet changes: "drone" snapshots, "battery" levels, bulk
+    "transition"s and "removed" drones. Serve it from the ASGI server; clients load
+    the current fleet once and then apply events instead of polling.
+    """
+    if relay is not None:
+        relay.ensure_listener()
+    response = StreamingHttpResponse(stream_events(broker.subscribe()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx buffering the stream
+    return response
+
+
+@require_GET
+def task_metrics(request):
+    """Prometheus metrics for the dispatch Celery tasks, as recorded by the workers."""
+    task_names = sorted(name for name in current_app.tasks if name.startswith('dispatch.'))
+    return HttpResponse(render_metrics(task_names), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from celery.schedules import crontab
 
 
@@ -56,6 +57,22 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL profiling; see dispatch/profiling.py
+QUERY_PROFILING = config('QUERY_PROFILING', default=False, cast=bool)
+if QUERY_PROFILING:
+    MIDDLEWARE.insert(0, 'dispatch.profiling.QueryProfilingMiddleware')
+
+# Share of requests profiled, from 0 to 1
+QUERY_PROFILING_SAMPLE_RATE = config('QUERY_PROFILING_SAMPLE_RATE', default=0.1, cast=float)
+
+# Profiled requests at or over either threshold are kept for /admin/query-profiles/
+QUERY_PROFILING_SLOW_REQUEST_MS = config('QUERY_PROFILING_SLOW_REQUEST_MS', default=100, cast=float)
+QUERY_PROFILING_MAX_QUERIES = config('QUERY_PROFILING_MAX_QUERIES', default=20, cast=int)
+
+# Slow requests kept, worst database time first, and statements listed per request
+QUERY_PROFILING_BUFFER_SIZE = config('QUERY_PROFILING_BUFFER_SIZE', default=100, cast=int)
+QUERY_PROFILING_TOP_STATEMENTS = config('QUERY_PROFILING_TOP_STATEMENTS', default=5, cast=int)
+
 ROOT_URLCONF = 'drone_dispatch.urls'
 
 TEMPLATES = [
@@ -80,12 +97,80 @@ WSGI_APPLICATION = 'drone_dispatch.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects SQLite (the default, for local development) or PostgreSQL (docker-compose)
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+# Seconds a connection is kept open across requests; 0 closes it after every request.
+# Keep it 0 under ASGI, where each request runs in its own thread and a persistent
+# connection would be opened per thread; put PgBouncer in front instead.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+# Set to "pgbouncer" when DB_HOST is a PgBouncer in transaction pooling mode
+DB_POOLER = config('DB_POOLER', default='')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='mydatabase'),
+            'USER': config('DB_USER', default='myuser'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='db'),
+            'PORT': config('DB_PORT', default=5432, cast=int),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Check a persistent connection before reusing it, so a restarted server costs no failed request
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors do not survive transaction pooling, where each transaction may get another server connection
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
     }
-}
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # WAL journal and immediate transactions; see dispatch/backends/sqlite3/base.py
+            'ENGINE': 'dispatch.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds a writer waits for the write lock before failing with "database is locked"
+                'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=float),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgres', not {DB_ENGINE!r}")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Shared across web and Celery processes through Redis when REDIS_URL is set
+
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Serve battery, availability and planning reads from a per-process fleet snapshot. The
+# snapshot is invalidated through a version counter in the default cache, so it needs a
+# cache every process shares; without REDIS_URL each read queries the database instead
+FLEET_SNAPSHOT = config('FLEET_SNAPSHOT', default=bool(REDIS_URL), cast=bool)
+
+# Seconds a process may keep serving its fleet snapshot after another process changed a drone; 0 always checks
+FLEET_SNAPSHOT_MAX_STALENESS = config('FLEET_SNAPSHOT_MAX_STALENESS', default=0, cast=float)
 
 
 # Password validation
@@ -136,6 +221,37 @@ CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'django-db'  
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Whether the dispatch tasks write a django_celery_results row per run. Nothing reads those
+# results, and signal-scheduled cleanups would add one row each; task metrics are at /metrics/
+STORE_TASK_RESULTS = config('STORE_TASK_RESULTS', default=False, cast=bool)
+
+
+# Delay before a signal-scheduled delete_expired_audit_logs run; writes within it share one run
+AUDIT_CLEANUP_DEBOUNCE_SECONDS = config('AUDIT_CLEANUP_DEBOUNCE_SECONDS', default=60, cast=int)
+
+# Upper bound on audit rows removed per DELETE by delete_expired_audit_logs
+AUDIT_CLEANUP_CHUNK_SIZE = config('AUDIT_CLEANUP_CHUNK_SIZE', default=5000, cast=int)
+
+# Number of drones snapshotted per INSERT by perform_check_drone_battery
+BATTERY_AUDIT_BATCH_SIZE = config('BATTERY_AUDIT_BATCH_SIZE', default=1000, cast=int)
+
+# Number of telemetry readings applied per bulk UPDATE and audit INSERT
+TELEMETRY_BATCH_SIZE = config('TELEMETRY_BATCH_SIZE', default=2000, cast=int)
+
+# Length of a delivery mission. Drones whose battery is forecast to fall below 25% before
+# it ends are not offered for loading
+MISSION_DURATION_MINUTES = config('MISSION_DURATION_MINUTES', default=30, cast=int)
+
+# Battery history, in hours, refresh_battery_forecasts fits discharge rates over
+BATTERY_FORECAST_HISTORY_HOURS = config('BATTERY_FORECAST_HISTORY_HOURS', default=6, cast=int)
+
+# Longest side, in pixels, of stored medication images and of their thumbnails
+MEDICATION_IMAGE_MAX_DIMENSION = config('MEDICATION_IMAGE_MAX_DIMENSION', default=2048, cast=int)
+MEDICATION_THUMBNAIL_SIZE = config('MEDICATION_THUMBNAIL_SIZE', default=128, cast=int)
+
+# Medications picked up per periodic process_medication_images sweep
+MEDICATION_IMAGE_BATCH_SIZE = config('MEDICATION_IMAGE_BATCH_SIZE', default=500, cast=int)
+
 
 CELERY_BEAT_SCHEDULE = {
     'delete-expired-audit-logs': {
@@ -145,6 +261,20 @@ CELERY_BEAT_SCHEDULE = {
             'timezone': 'Africa/Nairobi',
         }
     },
+    'process-medication-images': {
+        'task': 'dispatch.tasks.process_medication_images',
+        'schedule': crontab(minute='*/10'),  # Catch images whose processing was never queued
+        'options': {
+            'timezone': 'Africa/Nairobi',
+        }
+    },
+    'refresh-battery-forecasts': {
+        'task': 'dispatch.tasks.refresh_battery_forecasts',
+        'schedule': crontab(minute='*/15'),  # Refit discharge rates every 15 minutes
+        'options': {
+            'timezone': 'Africa/Nairobi',
+        }
+    },
     'perform-check-drone-battery': {
         'task': 'dispatch.tasks.perform_check_drone_battery',
         'schedule': crontab(minute='*/5'),  # Run every 5 minutes
@@ -15,8 +15,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from dispatch.admin import query_profiles
 
 urlpatterns = [
+    path('admin/query-profiles/', admin.site.admin_view(query_profiles), name='query_profiles'),
     path('admin/', admin.site.urls),
     path('api/', include('dispatch.urls')),
 ]